@@ -0,0 +1,176 @@
+# Overdue, due-soon and awaiting-payment orders.
+#
+# The lists are answered from two partial indexes on orders (see
+# OPEN_ORDER / AWAITING_PAYMENT in back/models.py), which only hold the orders
+# they can ever return, so finished and delivered history costs nothing.
+#
+# scan() records orders that newly qualify into order_alerts (one row per kind
+# and order, never repeated), for building reminder batches. It is
+# incremental: each kind keeps a watermark in alert_scans, and a pass reads
+#
+#   overdue           orders that fell due since the last pass,
+#   due_soon          the ALERT_DUE_SOON_DAYS window ahead (a short range),
+#   awaiting_payment  orders finished (updated) since the last pass,
+#
+# all through the partial indexes. Run it from the job queue:
+#
+#   flask --app back.app scan-order-alerts --schedule
+from datetime import datetime, time, timedelta
+
+import click
+from sqlalchemy import literal, select, text, update
+
+from back.app import app, db
+from back.dates import ist_today
+from back.schema import insert_ignore
+from back.jobs import enqueue, job_handler
+from back.models import AWAITING_PAYMENT, OPEN_ORDER, AlertScan, Bill, Order, OrderAlert
+
+KINDS = ('overdue', 'due_soon', 'awaiting_payment')
+
+# Orders updated just before a pass may commit just after it
+SCAN_OVERLAP = timedelta(minutes=5)
+
+
+def overdue_query(today):
+    return select(Order).where(text(OPEN_ORDER), Order.due_date < today).order_by(Order.due_date, Order.id)
+
+
+def due_soon_query(today, days):
+    return select(Order).where(text(OPEN_ORDER), Order.due_date >= today, Order.due_date <= today + timedelta(days=days))\
+        .order_by(Order.due_date, Order.id)
+
+
+def awaiting_payment_query():
+    return select(Order).where(text(AWAITING_PAYMENT)).order_by(Order.updated_at.desc(), Order.id)
+
+
+def order_rows(session, orders, today):
+    """Orders shaped for the lists, with the customer from their bill."""
+    bills = {bill.id: bill for bill in session.execute(
+        select(Bill).where(Bill.id.in_({order.bill_id for order in orders}))
+    ).scalars()} if orders else {}
+    rows = []
+    for order in orders:
+        bill = bills.get(order.bill_id)
+        rows.append({
+            'id': order.id,
+            'bill_id': order.bill_id,
+            'billnumberinput2': order.billnumberinput2,
+            'garment_type': order.garment_type,
+            'status': order.status,
+            'payment_status': order.payment_status,
+            'due_date': order.due_date.isoformat(),
+            'days_overdue': max((today - order.due_date).days, 0),
+            'total_amt': order.total_amt,
+            'payment_amount': order.payment_amount,
+            'customer_name': bill.customer_name if bill else None,
+            'customer_mobile': bill.mobile_number if bill else None,
+        })
+    return rows
+
+
+def watermark(session, kind):
+    scan = session.get(AlertScan, kind)
+    return scan.watermark if scan else None
+
+
+def set_watermark(session, kind, value):
+    scan = session.get(AlertScan, kind)
+    if scan is None:
+        session.add(AlertScan(kind=kind, watermark=value))
+    else:
+        scan.watermark = value
+
+
+def record(session, kind, candidates, now):
+    """Insert alerts for candidate orders that don't have one yet. Returns rows added."""
+    query = candidates.with_only_columns(literal(kind), Order.id, literal(now)).order_by(None)
+    return session.execute(
+        insert_ignore(OrderAlert.__table__).from_select(['kind', 'order_id', 'detected_at'], query)
+    ).rowcount or 0
+
+
+def scan(session):
+    """One incremental pass over all kinds, in one transaction. Returns {kind: new alerts}."""
+    now = datetime.utcnow()
+    today = ist_today()
+    added = {}
+
+    since = watermark(session, 'overdue')
+    query = overdue_query(today)
+    if since is not None:
+        query = query.where(Order.due_date >= since.date())
+    added['overdue'] = record(session, 'overdue', query, now)
+    set_watermark(session, 'overdue', datetime.combine(today, time.min))
+
+    added['due_soon'] = record(session, 'due_soon', due_soon_query(today, app.config['ALERT_DUE_SOON_DAYS']), now)
+    set_watermark(session, 'due_soon', datetime.combine(today, time.min))
+
+    since = watermark(session, 'awaiting_payment')
+    query = awaiting_payment_query()
+    if since is not None:
+        query = query.where(Order.updated_at >= since - SCAN_OVERLAP)
+    added['awaiting_payment'] = record(session, 'awaiting_payment', query, now)
+    set_watermark(session, 'awaiting_payment', now)
+
+    session.commit()
+    return added
+
+
+def pending_alerts(session, kind=None, limit=500):
+    """Alerts not yet notified whose order still qualifies, oldest first."""
+    query = select(OrderAlert).where(OrderAlert.notified_at.is_(None)).order_by(OrderAlert.id).limit(limit)
+    if kind:
+        query = query.where(OrderAlert.kind == kind)
+    alerts = session.execute(query).scalars().all()
+    if not alerts:
+        return []
+
+    today = ist_today()
+    ids = [alert.order_id for alert in alerts]
+    still = {
+        'overdue': set(session.execute(overdue_query(today).with_only_columns(Order.id).where(Order.id.in_(ids))).scalars()),
+        'due_soon': set(session.execute(due_soon_query(today, app.config['ALERT_DUE_SOON_DAYS'])
+                                        .with_only_columns(Order.id).where(Order.id.in_(ids))).scalars()),
+        'awaiting_payment': set(session.execute(awaiting_payment_query().with_only_columns(Order.id)
+                                                .where(Order.id.in_(ids))).scalars()),
+    }
+    orders = {order.id: order for order in session.execute(select(Order).where(Order.id.in_(ids))).scalars()}
+    rows = {row['id']: row for row in order_rows(session, list(orders.values()), today)}
+    return [{**alert.as_dict(), 'order': rows[alert.order_id]}
+            for alert in alerts if alert.order_id in still[alert.kind]]
+
+
+def mark_notified(session, alert_ids):
+    count = session.execute(
+        update(OrderAlert).where(OrderAlert.id.in_(alert_ids), OrderAlert.notified_at.is_(None))
+        .values(notified_at=datetime.utcnow())
+    ).rowcount
+    session.commit()
+    return count
+
+
+def schedule_next(delay=None):
+    delay = app.config['ALERT_SCAN_INTERVAL'] if delay is None else delay
+    slot = int((datetime.utcnow() + timedelta(seconds=delay)).timestamp() // app.config['ALERT_SCAN_INTERVAL'])
+    enqueue('orders.alerts', {}, delay=delay, unique_key=f'orders.alerts:{slot}')
+
+
+@job_handler('orders.alerts')
+def run_alert_scan_job(payloads):
+    scan(db.session)
+    # Schedule the next pass (one job per interval at most)
+    schedule_next()
+    db.session.commit()
+
+
+@app.cli.command('scan-order-alerts')
+@click.option('--schedule', is_flag=True, help='Also schedule a background pass every ALERT_SCAN_INTERVAL.')
+def scan_order_alerts_command(schedule):
+    """Record orders that became overdue, due soon or awaiting payment."""
+    for kind, count in scan(db.session).items():
+        click.echo(f'{kind}: {count} new')
+    if schedule:
+        schedule_next(delay=0)
+        db.session.commit()
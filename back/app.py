@@ -1,12 +1,113 @@
-from flask import Flask
+import os
+
+from flask import Flask, g
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
+
+from back.tenancy import TenantSQLAlchemy
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})  # Adjust the origins as needed
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///tms.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///tms.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+# Optional override for the async (ASGI) mode, e.g. postgresql+asyncpg://...
+app.config['ASYNC_DATABASE_URI'] = os.environ.get('ASYNC_DATABASE_URL')
+# Seconds a request waits on an identical in-flight report before giving up
+app.config['SINGLE_FLIGHT_TIMEOUT'] = 30
+# Background jobs (back/jobs.py)
+app.config['JOB_MAX_ATTEMPTS'] = 5
+app.config['JOB_RETRY_BASE_SECONDS'] = 5
+app.config['JOB_RETRY_MAX_SECONDS'] = 600
+app.config['JOB_LOCK_TIMEOUT'] = 300
+app.config['JOB_POLL_INTERVAL'] = 1.0
+app.config['JOBS_IN_PROCESS'] = os.environ.get('JOBS_IN_PROCESS') == '1'
+# WhatsApp Cloud API, e.g. https://graph.facebook.com/v18.0/<PHONE_NUMBER_ID>/messages
+app.config['WHATSAPP_API_URL'] = os.environ.get('WHATSAPP_API_URL')
+app.config['WHATSAPP_TOKEN'] = os.environ.get('WHATSAPP_TOKEN')
+app.config['WHATSAPP_TIMEOUT'] = 10
+app.config['WHATSAPP_NOTIFY_NEW_BILL'] = os.environ.get('WHATSAPP_NOTIFY_NEW_BILL') == '1'
+# Server-side PDF rendering (route20.py)
+app.config['RENDER_CACHE_DIR'] = os.environ.get('RENDER_CACHE_DIR', os.path.join(app.instance_path, 'render-cache'))
+app.config['RENDER_PROCESSES'] = int(os.environ.get('RENDER_PROCESSES', os.cpu_count() or 2))
+# Content-addressed image assets (assets.py, route21.py)
+app.config['ASSET_DIR'] = os.environ.get('ASSET_DIR', os.path.join(app.instance_path, 'assets'))
+app.config['ASSET_MAX_BYTES'] = 10 * 1024 * 1024  # uploads (admin only)
+app.config['ASSET_MAX_PIXELS'] = 40_000_000
+app.config['BUNDLED_ASSETS'] = {'suit': os.path.join(os.path.dirname(app.root_path), 'suitpic.jpg')}
+# Order archival (archive.py)
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+app.config['ARCHIVE_BATCH_SIZE'] = 500
+# Order alerts (alerts.py): the due-soon window and how often the scan job runs
+app.config['ALERT_DUE_SOON_DAYS'] = int(os.environ.get('ALERT_DUE_SOON_DAYS', 2))
+app.config['ALERT_SCAN_INTERVAL'] = int(os.environ.get('ALERT_SCAN_INTERVAL', 3600))  # seconds
+# Bill numbers (billnumbers.py): first number for an empty database, numbers
+# this process reserves per round trip, and the largest block a device may lease
+app.config['BILL_NUMBER_START'] = 1000
+app.config['BILL_NUMBER_BLOCK_SIZE'] = 50
+app.config['BILL_NUMBER_MAX_LEASE'] = 500
+# Group commit for status/payment toggles (groupcommit.py): off by default
+app.config['GROUP_COMMIT'] = os.environ.get('GROUP_COMMIT') == '1'
+app.config['GROUP_COMMIT_WINDOW_MS'] = int(os.environ.get('GROUP_COMMIT_WINDOW_MS', 5))
+app.config['GROUP_COMMIT_MAX_BATCH'] = 50
+# Read-only engine for heavy reports (reports.py): off, wal, snapshot or replica
+app.config['REPORT_DATABASE_MODE'] = os.environ.get('REPORT_DATABASE_MODE', 'off')
+app.config['REPORT_DATABASE_URI'] = os.environ.get('REPORT_DATABASE_URL')
+app.config['REPORT_MAX_STALENESS'] = int(os.environ.get('REPORT_MAX_STALENESS', 60))  # seconds
+app.config['REPORT_SNAPSHOT_PATH'] = os.path.join(app.instance_path, 'report-snapshot.db')
+# Online backups (backups.py): page steps with a pause in between, and rotation
+app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR', os.path.join(app.instance_path, 'backups'))
+app.config['BACKUP_PAGES_PER_STEP'] = 256
+app.config['BACKUP_STEP_SLEEP_MS'] = 10
+app.config['BACKUP_MAX_RESTARTS'] = 5
+app.config['BACKUP_KEEP_RECENT'] = int(os.environ.get('BACKUP_KEEP_RECENT', 10))
+app.config['BACKUP_KEEP_DAILY'] = int(os.environ.get('BACKUP_KEEP_DAILY', 14))
+app.config['BACKUP_INTERVAL'] = 24 * 3600
+# Database upkeep (maintenance.py): incremental vacuum steps, the nightly job and
+# the slow query log (SLOW_QUERY_MS=0 turns it off)
+app.config['VACUUM_PAGES_PER_STEP'] = 500
+app.config['VACUUM_STEP_SLEEP_MS'] = 20
+app.config['MAINTENANCE_INTERVAL'] = 24 * 3600
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', 200))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG', os.path.join(app.instance_path, 'slow-queries.log'))
+app.config['SLOW_QUERY_LOG_MAX_BYTES'] = 5 * 1024 * 1024
+# Consistency audit (audit.py): id range per chunk, worker processes, rows per repair transaction
+app.config['AUDIT_CHUNK_SIZE'] = 5000
+app.config['AUDIT_PROCESSES'] = int(os.environ.get('AUDIT_PROCESSES', os.cpu_count() or 2))
+app.config['AUDIT_REPAIR_BATCH'] = 500
+# Idempotency-Key replays (idempotency.py): how long responses are kept, when an
+# unfinished first attempt counts as abandoned, and how long a retry waits for it
+app.config['IDEMPOTENCY_TTL'] = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+app.config['IDEMPOTENCY_LOCK_TIMEOUT'] = 120
+app.config['IDEMPOTENCY_WAIT'] = 15
+app.config['IDEMPOTENCY_POLL_INTERVAL'] = 0.05
+app.config['IDEMPOTENCY_PURGE_INTERVAL'] = 3600
+# Maintenance endpoints (auth.py) are disabled unless ADMIN_TOKEN is set
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+# Request profiling (profiler.py): PROFILE_SLOW_MS > 0 keeps a profile of every slower request
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+app.config['PROFILE_SLOW_MS'] = int(os.environ.get('PROFILE_SLOW_MS', 0))
+app.config['PROFILE_INTERVAL_MS'] = 5
+app.config['PROFILE_KEEP'] = 200
+app.config['REPORT_ENDPOINTS'] = set(filter(None, os.environ.get(
+    'REPORT_ENDPOINTS', 'get_orders,worker_weekly_pay,get_worker_weekly_pay,calculate_profit,get_calendar').split(',')))
+# Legacy text enum columns at startup (enums.py): fail (refuse to start), migrate or off
+app.config['ENUM_STARTUP_CHECK'] = os.environ.get('ENUM_STARTUP_CHECK', 'fail')
+# Reporting calendar (dates.py): the shop's UTC offset (IST) and the range of calendar_days
+app.config['TIMEZONE_OFFSET_MINUTES'] = int(os.environ.get('TIMEZONE_OFFSET_MINUTES', 330))
+app.config['CALENDAR_START'] = os.environ.get('CALENDAR_START', '2000-01-01')
+app.config['CALENDAR_YEARS_AHEAD'] = 10
+# Shop opening hours (IST); scheduled backups and maintenance wait until closing
+app.config['BUSINESS_HOURS'] = os.environ.get('BUSINESS_HOURS', '9-21')
+# Shops (tenancy.py): SHOPS lists the branches with their own database, created
+# from SHOP_DATABASE_URI (a SQLite file each, or e.g. a Postgres schema via
+# ...?options=-csearch_path%3D{shop}); SQLALCHEMY_DATABASE_URI is SHOP_DEFAULT
+app.config['SHOPS'] = set(filter(None, os.environ.get('SHOPS', '').split(',')))
+app.config['SHOP_DEFAULT'] = os.environ.get('SHOP_DEFAULT', 'main')
+app.config['SHOP_DATABASE_URI'] = os.environ.get(
+    'SHOP_DATABASE_URL', 'sqlite:///' + os.path.join(app.instance_path, 'shops', '{shop}.db'))
+app.config['SHOP_DOMAIN'] = os.environ.get('SHOP_DOMAIN')  # e.g. tms.example.com for <shop>.tms.example.com
+app.config['SHOP_ENGINE_POOL_SIZE'] = int(os.environ.get('SHOP_ENGINE_POOL_SIZE', 8))
+app.config['SHOP_IDLE_SECONDS'] = 600
+db = TenantSQLAlchemy(app)
 
 from back.route1 import *
 from back.route2 import *
@@ -27,6 +128,59 @@ from back.route16 import *
 from back.route17 import *
 from back.route18 import *
 from back.route19 import *
+from back.route20 import *
+from back.route21 import *
+from back.route22 import *
+from back.route23 import *
+from back.route24 import *
+from back.route25 import *
+from back.route26 import *
+from back.route27 import *
+from back.route28 import *
+from back.route29 import *
+from back.route30 import *
+
+import back.notifications  # registers job handlers
+import back.importer  # registers the import-data command
+import back.replicate  # registers the replicate command
+import back.archive  # registers the archive job and command
+import back.alerts  # registers the order alert scan job and command
+import back.idempotency  # registers the idempotency key purge job and command
+import back.backups  # registers the backup job and commands
+from back.maintenance import use_incremental_vacuum  # also registers the tms-admin commands
+import back.audit  # registers tms-admin audit
+import back.profiler  # registers the request profiling hooks
+from back.enums import ensure_coded_enums, seed_enum_values  # also registers the migrate-enums command
+from back.schema import add_missing_columns
+from back.statements import backfill as backfill_worker_statements  # also registers rebuild-worker-statements
+from back.customers import backfill as backfill_customer_summaries  # also registers rebuild-customer-summaries
+from back.dates import ensure_calendar
+
+def prepare_database():
+    # Tables, upgrades and seed data for the current shop's database
+    use_incremental_vacuum(db.engine)
+    db.create_all()
+    add_missing_columns(db.engine, db.metadata)
+    ensure_coded_enums()
+    seed_enum_values()
+    backfill_worker_statements(db.session)
+    backfill_customer_summaries(db.session)
+    ensure_calendar(db.session)
+
+def prepare_shop(shop):
+    # First use of a shop in this process
+    with app.app_context():
+        g.shop = shop
+        prepare_database()
+
+db.shops.on_create = prepare_shop
+
+with app.app_context():
+    prepare_database()
+
+if app.config['JOBS_IN_PROCESS']:
+    from back.jobs import JobWorker
+    JobWorker(threads=1).start()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,130 @@
+# Hot/cold archival of completed orders.
+#
+# Delivered-and-paid orders older than ARCHIVE_AFTER_DAYS move, with their
+# worker links, into orders_archive / order_worker_association_archive in small
+# batches, keeping the working tables (and every full scan over them) small.
+# History reads union the archive back in only when the requested range
+# reaches back far enough to need it.
+#
+#   flask --app back.app archive-orders --days 180
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import and_, delete, func, insert, select
+
+from back.app import app, db
+from back.jobs import enqueue, job_handler
+from back.models import Order, order_worker_association, order_worker_association_archive, orders_archive
+
+ARCHIVABLE_STATUSES = ('delivered', 'completed')
+
+ORDER_COLUMNS = [column.name for column in Order.__table__.columns]
+
+
+def archivable(cutoff):
+    return and_(
+        Order.status.in_(ARCHIVABLE_STATUSES),
+        Order.payment_status == 'paid',
+        Order.order_date < cutoff,
+    )
+
+
+def archive_batch(cutoff, batch_size):
+    """Move one batch in its own short transaction. Returns rows moved."""
+    ids = [order_id for (order_id,) in db.session.execute(
+        select(Order.id).where(archivable(cutoff)).order_by(Order.id).limit(batch_size)
+    )]
+    if not ids:
+        return 0
+
+    db.session.execute(insert(orders_archive).from_select(
+        ORDER_COLUMNS,
+        select(*[Order.__table__.c[name] for name in ORDER_COLUMNS]).where(Order.id.in_(ids)),
+    ))
+    db.session.execute(insert(order_worker_association_archive).from_select(
+        ['order_id', 'worker_id'],
+        select(order_worker_association.c.order_id, order_worker_association.c.worker_id)
+        .where(order_worker_association.c.order_id.in_(ids)),
+    ))
+    db.session.execute(delete(order_worker_association).where(order_worker_association.c.order_id.in_(ids)))
+    db.session.execute(delete(Order).where(Order.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+
+def archive_completed_orders(days=None, batch_size=None, max_batches=None):
+    days = app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.now().date() - timedelta(days=days)
+
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            break
+        moved += count
+        batches += 1
+    return moved
+
+
+def archive_horizon(session):
+    """Newest order_date in the archive (None when empty); an indexed max()."""
+    return session.execute(select(func.max(orders_archive.c.order_date))).scalar()
+
+
+def archive_needed(session, since=None):
+    horizon = archive_horizon(session)
+    return horizon is not None and (since is None or since <= horizon)
+
+
+def archived_order_dicts(session, bill_ids):
+    """Archived orders of these bills, shaped like Order.as_dict()."""
+    rows = session.execute(select(orders_archive).where(orders_archive.c.bill_id.in_(bill_ids))).all()
+    if not rows:
+        return []
+
+    worker_ids = {}
+    for order_id, worker_id in session.execute(
+        select(order_worker_association_archive.c.order_id, order_worker_association_archive.c.worker_id)
+        .where(order_worker_association_archive.c.order_id.in_([row.id for row in rows]))
+    ):
+        worker_ids.setdefault(order_id, []).append(worker_id)
+
+    return [{
+        'id': row.id,
+        'garment_type': row.garment_type,
+        'status': row.status,
+        'order_date': row.order_date.isoformat() if row.order_date else None,
+        'due_date': row.due_date.isoformat() if row.due_date else None,
+        'total_amt': row.total_amt,
+        'payment_mode': row.payment_mode,
+        'payment_status': row.payment_status,
+        'payment_amount': row.payment_amount,
+        'Work_pay': row.Work_pay,
+        'billnumberinput2': row.billnumberinput2,
+        'bill_id': row.bill_id,
+        'worker_ids': worker_ids.get(row.id, []),
+    } for row in rows]
+
+
+@job_handler('orders.archive')
+def run_archive_job(payloads):
+    archive_completed_orders()
+    # Schedule tomorrow's pass (one job per day at most)
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    enqueue('orders.archive', {}, delay=24 * 3600, unique_key=f'orders.archive:{tomorrow.isoformat()}')
+    db.session.commit()
+
+
+@app.cli.command('archive-orders')
+@click.option('--days', type=int, help='Archive orders older than this (default ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, help='Orders moved per transaction.')
+@click.option('--schedule', is_flag=True, help='Also schedule a daily background pass.')
+def archive_orders_command(days, batch_size, schedule):
+    """Move delivered and paid orders into the archive tables."""
+    moved = archive_completed_orders(days, batch_size)
+    click.echo(f'Archived {moved} orders')
+    if schedule:
+        enqueue('orders.archive', {}, unique_key=f'orders.archive:{datetime.now().date().isoformat()}')
+        db.session.commit()
@@ -0,0 +1,138 @@
+# Optional async serving mode.
+#
+# Run with:  uvicorn back.asgi:asgi_app --workers 1
+#
+# The heavy read endpoints below are served by async handlers backed by an
+# async SQLAlchemy engine (aiosqlite / asyncpg), so a slow report no longer
+# ties up a worker thread. Every other route is passed through to the regular
+# Flask app, which keeps working unchanged under `python app.py`.
+#
+# The async engine only reaches the default shop's database. Requests for any
+# other shop (X-Shop header or <shop>.SHOP_DOMAIN, see route27.py) go to the
+# Flask app for every path, which opens that shop's database or answers 404.
+import contextlib
+from datetime import datetime
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+from back.app import app, db
+from back.route2 import load_customer_info
+from back.route3 import load_orders_by_due_date
+from back.route12 import load_worker_weekly_pay
+from back.route18 import load_profit_summary
+from back.route27 import shop_for
+
+# Sync dialect -> async driver used when ASYNC_DATABASE_URI is not set
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_database_url():
+    if app.config.get('ASYNC_DATABASE_URI'):
+        return app.config['ASYNC_DATABASE_URI']
+
+    # Reuse the URL Flask-SQLAlchemy resolved (relative sqlite paths point
+    # into the instance folder) and swap in the async driver.
+    with app.app_context():
+        url = db.engine.url
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver configured for '{url.get_backend_name()}'")
+    return url.set(drivername=driver)
+
+
+async_engine = create_async_engine(async_database_url())
+AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+async def run_report(loader, *args):
+    # The loaders are the same functions the sync routes use; run_sync lets
+    # them keep using the ORM (including lazy loads) on the async connection.
+    async with AsyncSession() as session:
+        return await session.run_sync(loader, *args)
+
+
+async def get_orders(request):
+    try:
+        grouped_orders = await run_report(load_orders_by_due_date)
+        return JSONResponse(grouped_orders, status_code=200)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def worker_weekly_pay(request):
+    try:
+        since = request.query_params.get('from')
+        since = datetime.strptime(since, '%Y-%m-%d').date() if since else None
+        result = await run_report(load_worker_weekly_pay, since)
+        return JSONResponse(result, status_code=200)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def calculate_profit(request):
+    try:
+        date_filter = request.query_params.get('date')
+        summary = await run_report(load_profit_summary, date_filter)
+        return JSONResponse(summary, status_code=200)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def get_customer_info(request):
+    try:
+        customer_info, status_code = await run_report(load_customer_info, request.path_params['mobile_number'])
+        return JSONResponse(customer_info, status_code=status_code)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+class ShopDispatch:
+    """Sends requests for a shop other than the default one straight to Flask."""
+
+    def __init__(self, app, flask_app):
+        self.app = app
+        self.flask_app = flask_app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            headers = Headers(scope=scope)
+            shop = shop_for(headers.get('x-shop'), headers.get('host'))
+            if shop is not None and shop != app.config['SHOP_DEFAULT']:
+                await self.flask_app(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_engine.dispose()
+
+
+flask_app = WSGIMiddleware(app)
+
+asgi_app = Starlette(
+    routes=[
+        Route('/api/orders', get_orders, methods=['GET']),
+        Route('/api/worker-weekly-pay', worker_weekly_pay, methods=['GET']),
+        Route('/api/calculate-profit', calculate_profit, methods=['GET']),
+        # PUT falls through to the Flask route via the mount below
+        Route('/api/customer-info/{mobile_number}', get_customer_info, methods=['GET']),
+        Mount('/', app=flask_app),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(ShopDispatch, flask_app=flask_app),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,108 @@
+# Content-addressed image store for bill artwork.
+#
+# Every stored file is named by the SHA-256 of its bytes, so a URL never changes
+# meaning and can be cached forever. Resized variants are produced once, when an
+# asset is first registered or uploaded, and recorded in manifest.json.
+import hashlib
+import io
+import json
+import os
+import threading
+
+from PIL import Image
+
+from back.app import app
+
+# variant -> (max width, max height, dpi)
+VARIANTS = {
+    'thumb': (128, 128, 72),
+    # Enough for the ~20 x 26 mm illustration on a printed bill at 300 DPI
+    'print': (300, 400, 300),
+}
+
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png'}
+
+_lock = threading.Lock()
+_manifest = None
+
+
+def asset_dir():
+    return app.config['ASSET_DIR']
+
+
+def asset_path(filename):
+    return os.path.join(asset_dir(), filename)
+
+
+def store_bytes(data, ext):
+    digest = hashlib.sha256(data).hexdigest()
+    path = asset_path(f'{digest}.{ext}')
+    if not os.path.exists(path):
+        os.makedirs(asset_dir(), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return {
+        'hash': digest,
+        'url': f'/api/assets/{digest}.{ext}',
+        'content_type': CONTENT_TYPES[ext],
+        'size': len(data),
+    }
+
+
+def make_variant(data, max_width, max_height, dpi):
+    image = Image.open(io.BytesIO(data))
+    image = image.convert('RGB')
+    image.thumbnail((max_width, max_height), Image.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=88, optimize=True, dpi=(dpi, dpi))
+    return out.getvalue()
+
+
+def register(name, data):
+    """Store an image and its variants under a logical name."""
+    ext = 'png' if data[:8] == b'\x89PNG\r\n\x1a\n' else 'jpg'
+    entry = store_bytes(data, ext)
+    entry['variants'] = {
+        variant: store_bytes(make_variant(data, *spec), 'jpg')
+        for variant, spec in VARIANTS.items()
+    }
+
+    with _lock:
+        manifest = load_manifest()
+        manifest[name] = entry
+        tmp_path = asset_path('manifest.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, asset_path('manifest.json'))
+    return entry
+
+
+def load_manifest():
+    global _manifest
+    if _manifest is None:
+        os.makedirs(asset_dir(), exist_ok=True)
+        try:
+            with open(asset_path('manifest.json')) as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+    return _manifest
+
+
+def get_asset(name, variant=None):
+    """Manifest entry for `name`, registering the bundled source on first use."""
+    manifest = load_manifest()
+    if name not in manifest:
+        source = app.config['BUNDLED_ASSETS'].get(name)
+        if source is None:
+            return None
+        with open(source, 'rb') as f:
+            register(name, f.read())
+    entry = manifest[name]
+    return entry['variants'][variant] if variant else entry
+
+
+def file_for(entry):
+    return asset_path(entry['url'].rsplit('/', 1)[-1])
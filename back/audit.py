@@ -0,0 +1,161 @@
+# Consistency audit of the totals stored in more than one place.
+#
+#   bill_total_qty       Bill.total_qty vs the bill's orders
+#   order_bill_amounts   total_amt / payment_amount copied by new_bill onto
+#                        every order (and edited per order by route3/route19)
+#   order_work_pay       Order.Work_pay vs the assigned workers' rates
+#   daily_total_pay      Daily_Expenses.Total_Pay vs its costs + worker payouts
+#
+# Each check's table is split into AUDIT_CHUNK_SIZE id ranges, and the ranges
+# are checked in AUDIT_PROCESSES worker processes (audit_checks.py, read-only,
+# one connection each). With --repair the mismatches are written back in
+# batches of AUDIT_REPAIR_BATCH rows, one transaction per batch; each UPDATE
+# only applies if the row still holds the value the audit saw, so a write that
+# landed in between is left alone. Repaired Work_pay also updates the workers'
+# statements. order_bill_amounts only repairs the bills row: an order's own
+# amount may have been lowered on purpose, so those mismatches are reported
+# for someone to look at, never overwritten.
+#
+#   flask --app back.app tms-admin audit [--check order_work_pay] [--repair]
+import multiprocessing
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+from sqlalchemy import and_, bindparam, func, select, update
+
+from back.app import app, db
+from back.audit_checks import CHECKS, run_chunk
+from back.enums import GARMENT, PAYMENT_STATUS
+from back.maintenance import admin
+from back.models import Order
+from back.statements import record_order
+from back.tenancy import use_shop
+
+
+def codes():
+    # Coded enum values the checks compare against (see enums.py)
+    return {
+        'Suit': GARMENT.encode('Suit'),
+        'Jacket': GARMENT.encode('Jacket'),
+        'Sadri': GARMENT.encode('Sadri'),
+        'payment_cancelled': PAYMENT_STATUS.encode('cancelled'),
+    }
+
+
+# check -> tables whose mismatches --repair may write back (default: all)
+REPAIR_TABLES = {
+    'order_bill_amounts': {'bills'},
+}
+
+
+def repairable(mismatches):
+    """Split {check: [mismatch]} into (rows --repair writes, rows only reported)."""
+    fix, report = [], []
+    for check, rows in mismatches.items():
+        tables = REPAIR_TABLES.get(check)
+        for row in rows:
+            (fix if tables is None or row['table'] in tables else report).append(row)
+    return fix, report
+
+
+def partitions(session, table_name, chunk_size):
+    """[lo, hi) id ranges covering the table."""
+    table = db.metadata.tables[table_name]
+    lo, hi = session.execute(select(func.min(table.c.id), func.max(table.c.id))).one()
+    if lo is None:
+        return []
+    return [(start, min(start + chunk_size, hi + 1)) for start in range(lo, hi + 1, chunk_size)]
+
+
+def audit(session, checks=None, processes=None, chunk_size=None):
+    """Run the checks. Returns ({check: [mismatch dicts]}, number of chunks)."""
+    checks = checks or list(CHECKS)
+    processes = processes or app.config['AUDIT_PROCESSES']
+    chunk_size = chunk_size or app.config['AUDIT_CHUNK_SIZE']
+    url = session.get_bind().url.render_as_string(hide_password=False)
+    tasks = [(url, check, lo, hi, codes())
+             for check in checks for lo, hi in partitions(session, CHECKS[check][1], chunk_size)]
+    # Workers read their own snapshot; don't keep a transaction open meanwhile
+    session.rollback()
+
+    if processes <= 1 or len(tasks) <= 1:
+        results = [run_chunk(*task) for task in tasks]
+    else:
+        # spawn: worker processes only import back.audit_checks, never the app
+        with ProcessPoolExecutor(max_workers=min(processes, len(tasks)),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = [future.result() for future in as_completed([pool.submit(run_chunk, *task) for task in tasks])]
+
+    mismatches = {check: [] for check in checks}
+    for check, lo, hi, rows in sorted(results, key=lambda result: (result[0], result[1])):
+        mismatches[check].extend({'table': table, 'id': row_id, 'column': column,
+                                  'current': current, 'expected': expected}
+                                 for table, row_id, column, current, expected in rows)
+    return mismatches, len(tasks)
+
+
+def repair(session, mismatches, batch_size=None):
+    """Write the expected values back. Returns (rows fixed, rows changed meanwhile and skipped)."""
+    batch_size = batch_size or app.config['AUDIT_REPAIR_BATCH']
+    groups = defaultdict(list)
+    for row in mismatches:
+        groups[(row['table'], row['column'], row['current'] is None)].append(row)
+
+    fixed = skipped = 0
+    for (table_name, column_name, was_null), rows in sorted(groups.items()):
+        table = db.metadata.tables[table_name]
+        column = table.c[column_name]
+        statement = update(table).where(and_(
+            table.c.id == bindparam('row_id'),
+            column.is_(None) if was_null else column == bindparam('current'),
+        )).values({column_name: bindparam('expected')})
+        if 'version' in table.c:
+            # Clients holding the old version must re-read (versioning.py)
+            statement = statement.values(version=table.c.version + 1)
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = [{'row_id': row['id'], 'current': row['current'], 'expected': row['expected']} for row in batch]
+            if session.get_bind().dialect.supports_sane_multi_rowcount:
+                updated = session.execute(statement, params).rowcount
+            else:
+                updated = sum(session.execute(statement, p).rowcount for p in params)
+            if table_name == 'orders' and column_name == 'Work_pay':
+                # Worker statements follow Work_pay (statements.py)
+                for order in session.execute(select(Order).where(Order.id.in_([row['id'] for row in batch]))).scalars():
+                    record_order(session, order)
+            session.commit()
+            fixed += updated
+            skipped += len(batch) - updated
+    return fixed, skipped
+
+
+@admin.command('audit')
+@click.option('--check', 'checks', type=click.Choice(list(CHECKS)), multiple=True,
+              help='Only these checks (repeatable).')
+@click.option('--repair', 'fix', is_flag=True, help='Write the expected values back.')
+@click.option('--processes', type=int, help='Worker processes (default AUDIT_PROCESSES).')
+@click.option('--chunk-size', type=int, help='Ids per chunk (default AUDIT_CHUNK_SIZE).')
+@click.option('--shop', help='Audit this shop instead of the default one.')
+@click.option('--show', default=10, show_default=True, help='Mismatches to print per check.')
+def audit_command(checks, fix, processes, chunk_size, shop, show):
+    """Find (and optionally repair) totals that drifted from the rows they duplicate."""
+    with use_shop(db, shop or app.config['SHOP_DEFAULT']):
+        started = time.perf_counter()
+        mismatches, chunks = audit(db.session, list(checks) or None, processes, chunk_size)
+        click.echo(f'{chunks} chunks checked in {time.perf_counter() - started:.2f} s')
+        for check, rows in mismatches.items():
+            click.echo(f'{check}: {len(rows)} mismatch(es)')
+            for row in rows[:show]:
+                click.echo(f"    {row['table']} {row['id']} {row['column']}: {row['current']} -> {row['expected']}")
+        if fix:
+            rows, report = repairable(mismatches)
+            fixed, skipped = repair(db.session, rows)
+            click.echo(f'Repaired {fixed} row(s); {skipped} changed since the audit and were left alone')
+            if report:
+                click.echo(f'{len(report)} order amount(s) differ from their bill and need checking by hand')
+                raise SystemExit(1)
+        elif any(mismatches.values()):
+            raise SystemExit(1)
@@ -0,0 +1,139 @@
+# Consistency checks over one id range.
+#
+# Plain functions over a database URL (no Flask, no models) so they can run in
+# worker processes; see audit.py for partitioning, the pool and repairs. Each
+# check reads one range of its table's ids and returns the rows whose stored
+# value disagrees with the value recomputed from the rows it duplicates, as
+# (table, id, column, current, expected).
+from sqlalchemy import bindparam, create_engine, text
+
+# Money and pay are compared to the paisa
+TOLERANCE = 0.005
+
+_engines = {}
+
+
+def engine_for(url):
+    # One engine per worker process
+    if url not in _engines:
+        _engines[url] = create_engine(url)
+    return _engines[url]
+
+
+def differs(current, expected):
+    return current is None or abs(current - expected) > TOLERANCE
+
+
+def bill_total_qty(conn, lo, hi, codes):
+    """Bill.total_qty against the number of its orders (live and archived)."""
+    counts = {}
+    for table in ('orders', 'orders_archive'):
+        for bill_id, count in conn.execute(text(
+            f'SELECT bill_id, count(*) FROM {table} WHERE bill_id >= :lo AND bill_id < :hi GROUP BY bill_id'
+        ), {'lo': lo, 'hi': hi}):
+            counts[bill_id] = counts.get(bill_id, 0) + count
+    return [('bills', bill_id, 'total_qty', total_qty, counts.get(bill_id, 0))
+            for bill_id, total_qty in conn.execute(text(
+                'SELECT id, total_qty FROM bills WHERE id >= :lo AND id < :hi'), {'lo': lo, 'hi': hi})
+            if (total_qty or 0) != counts.get(bill_id, 0)]
+
+
+def order_bill_amounts(conn, lo, hi, codes):
+    """total_amt / payment_amount copied onto every order of a bill (and the bill itself).
+
+    The expected value is the one customers.bill_figures() counts: the largest
+    among the bill's orders that aren't cancelled.
+    """
+    params = {'lo': lo, 'hi': hi}
+    orders = {}
+    for table in ('orders', 'orders_archive'):
+        for order_id, bill_id, total_amt, payment_amount, payment_status in conn.execute(text(
+            f'SELECT id, bill_id, total_amt, payment_amount, payment_status FROM {table} '
+            'WHERE bill_id >= :lo AND bill_id < :hi'
+        ), params):
+            orders.setdefault(bill_id, []).append((table, order_id, total_amt, payment_amount, payment_status))
+
+    mismatches = []
+    for bill_id, total_amt, payment_amount in conn.execute(text(
+        'SELECT id, total_amt, payment_amount FROM bills WHERE id >= :lo AND id < :hi'
+    ), params):
+        bill_orders = orders.get(bill_id)
+        if not bill_orders:
+            continue
+        live = [order for order in bill_orders if order[4] != codes['payment_cancelled']] or bill_orders
+        expected = {'total_amt': max(order[2] or 0.0 for order in live),
+                    'payment_amount': max(order[3] or 0.0 for order in live)}
+        rows = [('bills', bill_id, total_amt, payment_amount)]
+        # Archived orders are history and stay as they are
+        rows += [(table, order_id, order_total, order_paid)
+                 for table, order_id, order_total, order_paid, _ in bill_orders if table == 'orders']
+        for table, row_id, current_total, current_paid in rows:
+            if differs(current_total, expected['total_amt']):
+                mismatches.append((table, row_id, 'total_amt', current_total, expected['total_amt']))
+            if differs(current_paid, expected['payment_amount']):
+                mismatches.append((table, row_id, 'payment_amount', current_paid, expected['payment_amount']))
+    return mismatches
+
+
+def order_work_pay(conn, lo, hi, codes):
+    """Order.Work_pay against the rates of its assigned workers (statements.worker_rate)."""
+    expected = {}
+    current = {}
+    for order_id, work_pay, garment_type, rate, suit, jacket, sadri in conn.execute(text(
+        'SELECT o.id, o."Work_pay", o.garment_type, w."Rate", w."Suit", w."Jacket", w."Sadri" '
+        'FROM orders o JOIN order_worker_association l ON l.order_id = o.id JOIN workers w ON w.id = l.worker_id '
+        'WHERE o.id >= :lo AND o.id < :hi'
+    ), {'lo': lo, 'hi': hi}):
+        worker_rate = (suit if garment_type == codes['Suit'] else
+                       jacket if garment_type == codes['Jacket'] else
+                       sadri if garment_type == codes['Sadri'] else
+                       rate) or 0
+        expected[order_id] = expected.get(order_id, 0.0) + worker_rate
+        current[order_id] = work_pay
+    return [('orders', order_id, 'Work_pay', current[order_id], round(pay, 2))
+            for order_id, pay in expected.items() if differs(current[order_id], pay)]
+
+
+def daily_total_pay(conn, lo, hi, codes):
+    """Daily_Expenses.Total_Pay against its costs plus that day's worker payouts.
+
+    add_worker_expense adds the payouts to the first row of the day only.
+    """
+    days = conn.execute(text(
+        'SELECT id, "Date", material_cost, "miscellaneous_Cost", chai_pani_cost, "Total_Pay" '
+        'FROM "Daily_Expenses" WHERE id >= :lo AND id < :hi'
+    ), {'lo': lo, 'hi': hi}).all()
+    if not days:
+        return []
+    dates = sorted({day[1] for day in days})
+    first = dict(conn.execute(text(
+        'SELECT "Date", min(id) FROM "Daily_Expenses" WHERE "Date" IN :dates GROUP BY "Date"'
+    ).bindparams(bindparam('dates', expanding=True)), {'dates': dates}).all())
+    payouts = dict(conn.execute(text(
+        'SELECT date, sum("Amt_Paid") FROM "Worker_Expense" WHERE date IN :dates GROUP BY date'
+    ).bindparams(bindparam('dates', expanding=True)), {'dates': dates}).all())
+
+    mismatches = []
+    for expense_id, day, material, miscellaneous, chai_pani, total_pay in days:
+        expected = (material or 0) + (miscellaneous or 0) + (chai_pani or 0)
+        if first.get(day) == expense_id:
+            expected += payouts.get(day) or 0
+        if differs(total_pay, expected):
+            mismatches.append(('Daily_Expenses', expense_id, 'Total_Pay', total_pay, round(expected, 2)))
+    return mismatches
+
+
+# check -> (function, table whose ids are partitioned)
+CHECKS = {
+    'bill_total_qty': (bill_total_qty, 'bills'),
+    'order_bill_amounts': (order_bill_amounts, 'bills'),
+    'order_work_pay': (order_work_pay, 'orders'),
+    'daily_total_pay': (daily_total_pay, 'Daily_Expenses'),
+}
+
+
+def run_chunk(url, check, lo, hi, codes):
+    """Run one check over ids [lo, hi). Returns (check, lo, hi, mismatches)."""
+    function = CHECKS[check][0]
+    with engine_for(url).connect() as conn:
+        return check, lo, hi, function(conn, lo, hi, codes)
@@ -0,0 +1,23 @@
+# Shared-secret protection for maintenance endpoints.
+#
+# Set ADMIN_TOKEN and send it as an X-Admin-Token header (or ?admin_token=).
+# With no ADMIN_TOKEN configured every protected endpoint answers 401.
+import hmac
+from functools import wraps
+
+from flask import current_app, jsonify, request
+
+
+def is_admin():
+    token = current_app.config.get('ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token') or request.args.get('admin_token')
+    return bool(token) and supplied is not None and hmac.compare_digest(supplied, token)
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,284 @@
+# Online backups of the SQLite database.
+#
+# A snapshot is taken with the SQLite online backup API, BACKUP_PAGES_PER_STEP
+# pages at a time with a short sleep in between, so the read lock on the live
+# database is only ever held for one step and new_bill keeps committing. A
+# write from another connection makes SQLite restart the copy; after
+# BACKUP_MAX_RESTARTS restarts the rest is copied in a single step (one short
+# read lock, as the report snapshot does) so a busy shop still gets its backup.
+# In WAL mode (REPORT_DATABASE_MODE=wal switches it on) the copy instead runs
+# inside one read transaction, which writers don't wait for, and never restarts.
+#
+# The copy is checked with PRAGMA integrity_check, then gzip-streamed to
+# BACKUP_DIR as tms-<UTC time>.db.gz next to a small JSON manifest (sizes,
+# sha256, check result). Rotation keeps the newest BACKUP_KEEP_RECENT
+# snapshots plus the newest one of each of the last BACKUP_KEEP_DAILY days.
+# Scheduled backups wait until BUSINESS_HOURS (IST) are over.
+#
+#   flask --app back.app backup-db [--schedule]
+#   flask --app back.app list-backups
+#   flask --app back.app restore-db tms-20250901T203000.db.gz
+#
+# Postgres deployments should use pg_dump / base backups instead.
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+
+from back.app import app, db
+from back.dates import in_business_hours, seconds_until_after_hours
+from back.jobs import enqueue, job_handler
+from back.tenancy import current_shop
+
+SNAPSHOT_NAME = re.compile(r'^tms-[0-9]{8}T[0-9]{6}(-[a-z0-9-]+)?\.db\.gz$')
+CHUNK = 1024 * 1024
+
+# One backup at a time per process
+running = threading.Lock()
+
+
+class BackupError(Exception):
+    pass
+
+
+def database_path():
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        raise BackupError('Backups need a SQLite file database; use pg_dump for Postgres')
+    return url.database
+
+
+def backup_dir():
+    # Other shops (tenancy.py) keep their snapshots in their own directory
+    shop = current_shop()
+    directory = os.path.join(app.config['BACKUP_DIR'], shop) if shop else app.config['BACKUP_DIR']
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def copy_database(source_path, target_path):
+    """Online copy in page steps. Returns (pages, restarts)."""
+    pages_per_step = app.config['BACKUP_PAGES_PER_STEP']
+    state = {'remaining': None, 'restarts': 0, 'pages': 0}
+
+    def progress(status, remaining, total):
+        # The remaining count going back up means SQLite restarted the copy
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+        state['remaining'] = remaining
+        state['pages'] = total
+        if state['restarts'] >= app.config['BACKUP_MAX_RESTARTS']:
+            raise BackupError('restarted too often')
+
+    source = sqlite3.connect(source_path, isolation_level=None)
+    target = sqlite3.connect(target_path)
+    try:
+        wal = source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        if wal:
+            # In WAL mode a read transaction never blocks writers: holding one
+            # for the whole copy pins a consistent snapshot, so nothing restarts
+            source.execute('BEGIN')
+            source.execute('SELECT count(*) FROM sqlite_master').fetchone()
+        try:
+            source.backup(target, pages=pages_per_step, progress=progress,
+                          sleep=app.config['BACKUP_STEP_SLEEP_MS'] / 1000)
+        except BackupError:
+            # Too busy to finish in steps: copy the rest in one step
+            source.backup(target)
+        if wal:
+            source.execute('COMMIT')
+    finally:
+        target.close()
+        source.close()
+    return state['pages'], state['restarts']
+
+
+def check_integrity(path):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        rows = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    return 'ok' if rows == ['ok'] else '; '.join(rows[:20])
+
+
+def compress(source_path, target_path):
+    """Stream-compress a file. Returns the sha256 of the uncompressed bytes."""
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as target:
+            while True:
+                chunk = source.read(CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                target.write(chunk)
+        raw.flush()
+        os.fsync(raw.fileno())
+    return digest.hexdigest()
+
+
+def create_backup(label=None):
+    """Take, verify, compress and rotate one snapshot. Returns its manifest."""
+    if not running.acquire(blocking=False):
+        raise BackupError('A backup is already running')
+    try:
+        started = time.perf_counter()
+        directory = backup_dir()
+        name = f"tms-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}{'-' + label if label else ''}.db.gz"
+        copy_path = os.path.join(directory, name[:-3] + '.partial')
+        archive_path = os.path.join(directory, name)
+        try:
+            pages, restarts = copy_database(database_path(), copy_path)
+            integrity = check_integrity(copy_path)
+            if integrity != 'ok':
+                raise BackupError(f'Integrity check failed: {integrity}')
+            sha256 = compress(copy_path, archive_path + '.partial')
+            os.replace(archive_path + '.partial', archive_path)
+            manifest = {
+                'name': name,
+                'created_at': datetime.utcnow().isoformat(),
+                'size': os.path.getsize(copy_path),
+                'compressed_size': os.path.getsize(archive_path),
+                'sha256': sha256,
+                'pages': pages,
+                'restarts': restarts,
+                'integrity': integrity,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+            }
+        finally:
+            for leftover in (copy_path, archive_path + '.partial'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        with open(archive_path + '.json', 'w') as f:
+            json.dump(manifest, f)
+        rotate(directory)
+        return manifest
+    finally:
+        running.release()
+
+
+def snapshot_names(directory):
+    return sorted((name for name in os.listdir(directory) if SNAPSHOT_NAME.match(name)), reverse=True)
+
+
+def rotate(directory):
+    """Keep the newest BACKUP_KEEP_RECENT plus the newest per day for BACKUP_KEEP_DAILY days."""
+    names = snapshot_names(directory)
+    keep = set(names[:app.config['BACKUP_KEEP_RECENT']])
+    days = []
+    for name in names:
+        day = name[4:12]
+        if day not in days:
+            days.append(day)
+            if len(days) <= app.config['BACKUP_KEEP_DAILY']:
+                keep.add(name)
+    for name in names:
+        if name not in keep:
+            for path in (os.path.join(directory, name), os.path.join(directory, name + '.json')):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def list_backups():
+    directory = backup_dir()
+    backups = []
+    for name in snapshot_names(directory):
+        try:
+            with open(os.path.join(directory, name + '.json')) as f:
+                backups.append(json.load(f))
+        except (OSError, ValueError):
+            backups.append({'name': name, 'compressed_size': os.path.getsize(os.path.join(directory, name))})
+    return backups
+
+
+def restore_backup(name):
+    """Replace the live database with a snapshot (after saving the current one)."""
+    if not SNAPSHOT_NAME.match(name):
+        raise BackupError(f'Not a snapshot name: {name}')
+    directory = backup_dir()
+    archive_path = os.path.join(directory, name)
+    if not os.path.exists(archive_path):
+        raise BackupError(f'No such snapshot: {name}')
+
+    restored_path = os.path.join(directory, name[:-3] + '.restore')
+    try:
+        with gzip.open(archive_path, 'rb') as source, open(restored_path, 'wb') as target:
+            shutil.copyfileobj(source, target, CHUNK)
+        integrity = check_integrity(restored_path)
+        if integrity != 'ok':
+            raise BackupError(f'Snapshot failed its integrity check: {integrity}')
+
+        # Keep what is being replaced
+        saved = create_backup(label='pre-restore')
+
+        # Drop pooled connections, then copy into the live file through SQLite
+        # so open readers see a consistent database rather than a swapped file
+        db.session.remove()
+        db.engine.dispose()
+        source = sqlite3.connect(restored_path)
+        target = sqlite3.connect(database_path(), timeout=30)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return saved
+    finally:
+        if os.path.exists(restored_path):
+            os.remove(restored_path)
+
+
+def schedule_next(delay=None):
+    delay = app.config['BACKUP_INTERVAL'] if delay is None else delay
+    run_at = datetime.utcnow() + timedelta(seconds=delay)
+    enqueue('db.backup', {}, delay=delay, unique_key=f"db.backup:{run_at.strftime('%Y%m%dT%H')}")
+
+
+@job_handler('db.backup')
+def run_backup_job(payloads):
+    if in_business_hours():
+        # Try again once the shop has closed
+        schedule_next(seconds_until_after_hours())
+    else:
+        create_backup()
+        schedule_next()
+    db.session.commit()
+
+
+@app.cli.command('backup-db')
+@click.option('--schedule', is_flag=True, help='Also schedule a backup every BACKUP_INTERVAL, outside business hours.')
+def backup_db_command(schedule):
+    """Take a compressed, verified snapshot of the database now."""
+    manifest = create_backup()
+    click.echo(f"{manifest['name']}: {manifest['size']} -> {manifest['compressed_size']} bytes, "
+               f"{manifest['restarts']} restart(s), {manifest['duration_ms']} ms")
+    if schedule:
+        schedule_next()
+        db.session.commit()
+
+
+@app.cli.command('list-backups')
+def list_backups_command():
+    """List snapshots, newest first."""
+    for backup in list_backups():
+        click.echo(f"{backup['name']}  {backup.get('compressed_size', '?')} bytes  {backup.get('integrity', '?')}")
+
+
+@app.cli.command('restore-db')
+@click.argument('name')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def restore_db_command(name, yes):
+    """Replace the database with a snapshot. Stop the app (and job workers) first."""
+    if not yes:
+        click.confirm(f'Replace {database_path()} with {name}?', abort=True)
+    saved = restore_backup(name)
+    click.echo(f"Restored {name}; the previous database was saved as {saved['name']}")
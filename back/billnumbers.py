@@ -0,0 +1,170 @@
+# Bill number allocation.
+#
+# One row in bill_sequence holds the next unissued number. Numbers are only
+# ever handed out in blocks claimed by a single conditional UPDATE, so two
+# callers can never receive the same range:
+#
+#   * this process claims BILL_NUMBER_BLOCK_SIZE numbers at a time and issues
+#     them from memory, so new_bill costs no extra round trip per bill;
+#   * offline tablets lease their own block through POST /api/bill-numbers/lease
+#     and send the numbers back with each bill.
+#
+# Bill.bill_number is unique, so a number can never be stored twice either.
+# Numbers in a block that is never used are skipped, not reissued.
+#
+#   flask --app back.app bill-numbers-stress --threads 16 --count 500
+import threading
+from datetime import datetime
+
+import click
+from sqlalchemy import func, select, update
+
+from back.app import app, db
+from back.schema import insert_ignore
+from back.models import Bill, BillNumberLease, BillSequence, Order
+from back.tenancy import current_shop
+
+SEQUENCE = 'bill'
+
+
+def first_free_number(conn):
+    # Continue after every number already used by the app or the legacy column
+    used = [
+        conn.execute(select(func.max(Bill.bill_number))).scalar(),
+        conn.execute(select(func.max(Order.billnumberinput2))).scalar(),
+    ]
+    return int(max([n for n in used if n is not None], default=app.config['BILL_NUMBER_START'] - 1)) + 1
+
+
+def claim_block(count, conn=None):
+    """Atomically reserve `count` numbers. Returns (first, last), inclusive.
+
+    Runs in its own short transaction so a claimed block stays claimed even if
+    the caller's transaction rolls back; call it before the caller starts
+    writing (SQLite has a single writer).
+    """
+    if conn is None:
+        with db.engine.begin() as conn:
+            return claim_block(count, conn)
+
+    sequence = BillSequence.__table__
+    statement = update(sequence).where(sequence.c.name == SEQUENCE) \
+        .values(next_value=sequence.c.next_value + count)
+
+    def advance():
+        if conn.dialect.update_returning:
+            return conn.execute(statement.returning(sequence.c.next_value)).scalar()
+        # The UPDATE holds the row lock until commit, so this read is ours
+        if conn.execute(statement).rowcount == 0:
+            return None
+        return conn.execute(select(sequence.c.next_value).where(sequence.c.name == SEQUENCE)).scalar_one()
+
+    # Write before reading anything: a SQLite transaction that already holds a
+    # read lock can't wait for another writer, it fails with "database is locked"
+    end = advance()
+    if end is None:
+        # First use: start after the highest number already on record
+        conn.execute(insert_ignore(sequence).values(name=SEQUENCE, next_value=first_free_number(conn)))
+        end = advance()
+    return end - count, end - 1
+
+
+def reserve_number(number, conn=None):
+    """Make sure the sequence never issues a number a client already used."""
+    if conn is None:
+        with db.engine.begin() as conn:
+            return reserve_number(number, conn)
+    sequence = BillSequence.__table__
+    conn.execute(update(sequence).where(sequence.c.name == SEQUENCE, sequence.c.next_value <= number)
+                 .values(next_value=number + 1))
+
+
+class BlockAllocator:
+    """Hands out numbers from a block leased by this process."""
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.next = self.last = None
+
+    def allocate(self):
+        with self.lock:
+            if self.next is None or self.next > self.last:
+                self.next, self.last = claim_block(self.block_size or app.config['BILL_NUMBER_BLOCK_SIZE'])
+            number = self.next
+            self.next += 1
+            return number
+
+
+allocator = BlockAllocator()
+# Each shop numbers its own bills from its own database
+shop_allocators = {}
+shop_allocators_lock = threading.Lock()
+
+
+def next_bill_number():
+    shop = current_shop()
+    if shop is None:
+        return allocator.allocate()
+    with shop_allocators_lock:
+        shop_allocator = shop_allocators.setdefault(shop, BlockAllocator())
+    return shop_allocator.allocate()
+
+
+def lease_block(device_id, count):
+    first, last = claim_block(count)
+    db.session.add(BillNumberLease(device_id=device_id, first_number=first, last_number=last))
+    db.session.commit()
+    return first, last
+
+
+@app.cli.command('bill-numbers-stress')
+@click.option('--threads', default=16, show_default=True)
+@click.option('--count', default=500, show_default=True, help='Numbers drawn per thread.')
+@click.option('--block-size', default=50, show_default=True)
+def bill_numbers_stress_command(threads, count, block_size):
+    """Draw numbers from many threads at once and check none repeat or go missing.
+
+    Exits 1 on duplicates, gaps or errors. Run it against a database nothing
+    else is drawing numbers from, or other writers' numbers count as gaps.
+    """
+    drawn = [[] for _ in range(threads)]
+    allocators = [BlockAllocator(block_size) for _ in range(threads)]
+    errors = []
+
+    def work(index):
+        try:
+            with app.app_context():
+                local = allocators[index]
+                for i in range(count):
+                    if i % 10 == 0:
+                        # Mix in device-style leases taken straight from the sequence
+                        first, last = claim_block(3)
+                        drawn[index].extend(range(first, last + 1))
+                    drawn[index].append(local.allocate())
+        except Exception as e:
+            errors.append(e)
+
+    # claim_block(0) reads where the sequence stands without taking anything
+    start, _ = claim_block(0)
+    started = datetime.now()
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    end, _ = claim_block(0)
+
+    numbers = [n for chunk in drawn for n in chunk]
+    duplicates = len(numbers) - len(set(numbers))
+    # Numbers still waiting in an allocator's block were leased, not lost
+    unused = {n for local in allocators if local.next is not None for n in range(local.next, local.last + 1)}
+    gaps = sorted(set(range(start, end)) - set(numbers) - unused)
+    click.echo(f'{len(numbers)} numbers in {(datetime.now() - started).total_seconds():.2f}s, '
+               f'{duplicates} duplicates, {len(gaps)} gaps, {len(errors)} errors')
+    if gaps:
+        click.echo(f'  missing: {gaps[:10]}')
+    for error in errors[:5]:
+        click.echo(f'  {error!r}')
+    if duplicates or gaps or errors:
+        raise SystemExit(1)
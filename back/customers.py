@@ -0,0 +1,151 @@
+# Per-customer lifetime rollups.
+#
+# customer_summaries holds one row per mobile number: visits (bills), total
+# spent, amount paid, outstanding dues and first/last visit. Bill-changing
+# writes (new_bill, payment status, advance and total amount edits) call
+# refresh_customer() inside their own transaction; it recomputes just that
+# customer's row from their bills, so the summary never drifts from a write
+# that committed. Money follows the app's payment rules: the advance
+# (payment_amount) is paid when the bill is made, and the rest once all of
+# the bill's orders are marked paid; bills whose orders are all cancelled
+# count for nothing.
+#
+#   flask --app back.app rebuild-customer-summaries [--verify-only]
+from datetime import datetime
+
+import click
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from back.app import app, db
+from back.models import Bill, CustomerSummary, Order, orders_archive
+
+
+def bill_orders(session, bill_ids):
+    """{bill_id: [(total_amt, payment_amount, payment_status), ...]} over live and archived orders."""
+    orders = {}
+    for table in (Order.__table__, orders_archive):
+        for row in session.execute(
+            select(table.c.bill_id, table.c.total_amt, table.c.payment_amount, table.c.payment_status)
+            .where(table.c.bill_id.in_(bill_ids))
+        ):
+            orders.setdefault(row.bill_id, []).append((row.total_amt, row.payment_amount, row.payment_status))
+    return orders
+
+
+def bill_figures(bill, orders):
+    """(spent, paid) for one bill.
+
+    Every order carries its bill's full total and advance, and the edit
+    routes change them per order, so the orders win over the bill row when
+    there are any. The balance is only paid once every live order is: until
+    then the advance is all that has come in.
+    """
+    live = [order for order in orders if order[2] != 'cancelled']
+    if orders and not live:
+        return 0.0, 0.0
+    spent = max(order[0] or 0.0 for order in live) if live else bill.total_amt or 0.0
+    advance = max(order[1] or 0.0 for order in live) if live else bill.payment_amount or 0.0
+    if bill.payment_status == 'paid' or (live and all(order[2] == 'paid' for order in live)):
+        return spent, spent
+    return spent, min(advance, spent)
+
+
+def compute(session, mobile_number):
+    """Summary values for one customer from their bills, or None if they have none."""
+    bills = session.execute(
+        select(Bill).where(Bill.mobile_number == mobile_number).order_by(Bill.date_issue, Bill.id)
+    ).scalars().all()
+    if not bills:
+        return None
+    orders = bill_orders(session, [bill.id for bill in bills])
+    spent = paid = 0.0
+    for bill in bills:
+        bill_spent, bill_paid = bill_figures(bill, orders.get(bill.id, []))
+        spent += bill_spent
+        paid += bill_paid
+    return {
+        'mobile_number': mobile_number,
+        'customer_name': bills[-1].customer_name,
+        'visits': len(bills),
+        'total_spent': round(spent, 2),
+        'total_paid': round(paid, 2),
+        'outstanding': round(spent - paid, 2),
+        'first_visit': bills[0].date_issue,
+        'last_visit': bills[-1].date_issue,
+    }
+
+
+def refresh_customer(session, mobile_number=None, bill_id=None):
+    """Recompute one customer's row; call inside the write's transaction, before commit."""
+    if mobile_number is None:
+        mobile_number = session.execute(select(Bill.mobile_number).where(Bill.id == bill_id)).scalar()
+        if mobile_number is None:
+            return None
+    values = compute(session, mobile_number)
+    summary = session.get(CustomerSummary, mobile_number)
+    if values is None:
+        if summary is not None:
+            session.delete(summary)
+        return None
+    if summary is None:
+        summary = CustomerSummary(mobile_number=mobile_number)
+        session.add(summary)
+    for key, value in values.items():
+        setattr(summary, key, value)
+    summary.updated_at = datetime.utcnow()
+    return summary
+
+
+def top_customers(session, by='spent', limit=10):
+    column = CustomerSummary.outstanding if by == 'outstanding' else CustomerSummary.total_spent
+    return session.execute(
+        select(CustomerSummary).where(column > 0).order_by(column.desc()).limit(limit)
+    ).scalars().all()
+
+
+def rebuild(session, verify_only=False):
+    """Recompute every customer's row. Returns the mobile numbers whose stored row was wrong."""
+    stored = {summary.mobile_number: summary
+              for summary in session.execute(select(CustomerSummary)).scalars()}
+    drifted = []
+    numbers = [number for (number,) in session.execute(select(Bill.mobile_number).distinct())]
+    for number in numbers:
+        expected = compute(session, number)
+        current = stored.pop(number, None)
+        if current is None or any(getattr(current, key) != value for key, value in expected.items()):
+            drifted.append(number)
+            if not verify_only:
+                refresh_customer(session, number)
+    # Rows for customers who no longer have any bills
+    drifted.extend(stored)
+    if not verify_only:
+        if stored:
+            session.execute(delete(CustomerSummary).where(CustomerSummary.mobile_number.in_(list(stored))))
+        session.commit()
+    return drifted
+
+
+def backfill(session):
+    """First start after upgrading: build the rollups once if they are still empty."""
+    if session.execute(select(CustomerSummary.mobile_number).limit(1)).first() is not None:
+        return
+    if session.execute(select(Bill.id).limit(1)).first() is None:
+        return
+    try:
+        rebuild(session)
+    except IntegrityError:
+        # Another process built it at the same time
+        session.rollback()
+
+
+@app.cli.command('rebuild-customer-summaries')
+@click.option('--verify-only', is_flag=True, help='Report drifted customers without fixing them.')
+def rebuild_customer_summaries_command(verify_only):
+    """Reconcile customer_summaries against the bills."""
+    drifted = rebuild(db.session, verify_only=verify_only)
+    for number in drifted[:50]:
+        click.echo(f'drift: {number}')
+    click.echo(f"{len(drifted)} customer(s) {'out of date' if verify_only else 'fixed'}")
+    if verify_only and drifted:
+        raise SystemExit(1)
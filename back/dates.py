@@ -0,0 +1,98 @@
+# Calendar dimension and IST day boundaries.
+#
+# The shop runs on Indian Standard Time but timestamps such as
+# Order.updated_at are stored in UTC, so "orders paid on 9 Sep" is not
+# func.date(updated_at) == '2025-09-09': anything paid before 05:30 IST lands
+# on the previous UTC day. Reports use
+#
+#   * ist_day_bounds(day) -> the UTC [start, end) of an IST day, which is a
+#     plain range over an indexed timestamp column, and
+#   * calendar_days, one row per date with its Sunday week, Monday week,
+#     month and Indian fiscal year (April-March), so grouping by week or
+#     month is a join on the date plus GROUP BY instead of per-row
+#     timedelta arithmetic in Python.
+#
+# Dates are local (IST) already; calendar_days covers CALENDAR_START through
+# CALENDAR_YEARS_AHEAD years from now and is filled in at startup.
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select
+
+from back.app import app, db
+from back.schema import insert_ignore
+from back.models import CalendarDay
+
+
+def ist_offset():
+    return timedelta(minutes=app.config['TIMEZONE_OFFSET_MINUTES'])
+
+
+def ist_today():
+    return (datetime.utcnow() + ist_offset()).date()
+
+
+def ist_day_bounds(day):
+    """UTC [start, end) of an IST calendar day, for filtering UTC timestamps."""
+    start = datetime.combine(day, datetime.min.time()) - ist_offset()
+    return start, start + timedelta(days=1)
+
+
+def in_business_hours(now=None):
+    """Whether the shop is open (BUSINESS_HOURS, IST) at `now` (UTC)."""
+    start, end = (int(hour) for hour in app.config['BUSINESS_HOURS'].split('-'))
+    hour = ((now or datetime.utcnow()) + ist_offset()).hour
+    return start <= hour < end
+
+
+def seconds_until_after_hours(now=None):
+    """Seconds until the shop next closes; background chores wait this long."""
+    local = (now or datetime.utcnow()) + ist_offset()
+    end = int(app.config['BUSINESS_HOURS'].split('-')[1])
+    after = local.replace(hour=end, minute=0, second=0, microsecond=0)
+    if after <= local:
+        after += timedelta(days=1)
+    return int((after - local).total_seconds())
+
+
+def calendar_row(day):
+    fiscal_year = day.year if day.month >= 4 else day.year - 1
+    return {
+        'day': day,
+        'week_start_sun': day - timedelta(days=(day.weekday() + 1) % 7),
+        'week_start_mon': day - timedelta(days=day.weekday()),
+        'month_start': day.replace(day=1),
+        'fiscal_year': fiscal_year,
+    }
+
+
+def ensure_calendar(session, first=None, last=None, chunk=1000):
+    """Fill calendar_days for [first, last]; rows that exist are left alone. Returns rows added."""
+    first = first or datetime.strptime(app.config['CALENDAR_START'], '%Y-%m-%d').date()
+    last = last or date(ist_today().year + app.config['CALENDAR_YEARS_AHEAD'], 12, 31)
+    present = session.execute(
+        select(func.count()).select_from(CalendarDay).where(CalendarDay.day >= first, CalendarDay.day <= last)
+    ).scalar()
+    missing = (last - first).days + 1 - present
+    if not missing:
+        return 0
+
+    day = first
+    while day <= last:
+        rows = []
+        while day <= last and len(rows) < chunk:
+            rows.append(calendar_row(day))
+            day += timedelta(days=1)
+        session.execute(insert_ignore(CalendarDay.__table__), rows)
+    session.commit()
+    return missing
+
+
+def bucket(grain):
+    """The calendar_days column to group by for 'day', 'week' (Sunday), 'week_mon', 'month' or 'fiscal_year'."""
+    return {
+        'day': CalendarDay.day,
+        'week': CalendarDay.week_start_sun,
+        'week_mon': CalendarDay.week_start_mon,
+        'month': CalendarDay.month_start,
+        'fiscal_year': CalendarDay.fiscal_year,
+    }[grain]
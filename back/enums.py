@@ -0,0 +1,338 @@
+# Dictionary-encoded enum columns.
+#
+# Order/Bill status, payment and garment fields used to be free-text
+# String(50) columns holding variants like 'Pending' / 'pending'. They are now
+# stored as SmallInteger codes; each Vocabulary maps its codes to one canonical
+# label and folds known spellings onto it, so the ORM (and the JSON API) keeps
+# reading and writing plain strings while the database groups, filters and
+# indexes small ints. The enum_values table mirrors every vocabulary so the
+# codes stay readable from raw SQL.
+#
+#   flask --app back.app migrate-enums      # convert an existing database
+#
+# prepare_database() runs ensure_coded_enums() on every start (and for every
+# shop). By default it only checks: a database that was never converted stops
+# the app with a pointer to migrate-enums, which rebuilds tables and so is never
+# run as a side effect of starting up (see ENUM_STARTUP_CHECK).
+import click
+from sqlalchemy import MetaData, SmallInteger, inspect, select, text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.types import TypeDecorator
+
+from back.app import app, db
+
+
+class Vocabulary:
+    def __init__(self, kind, labels, aliases=None, flags=False):
+        # labels: {code: canonical label}; aliases: {spelling: canonical label}
+        self.kind = kind
+        self.labels = dict(labels)
+        self.flags = flags
+        self.codes = {self.fold(label): code for code, label in self.labels.items()}
+        for alias, label in (aliases or {}).items():
+            self.codes[self.fold(alias)] = self.codes[self.fold(label)]
+
+    @staticmethod
+    def fold(value):
+        return ' '.join(str(value).replace('_', ' ').split()).lower()
+
+    def encode(self, value):
+        if value is None:
+            return None
+        if isinstance(value, int):
+            self.decode(value)  # validates
+            return value
+        if self.flags and ',' in str(value):
+            # Garments booked together ("Pant, Shirt") are stored as one bitmask
+            code = 0
+            for part in str(value).split(','):
+                if part.strip():
+                    code |= self.encode_one(part)
+            return code
+        return self.encode_one(value)
+
+    def encode_one(self, value):
+        try:
+            return self.codes[self.fold(value)]
+        except KeyError:
+            raise ValueError(f'Unknown {self.kind} value: {value!r}')
+
+    def decode(self, code):
+        if code is None:
+            return None
+        if code in self.labels:
+            return self.labels[code]
+        if self.flags and code > 0 and sum(bit for bit in self.labels if code & bit) == code:
+            return ', '.join(label for bit, label in sorted(self.labels.items()) if code & bit)
+        raise ValueError(f'Unknown {self.kind} code: {code!r}')
+
+    def normalize(self, value):
+        """Canonical spelling of value; raises ValueError if it is not in the vocabulary."""
+        return self.decode(self.encode(value))
+
+    def is_valid(self, value):
+        try:
+            self.encode(value)
+            return True
+        except ValueError:
+            return False
+
+
+ORDER_STATUS = Vocabulary('order_status', {
+    1: 'pending',
+    2: 'in progress',
+    3: 'completed',
+    4: 'delivered',
+    5: 'cancelled',
+}, aliases={'inprogress': 'in progress', 'in-progress': 'in progress', 'complete': 'completed',
+            'canceled': 'cancelled'})
+
+PAYMENT_STATUS = Vocabulary('payment_status', {
+    1: 'pending',
+    2: 'advance',
+    3: 'partial',
+    4: 'paid',
+    5: 'cancelled',
+}, aliases={'canceled': 'cancelled', 'unpaid': 'pending'})
+
+PAYMENT_MODE = Vocabulary('payment_mode', {
+    0: '',
+    1: 'Cash',
+    2: 'UPI',
+    3: 'Card',
+    4: 'Bank Transfer',
+    5: 'Cheque',
+}, aliases={'online': 'UPI', 'bank': 'Bank Transfer'})
+
+GARMENT = Vocabulary('garment_type', {
+    1: 'Suit',
+    2: 'Safari',
+    4: 'Pant',
+    8: 'Shirt',
+    16: 'Sadri',
+    32: 'Jacket',
+    64: 'NShirt',
+    128: 'Others',
+}, aliases={'Safari/Jacket': 'Safari', 'pants': 'Pant', 'shirts': 'Shirt', 'other': 'Others'}, flags=True)
+
+VOCABULARIES = (ORDER_STATUS, PAYMENT_STATUS, PAYMENT_MODE, GARMENT)
+
+
+class CodedEnum(TypeDecorator):
+    """SmallInteger column that reads and writes a Vocabulary's labels."""
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, vocabulary, *args, **kwargs):
+        self.vocabulary = vocabulary
+        super().__init__(*args, **kwargs)
+
+    def process_bind_param(self, value, dialect):
+        return self.vocabulary.encode(value)
+
+    def process_literal_param(self, value, dialect):
+        return str(self.vocabulary.encode(value))
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, str):
+            # Row not yet converted by migrate-enums
+            return self.vocabulary.normalize(value)
+        return self.vocabulary.decode(value)
+
+    @property
+    def python_type(self):
+        return str
+
+
+def coded_columns(table):
+    """{column name: Vocabulary} for the coded columns of a Table."""
+    return {column.name: column.type.vocabulary for column in table.columns
+            if isinstance(column.type, CodedEnum)}
+
+
+def seed_enum_values(session=None):
+    from back.models import EnumValue
+
+    session = session or db.session
+    existing = {(kind, code) for kind, code in session.execute(select(EnumValue.kind, EnumValue.code))}
+    for vocabulary in VOCABULARIES:
+        for code, label in vocabulary.labels.items():
+            if (vocabulary.kind, code) not in existing:
+                session.add(EnumValue(kind=vocabulary.kind, code=code, label=label))
+    session.commit()
+
+
+def replacement_table(table):
+    # A copy of `table` named <table>_new, in scratch metadata that also holds
+    # the tables its foreign keys point at (the copy's indexes aren't created)
+    scratch = MetaData()
+    for other in db.metadata.sorted_tables:
+        if other is not table:
+            other.to_metadata(scratch)
+    return table.to_metadata(scratch, name=f'{table.name}_new')
+
+
+def migrate_table(table, dry_run=False):
+    """Rewrite a table's legacy text enum columns as codes.
+
+    Returns (converted column names, {column: unmappable values}); nothing is
+    changed while any value is unmappable.
+    """
+    columns = coded_columns(table)
+    inspector = inspect(db.engine)
+    if not inspector.has_table(table.name):
+        return [], {}
+    legacy = [info['name'] for info in inspector.get_columns(table.name)
+              if info['name'] in columns and not isinstance(info['type'], SmallInteger)]
+
+    mappings, unknown = {}, {}
+    for name in legacy:
+        values = [value for (value,) in db.session.execute(text(f'SELECT DISTINCT "{name}" FROM "{table.name}"'))]
+        mappings[name] = {value: columns[name].encode(value) for value in values
+                          if value is not None and columns[name].is_valid(value)}
+        bad = sorted(value for value in values if value is not None and value not in mappings[name])
+        if bad:
+            unknown[name] = bad
+    if not legacy or unknown or dry_run:
+        return legacy, unknown
+
+    if db.engine.dialect.name == 'postgresql':
+        for name in legacy:
+            db.session.execute(text(
+                f'ALTER TABLE "{table.name}" ALTER COLUMN "{name}" TYPE smallint '
+                f'USING ({recode_sql(name, mappings[name])})'
+            ))
+    else:
+        # SQLite cannot change a column's type in place: create the new table
+        # beside the old one, copy the rows across as codes, then swap it in
+        # (the documented drop-and-rename sequence, so foreign keys pointing at
+        # this table keep their target).
+        existing = {info['name'] for info in inspector.get_columns(table.name)}
+        names = [column.name for column in table.columns if column.name in existing]
+        column_list = ', '.join(f'"{name}"' for name in names)
+        new = replacement_table(table)
+        db.session.execute(text('PRAGMA foreign_keys=OFF'))
+        db.session.execute(CreateTable(new))
+        db.session.execute(text(
+            f'INSERT INTO "{new.name}" ({column_list}) SELECT '
+            + ', '.join(recode_sql(name, mappings[name]) if name in mappings else f'"{name}"' for name in names)
+            + f' FROM "{table.name}"'
+        ))
+        db.session.execute(text(f'DROP TABLE "{table.name}"'))
+        db.session.execute(text(f'ALTER TABLE "{new.name}" RENAME TO "{table.name}"'))
+        for index in table.indexes:
+            index.create(db.session.connection())
+    db.session.commit()
+    return legacy, {}
+
+
+class LegacyEnumValues(RuntimeError):
+    pass
+
+
+def stray_text_values(table):
+    """{column: legacy spellings} left as text in already-coded SQLite columns."""
+    if db.engine.dialect.name != 'sqlite' or not inspect(db.engine).has_table(table.name):
+        return {}
+    found = {}
+    for name in coded_columns(table):
+        values = [value for (value,) in db.session.execute(text(
+            f'SELECT DISTINCT "{name}" FROM "{table.name}" WHERE typeof("{name}") = \'text\''))]
+        if values:
+            found[name] = values
+    return found
+
+
+def recode_stray_values(table, skip=(), dry_run=False):
+    """Convert the text left in already-coded columns (rows written before a
+    column was converted, or by raw SQL). Returns ({column: values converted},
+    {column: unmappable values}); columns with unmappable values are left alone."""
+    converted, unknown = {}, {}
+    for name, values in stray_text_values(table).items():
+        if name in skip:
+            continue
+        vocabulary = coded_columns(table)[name]
+        bad = [value for value in values if not vocabulary.is_valid(value)]
+        if bad:
+            unknown[name] = bad
+            continue
+        converted[name] = values
+        if not dry_run:
+            mapping = {value: vocabulary.encode(value) for value in values}
+            db.session.execute(text(
+                f'UPDATE "{table.name}" SET "{name}" = {recode_sql(name, mapping)} '
+                f'WHERE typeof("{name}") = \'text\''))
+    if not dry_run:
+        db.session.commit()
+    return converted, unknown
+
+
+def ensure_coded_enums(mode=None):
+    """Startup check: coded filters (payment_status == 'paid' binds 4) match
+    nothing on columns still holding text, so refuse to start (mode 'fail') or
+    convert them (mode 'migrate'). Mode 'off' skips the check."""
+    from back.models import Bill, Order, orders_archive
+
+    mode = mode or app.config['ENUM_STARTUP_CHECK']
+    if mode == 'off':
+        return
+    migrate = mode == 'migrate'
+    problems = []
+    for table in (Bill.__table__, Order.__table__, orders_archive):
+        legacy, unknown = migrate_table(table, dry_run=not migrate)
+        for name, values in unknown.items():
+            problems.append(f'{table.name}.{name} holds values that cannot be mapped: {values}')
+        if legacy and not unknown and not migrate:
+            problems.append(f'{table.name}: {", ".join(legacy)} still hold text')
+        if unknown:
+            continue
+        converted, unknown = recode_stray_values(table, skip=legacy, dry_run=not migrate)
+        for name, values in unknown.items():
+            problems.append(f'{table.name}.{name} holds values that cannot be mapped: {values}')
+        if not migrate:
+            for name, values in converted.items():
+                problems.append(f'{table.name}.{name} still holds text values {values}')
+    db.session.rollback()
+    if problems:
+        raise LegacyEnumValues(
+            'The database still has text status/payment/garment values, which the coded filters '
+            'would silently skip:\n  ' + '\n  '.join(problems) +
+            '\nBack the database up, fix any values that cannot be mapped, then convert it with '
+            '`ENUM_STARTUP_CHECK=off flask --app back.app migrate-enums` (add --shop <name> for a shop).')
+
+
+def recode_sql(name, mapping):
+    """CASE expression mapping each legacy spelling found in a column to its code."""
+    def literal(value):
+        return str(value) if isinstance(value, int) else "'{}'".format(value.replace("'", "''"))
+
+    whens = ' '.join(f'WHEN {literal(value)} THEN {code}' for value, code in mapping.items())
+    return f'CASE "{name}" {whens} END' if whens else 'NULL'
+
+
+@app.cli.command('migrate-enums')
+@click.option('--dry-run', is_flag=True, help='Only report what would change and values that cannot be mapped.')
+@click.option('--shop', help='Convert this shop\'s database instead of the default one.')
+def migrate_enums_command(dry_run, shop):
+    """Convert legacy text status/payment/garment columns to coded enums."""
+    from back.models import Bill, Order, orders_archive
+    from back.tenancy import use_shop
+
+    failed = False
+    with use_shop(db, shop or app.config['SHOP_DEFAULT']):
+        seed_enum_values()
+        for table in (Bill.__table__, Order.__table__, orders_archive):
+            legacy, unknown = migrate_table(table, dry_run=dry_run)
+            if not unknown:
+                converted, unknown = recode_stray_values(table, skip=legacy, dry_run=dry_run)
+                legacy = legacy + [f'{name} (text values {values})' for name, values in converted.items()]
+            for name, values in unknown.items():
+                failed = True
+                click.echo(f'{table.name}.{name}: cannot map {values}')
+            if not legacy:
+                if not unknown:
+                    click.echo(f'{table.name}: up to date')
+            elif not unknown:
+                click.echo(f'{table.name}: {"would convert" if dry_run else "converted"} {", ".join(legacy)}')
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,103 @@
+# Group commit for small, frequent writes (status / payment toggles).
+#
+# With GROUP_COMMIT enabled, write(fn) hands fn to a single committer thread
+# instead of committing on the request's own session. The committer collects
+# whatever arrives within GROUP_COMMIT_WINDOW_MS (or GROUP_COMMIT_MAX_BATCH
+# operations), runs each one in its own SAVEPOINT inside one transaction and
+# commits once, so a burst of taps costs one fsync instead of one each. The
+# request blocks until its batch has committed, so the response still means
+# "durably written"; an operation that raises is rolled back on its own and
+# its exception is re-raised in the request.
+#
+# Disabled (the default), write(fn) simply runs fn and commits. Requests for
+# another shop (tenancy.py) also commit on their own: one batch is one
+# database transaction.
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from back.app import app, db
+from back.tenancy import current_shop
+
+
+class GroupCommitter:
+    def __init__(self, window=None, max_batch=None):
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, fn):
+        future = Future()
+        self.ensure_started()
+        self.queue.put((fn, future))
+        return future.result()
+
+    def ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run_forever, name='group-commit', daemon=True)
+                self.thread.start()
+
+    def collect(self):
+        batch = [self.queue.get()]
+        window = self.window if self.window is not None else app.config['GROUP_COMMIT_WINDOW_MS'] / 1000
+        max_batch = self.max_batch or app.config['GROUP_COMMIT_MAX_BATCH']
+        deadline = time.monotonic() + window
+        while len(batch) < max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self, batch):
+        results = []
+        for fn, future in batch:
+            try:
+                with db.session.begin_nested():
+                    results.append((future, fn(db.session), None))
+            except Exception as e:
+                results.append((future, None, e))
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def run_forever(self):
+        while True:
+            batch = self.collect()
+            with app.app_context():
+                try:
+                    self.flush(batch)
+                finally:
+                    db.session.remove()
+
+
+committer = GroupCommitter()
+
+
+def write(fn):
+    """Run fn(session) and commit; returns fn's result. Batched when GROUP_COMMIT is on."""
+    if app.config['GROUP_COMMIT'] and current_shop() is None:
+        return committer.submit(fn)
+    try:
+        result = fn(db.session)
+        db.session.commit()
+        return result
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,197 @@
+# Idempotency keys for writes that clients retry.
+#
+# A tablet that loses its connection mid-request can't tell whether the bill
+# or expense was saved, so it retries. With an Idempotency-Key header (any
+# unique string, e.g. a UUID made when the form is submitted) the first
+# attempt's response is kept in idempotency_keys, and every retry with the same
+# key gets that response back from a primary key lookup, with an
+# Idempotent-Replayed: true header, without running the view again.
+#
+#   * A retry that arrives while the first attempt is still running waits for
+#     it (up to IDEMPOTENCY_WAIT seconds, then 409).
+#   * Reusing a key for a different request (other endpoint, query string or
+#     body) is 422.
+#   * 5xx responses aren't kept, so a failed attempt can be retried.
+#   * Responses are replayed for IDEMPOTENCY_TTL seconds. An attempt that hasn't
+#     finished after IDEMPOTENCY_LOCK_TIMEOUT (process killed) is taken over
+#     by the next retry.
+#
+# Expired keys are deleted in batches by a background job:
+#
+#   flask --app back.app purge-idempotency-keys --schedule
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+import click
+from flask import Response, current_app, jsonify, make_response, request
+from sqlalchemy import delete, select, update
+
+from back.app import app, db
+from back.schema import insert_ignore
+from back.jobs import enqueue, job_handler
+from back.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Waiters in this process are woken as soon as the first attempt finishes;
+# attempts running in another process are noticed by polling
+_lock = threading.Lock()
+_finished = {}  # key -> Event
+
+
+def finished_event(key):
+    with _lock:
+        return _finished.setdefault(key, threading.Event())
+
+
+def notify_finished(key):
+    with _lock:
+        event = _finished.pop(key, None)
+    if event is not None:
+        event.set()
+
+
+def request_hash():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode('utf-8'))
+    digest.update(request.query_string + b'\n')
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def claim(session, key, endpoint, digest):
+    """Try to become the attempt that runs the view. Returns (claimed, row)."""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=current_app.config['IDEMPOTENCY_LOCK_TIMEOUT'])
+    table = IdempotencyKey.__table__
+    claimed = session.execute(insert_ignore(table).values(
+        key=key, endpoint=endpoint, request_hash=digest, created_at=now, expires_at=expires_at
+    )).rowcount == 1
+    row = None
+    if not claimed:
+        row = session.execute(select(table).where(table.c.key == key)).first()
+        if row is not None and row.expires_at <= now:
+            # Expired, or an abandoned attempt: take it over unless someone else just did
+            claimed = session.execute(
+                update(table).where(table.c.key == key, table.c.expires_at == row.expires_at)
+                .values(endpoint=endpoint, request_hash=digest, status_code=None, body=None, mimetype=None,
+                        created_at=now, expires_at=expires_at)
+            ).rowcount == 1
+    session.commit()
+    return claimed, row
+
+
+def release(session, key):
+    # Let the client try again
+    table = IdempotencyKey.__table__
+    session.execute(delete(table).where(table.c.key == key))
+    session.commit()
+
+
+def store(session, key, response):
+    if response.status_code >= 500:
+        release(session, key)
+        return
+    table = IdempotencyKey.__table__
+    session.execute(update(table).where(table.c.key == key).values(
+        status_code=response.status_code,
+        body=response.get_data(as_text=True),
+        mimetype=response.mimetype,
+        expires_at=datetime.utcnow() + timedelta(seconds=current_app.config['IDEMPOTENCY_TTL']),
+    ))
+    session.commit()
+
+
+def replay(row):
+    response = Response(row.body, status=row.status_code, mimetype=row.mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Route decorator: requests carrying the same Idempotency-Key run the view once."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+
+        endpoint = request.endpoint
+        digest = request_hash()
+        deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT']
+        while True:
+            claimed, row = claim(db.session, key, endpoint, digest)
+            if claimed:
+                break
+            if row is None:
+                # The first attempt failed and let go of the key in between; try again
+                continue
+            if row.endpoint != endpoint or row.request_hash != digest:
+                return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+            if row.status_code is not None:
+                return replay(row)
+            if time.monotonic() >= deadline:
+                return jsonify({'error': f'A request with this {HEADER} is still being processed'}), 409
+            finished_event(key).wait(current_app.config['IDEMPOTENCY_POLL_INTERVAL'])
+
+        try:
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                db.session.rollback()
+                release(db.session, key)
+                raise
+            # Whatever the view left uncommitted would be dropped at teardown anyway
+            db.session.rollback()
+            store(db.session, key, response)
+            return response
+        finally:
+            notify_finished(key)
+    return wrapper
+
+
+def purge_expired(session, batch_size=1000):
+    """Delete expired keys in small transactions. Returns rows deleted."""
+    table = IdempotencyKey.__table__
+    deleted = 0
+    while True:
+        keys = [key for (key,) in session.execute(
+            select(table.c.key).where(table.c.expires_at < datetime.utcnow()).limit(batch_size)
+        )]
+        if not keys:
+            return deleted
+        # Re-check expiry: a key may have been taken over since it was selected
+        deleted += session.execute(
+            delete(table).where(table.c.key.in_(keys), table.c.expires_at < datetime.utcnow())
+        ).rowcount
+        session.commit()
+
+
+def schedule_next(delay=None):
+    delay = app.config['IDEMPOTENCY_PURGE_INTERVAL'] if delay is None else delay
+    slot = int((datetime.utcnow() + timedelta(seconds=delay)).timestamp() // app.config['IDEMPOTENCY_PURGE_INTERVAL'])
+    enqueue('idempotency.purge', {}, delay=delay, unique_key=f'idempotency.purge:{slot}')
+
+
+@job_handler('idempotency.purge')
+def run_purge_job(payloads):
+    purge_expired(db.session)
+    schedule_next()
+    db.session.commit()
+
+
+@app.cli.command('purge-idempotency-keys')
+@click.option('--schedule', is_flag=True, help='Also purge every IDEMPOTENCY_PURGE_INTERVAL in the background.')
+def purge_idempotency_keys_command(schedule):
+    """Delete idempotency keys whose replay window has passed."""
+    click.echo(f'{purge_expired(db.session)} expired key(s) deleted')
+    if schedule:
+        schedule_next()
+        db.session.commit()
@@ -0,0 +1,375 @@
+# Streaming bulk importer for legacy order exports.
+#
+# Rows are parsed incrementally (JSON arrays, NDJSON or CSV), mapped onto the
+# Bill / Order / Measurement / Worker tables and written with executemany
+# batches. Memory use stays flat regardless of file size, and a checkpoint per
+# source makes an interrupted import resumable.
+#
+#   flask --app back.app import-data orders-export-2025-09-08.json
+import csv
+import io
+import json
+from datetime import date, datetime
+
+import click
+from sqlalchemy import Date, DateTime, Float, Integer
+
+from back.app import app, db
+from back.enums import CodedEnum
+from back.models import Bill, ImportCheckpoint, Measurement, Order, Worker, order_worker_association
+from back.schema import insert_ignore
+
+# Top-level keys that hold the row array in our JSON exports
+ARRAY_KEYS = ('orders', 'customer_orders', 'bills', 'workers', 'measurements', 'rows')
+
+# Alternative field names seen in the exports / app payloads
+ALIASES = {
+    'orders': {
+        'order_id': 'id',
+        'bill_number': 'billnumberinput2',
+        'advance_amount': 'payment_amount',
+        'total_amount': 'total_amt',
+    },
+    'bills': {'mobileNo': 'mobile_number', 'customerName': 'customer_name'},
+    'measurements': {'mobile_number': 'phone_number'},
+    'workers': {},
+}
+
+TABLES = {
+    'orders': Order.__table__,
+    'bills': Bill.__table__,
+    'measurements': Measurement.__table__,
+    'workers': Worker.__table__,
+    'order_worker_association': order_worker_association,
+}
+
+# Parents first, so foreign keys are satisfied within each flush
+FLUSH_ORDER = ('workers', 'bills', 'orders', 'order_worker_association', 'measurements')
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+# --- Readers -----------------------------------------------------------------
+
+def iter_json_array(stream):
+    """Yield the elements of a JSON array without loading the whole document.
+
+    Accepts either a top-level array or an object whose array lives under one
+    of ARRAY_KEYS (other top-level values are parsed and skipped).
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+            return False
+        # Drop what has been consumed so the buffer never grows with the file
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or not fill():
+                return
+
+    def peek():
+        skip_ws()
+        if pos >= len(buf):
+            raise ImportRowError('Unexpected end of JSON input')
+        return buf[pos]
+
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise ImportRowError(f"Expected '{char}' at JSON offset {pos}")
+        pos += 1
+
+    def value():
+        nonlocal pos
+        skip_ws()
+        while True:
+            try:
+                result, end = decoder.raw_decode(buf, pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(buf) or eof:
+                    pos = end
+                    return result
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            if not fill():
+                result, pos = decoder.raw_decode(buf, pos)
+                return result
+
+    def elements():
+        nonlocal pos
+        expect('[')
+        if peek() == ']':
+            pos += 1
+            return
+        while True:
+            yield value()
+            if peek() == ',':
+                pos += 1
+                continue
+            expect(']')
+            return
+
+    fill()
+    if peek() == '[':
+        yield from elements()
+        return
+
+    expect('{')
+    while peek() != '}':
+        key = value()
+        expect(':')
+        if key in ARRAY_KEYS and peek() == '[':
+            yield from elements()
+        else:
+            value()
+        if peek() == ',':
+            pos += 1
+
+
+def iter_ndjson(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_csv(stream):
+    for row in csv.DictReader(stream):
+        # Empty CSV cells mean "no value"
+        yield {key: (value if value != '' else None) for key, value in row.items()}
+
+
+READERS = {'json': iter_json_array, 'ndjson': iter_ndjson, 'csv': iter_csv}
+
+
+def detect_format(filename):
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'json'
+
+
+# --- Mapping -----------------------------------------------------------------
+
+def coerce(column, value):
+    if value is None:
+        return None
+    column_type = column.type
+    if isinstance(column_type, CodedEnum):
+        return column_type.vocabulary.normalize(value)
+    if isinstance(column_type, DateTime):
+        return value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if isinstance(column_type, Date):
+        return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+    if isinstance(column_type, Integer):
+        return int(float(value))
+    if isinstance(column_type, Float):
+        return float(value)
+    return str(value)
+
+
+def map_row(table_name, row):
+    """Pick and type-convert the columns of `table_name` present in `row`."""
+    table = TABLES[table_name]
+    aliases = ALIASES.get(table_name, {})
+    values = {}
+    for key, value in row.items():
+        name = aliases.get(key, key)
+        if name in table.c and not isinstance(value, (dict, list)):
+            try:
+                values[name] = coerce(table.c[name], value)
+            except (TypeError, ValueError):
+                raise ImportRowError(f'{table_name}.{name}: invalid value {value!r}')
+
+    missing = [
+        column.name for column in table.c
+        if not column.nullable and not column.primary_key and column.default is None
+        and values.get(column.name) is None
+    ]
+    if missing:
+        raise ImportRowError(f"{table_name}: missing {', '.join(missing)}")
+    return values
+
+
+def expand_order_row(row, stub_bills):
+    """An exported order row -> {table: [rows]} including its nested bill and workers."""
+    out = {name: [] for name in FLUSH_ORDER}
+
+    if isinstance(row.get('bills'), dict):
+        out['bills'].append(map_row('bills', row['bills']))
+
+    for worker in row.get('workers') or []:
+        out['workers'].append(map_row('workers', worker))
+
+    order = dict(row)
+    if order.get('bill_id') is None:
+        # customer-orders layout: no bill id, only a bill number
+        order['bill_id'] = stub_bills(order)
+    mapped = map_row('orders', order)
+    out['orders'].append(mapped)
+
+    for worker in row.get('workers') or []:
+        if mapped.get('id') is not None and worker.get('id') is not None:
+            out['order_worker_association'].append({'order_id': mapped['id'], 'worker_id': int(worker['id'])})
+
+    return out
+
+
+# --- Writing -----------------------------------------------------------------
+
+class Importer:
+    def __init__(self, table='orders', batch_size=1000, commit_every=5, dry_run=False, source=None):
+        self.table = table
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.dry_run = dry_run
+        self.source = source
+        self.pending = {name: [] for name in FLUSH_ORDER}
+        self.pending_count = 0
+        self.batches_since_commit = 0
+        self.bill_numbers = {}
+        self.stats = {'rows': 0, 'imported': 0, 'skipped': 0, 'resumed_from': 0, 'errors': []}
+
+    def stub_bill(self, order):
+        """Bill id for an order that only carries a bill number."""
+        number = order.get('billnumberinput2', order.get('bill_number'))
+        if number is None:
+            raise ImportRowError('orders: missing bill_id and bill_number')
+        number = int(float(number))
+        if number in self.bill_numbers:
+            return self.bill_numbers[number]
+
+        existing = db.session.query(Order.bill_id).filter(Order.billnumberinput2 == number).first()
+        if existing:
+            bill_id = existing.bill_id
+        elif self.dry_run:
+            bill_id = -number
+        else:
+            order_date = coerce(Order.__table__.c.order_date, order.get('order_date'))
+            due_date = coerce(Order.__table__.c.due_date, order.get('due_date')) or order_date
+            bill = Bill(
+                customer_name=order.get('customer_name') or 'Unknown',
+                mobile_number=order.get('customer_mobile') or '',
+                date_issue=order_date, delivery_date=due_date, today_date=order_date, due_date=due_date,
+                total_amt=float(order.get('total_amount', order.get('total_amt')) or 0),
+                payment_mode=order.get('payment_mode') or '',
+                payment_status=order.get('payment_status') or 'pending',
+                payment_amount=float(order.get('advance_amount', order.get('payment_amount')) or 0),
+            )
+            db.session.add(bill)
+            db.session.flush()
+            bill_id = bill.id
+        self.bill_numbers[number] = bill_id
+        return bill_id
+
+    def add(self, row):
+        if not isinstance(row, dict):
+            raise ImportRowError(f'Expected an object, got {type(row).__name__}')
+        if self.table == 'orders':
+            mapped = expand_order_row(row, self.stub_bill)
+        else:
+            mapped = {self.table: [map_row(self.table, row)]}
+        for name, rows in mapped.items():
+            self.pending[name].extend(rows)
+            self.pending_count += len(rows)
+        if self.pending_count >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.dry_run:
+            for name in FLUSH_ORDER:
+                rows = self.pending[name]
+                if rows:
+                    # Group rows by their column set: one executemany per shape
+                    by_shape = {}
+                    for row in rows:
+                        by_shape.setdefault(tuple(sorted(row)), []).append(row)
+                    for shape_rows in by_shape.values():
+                        db.session.execute(insert_ignore(TABLES[name]), shape_rows)
+        self.pending = {name: [] for name in FLUSH_ORDER}
+        self.pending_count = 0
+        self.batches_since_commit += 1
+        if self.batches_since_commit >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        if self.dry_run:
+            db.session.rollback()
+        else:
+            if self.source:
+                checkpoint = db.session.get(ImportCheckpoint, self.source) or ImportCheckpoint(source=self.source)
+                checkpoint.rows_done = self.stats['rows']
+                db.session.add(checkpoint)
+            db.session.commit()
+        self.batches_since_commit = 0
+
+    def run(self, rows, resume=True):
+        skip = 0
+        if resume and self.source:
+            checkpoint = db.session.get(ImportCheckpoint, self.source)
+            skip = checkpoint.rows_done if checkpoint else 0
+        self.stats['resumed_from'] = skip
+
+        try:
+            for index, row in enumerate(rows):
+                if index < skip:
+                    continue
+                self.stats['rows'] = index + 1
+                try:
+                    self.add(row)
+                    self.stats['imported'] += 1
+                except ImportRowError as e:
+                    self.stats['skipped'] += 1
+                    if len(self.stats['errors']) < 50:
+                        self.stats['errors'].append({'row': index + 1, 'error': str(e)})
+            self.flush()
+            self.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return self.stats
+
+
+def import_stream(stream, fmt='json', table='orders', **options):
+    resume = options.pop('resume', True)
+    return Importer(table=table, **options).run(READERS[fmt](stream), resume=resume)
+
+
+@app.cli.command('import-data')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(sorted(READERS)), help='Defaults to the file extension.')
+@click.option('--table', type=click.Choice(['orders', 'bills', 'measurements', 'workers']), default='orders', show_default=True)
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--commit-every', default=5, show_default=True, help='Batches per commit / checkpoint.')
+@click.option('--dry-run', is_flag=True, help='Parse and validate only.')
+@click.option('--no-resume', is_flag=True, help='Ignore an existing checkpoint for this file.')
+def import_data_command(path, fmt, table, batch_size, commit_every, dry_run, no_resume):
+    """Import orders, bills, measurements or workers from an export file."""
+    with io.open(path, 'r', encoding='utf-8', newline='') as stream:
+        stats = import_stream(
+            stream, fmt or detect_format(path), table,
+            batch_size=batch_size, commit_every=commit_every, dry_run=dry_run,
+            source=f'file:{path}:{table}', resume=not no_resume,
+        )
+    click.echo(json.dumps(stats, indent=2))
@@ -0,0 +1,214 @@
+# Persistent background job queue.
+#
+# Routes enqueue jobs inside their own transaction (so a job exists if and only
+# if the write that produced it committed) and return immediately; a pool of
+# worker threads, optionally spread over several processes, runs them later.
+#
+# Start workers with:  flask --app back.app run-jobs --threads 4
+#
+# With several shops (tenancy.py) every worker polls each shop's queue in turn.
+import json
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import update
+
+from back.app import app, db
+from back.models import Job
+from back.tenancy import configured_shops, use_shop
+
+log = logging.getLogger(__name__)
+
+# kind -> (handler, batch_size)
+HANDLERS = {}
+
+
+def job_handler(kind, batch_size=1):
+    """Register `fn(payloads)` to run jobs of `kind`.
+
+    The handler receives a list of at most `batch_size` payloads. It may return
+    a list of per-payload errors (None for success); raising fails the whole
+    batch.
+    """
+    def decorator(fn):
+        HANDLERS[kind] = (fn, batch_size)
+        return fn
+    return decorator
+
+
+def enqueue(kind, payload, delay=0, max_attempts=None, unique_key=None, session=None):
+    # Added to the caller's session; it is committed together with their write
+    session = session or db.session
+    if unique_key is not None:
+        existing = session.query(Job).filter_by(unique_key=unique_key).first()
+        if existing is not None:
+            return existing
+
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        max_attempts=max_attempts or app.config['JOB_MAX_ATTEMPTS'],
+        unique_key=unique_key,
+    )
+    session.add(job)
+    return job
+
+
+def retry_delay(attempts):
+    # Exponential backoff with jitter, capped
+    base = app.config['JOB_RETRY_BASE_SECONDS']
+    delay = min(base * (2 ** (attempts - 1)), app.config['JOB_RETRY_MAX_SECONDS'])
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch():
+    """Atomically move a batch of due jobs of one kind to 'running'."""
+    now = datetime.utcnow()
+
+    # Jobs left 'running' by a crashed worker become claimable again
+    stale_before = now - timedelta(seconds=app.config['JOB_LOCK_TIMEOUT'])
+    db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.locked_at < stale_before)
+        .values(status='queued')
+    )
+
+    first = Job.query.filter(Job.status == 'queued', Job.run_at <= now)\
+        .order_by(Job.run_at, Job.id).first()
+    if first is None:
+        db.session.commit()
+        return []
+
+    _, batch_size = HANDLERS.get(first.kind, (None, 1))
+    candidates = Job.query.filter(Job.status == 'queued', Job.run_at <= now, Job.kind == first.kind)\
+        .order_by(Job.run_at, Job.id).limit(batch_size).all()
+
+    claimed = []
+    for job in candidates:
+        # Conditional update so two workers never claim the same job
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.status == 'queued')
+            .values(status='running', locked_at=now, attempts=Job.attempts + 1)
+        )
+        if result.rowcount == 1:
+            claimed.append(job.id)
+    db.session.commit()
+
+    return Job.query.filter(Job.id.in_(claimed)).order_by(Job.id).all() if claimed else []
+
+
+def finish(job, error=None):
+    if error is None:
+        job.status = 'done'
+        job.last_error = None
+    elif job.attempts >= job.max_attempts:
+        job.status = 'failed'
+        job.last_error = error
+    else:
+        job.status = 'queued'
+        job.last_error = error
+        job.run_at = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+    job.locked_at = None
+
+
+def run_batch(jobs):
+    kind = jobs[0].kind
+    handler, _ = HANDLERS.get(kind, (None, 1))
+    if handler is None:
+        errors = [f'No handler registered for {kind}'] * len(jobs)
+    else:
+        try:
+            errors = handler([json.loads(job.payload) for job in jobs]) or [None] * len(jobs)
+        except Exception as e:
+            log.exception('Job batch %s failed', kind)
+            errors = [str(e)] * len(jobs)
+
+    for job, error in zip(jobs, errors):
+        finish(job, error)
+    db.session.commit()
+
+
+def run_pending(max_batches=None):
+    """Run due jobs until the queue is empty. Returns the number of jobs run."""
+    count = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        jobs = claim_batch()
+        if not jobs:
+            break
+        run_batch(jobs)
+        count += len(jobs)
+        batches += 1
+    return count
+
+
+class JobWorker:
+    def __init__(self, threads=2, poll_interval=None):
+        self.threads = threads
+        self.poll_interval = poll_interval or app.config['JOB_POLL_INTERVAL']
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _loop(self):
+        with app.app_context():
+            while not self._stop.is_set():
+                ran = 0
+                for shop in configured_shops(app.config):
+                    with use_shop(db, shop):
+                        try:
+                            ran += run_pending(max_batches=1)
+                        except Exception:
+                            log.exception('Job worker iteration failed (shop %s)', shop)
+                            db.session.rollback()
+                if not ran:
+                    self._stop.wait(self.poll_interval)
+
+    def start(self):
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._loop, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_forever(self):
+        self.start()
+        try:
+            while any(thread.is_alive() for thread in self._threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+
+def _worker_process(threads):
+    # Don't reuse connections inherited from the parent process
+    with app.app_context():
+        db.engine.dispose(close=False)
+    JobWorker(threads=threads).run_forever()
+
+
+@app.cli.command('run-jobs')
+@click.option('--threads', default=2, show_default=True, help='Worker threads per process.')
+@click.option('--processes', default=1, show_default=True, help='Worker processes.')
+def run_jobs_command(threads, processes):
+    """Run background jobs until interrupted."""
+    if processes <= 1:
+        JobWorker(threads=threads).run_forever()
+        return
+
+    workers = [multiprocessing.Process(target=_worker_process, args=(threads,)) for _ in range(processes)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
@@ -0,0 +1,345 @@
+# Database upkeep: the tms-admin command group.
+#
+#   flask --app back.app tms-admin vacuum [--full]     give free pages back to the file system
+#   flask --app back.app tms-admin analyze [--full]    refresh planner statistics
+#   flask --app back.app tms-admin check [--quick]     integrity and foreign key checks
+#   flask --app back.app tms-admin stats               rows, size and indexes per table
+#   flask --app back.app tms-admin slow-queries        slowest statements seen by the app
+#   flask --app back.app tms-admin nightly [--schedule]
+#
+# Deleted orders, workers and archived rows leave free pages behind. New
+# databases are created with auto_vacuum=INCREMENTAL, so `vacuum` releases
+# them VACUUM_PAGES_PER_STEP at a time with a pause in between and never
+# locks the file for long; `vacuum --full` rebuilds the file once (and
+# switches an older database to incremental mode). `analyze` runs PRAGMA
+# optimize, which only re-analyzes tables whose statistics went stale.
+#
+# `nightly` runs a quick check, optimize and an incremental vacuum. With
+# --schedule it repeats from the job queue every MAINTENANCE_INTERVAL, waiting
+# until BUSINESS_HOURS (IST) are over.
+#
+# Every statement that takes SLOW_QUERY_MS or longer is appended to
+# SLOW_QUERY_LOG (one JSON line, rotated at SLOW_QUERY_LOG_MAX_BYTES);
+# `slow-queries` groups it by statement. SLOW_QUERY_MS=0 turns the log off.
+#
+# Postgres: vacuum and analyze issue VACUUM / ANALYZE; the other commands are
+# SQLite only.
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask import has_request_context, request
+from flask.cli import AppGroup
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from back.app import app, db
+from back.dates import in_business_hours, seconds_until_after_hours
+from back.jobs import enqueue, job_handler
+
+admin = AppGroup('tms-admin', help='Database maintenance.')
+app.cli.add_command(admin)
+
+
+def is_sqlite(engine):
+    return engine.url.get_backend_name() == 'sqlite'
+
+
+def sqlite_only(engine):
+    if not is_sqlite(engine):
+        raise click.ClickException('This command is only available for SQLite databases')
+
+
+def autocommit(engine):
+    # VACUUM (and Postgres ANALYZE) can't run inside a transaction
+    return engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+
+def pragma(conn, name):
+    return conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+
+def use_incremental_vacuum(engine):
+    """Create a new, empty SQLite database in incremental auto_vacuum mode."""
+    if not is_sqlite(engine):
+        return
+    with autocommit(engine) as conn:
+        # Only possible before the first table exists
+        if conn.exec_driver_sql("SELECT count(*) FROM sqlite_master").scalar() == 0:
+            conn.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+
+
+# Vacuum
+
+def vacuum(engine, full=False):
+    """Returns {'freed': pages, 'free_before', 'free_after', 'page_size', 'mode'}."""
+    if not is_sqlite(engine):
+        with autocommit(engine) as conn:
+            conn.exec_driver_sql('VACUUM (ANALYZE)' if full else 'VACUUM')
+        return {'mode': 'postgres'}
+
+    with autocommit(engine) as conn:
+        page_size = pragma(conn, 'page_size')
+        free_before = pragma(conn, 'freelist_count')
+        if full:
+            # Rebuilds the whole file; also the only way to switch auto_vacuum on
+            conn.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.exec_driver_sql('VACUUM')
+        elif pragma(conn, 'auto_vacuum') == 2:
+            step = app.config['VACUUM_PAGES_PER_STEP']
+            pause = app.config['VACUUM_STEP_SLEEP_MS'] / 1000
+            while pragma(conn, 'freelist_count') > 0:
+                # Each step is its own short write transaction
+                conn.exec_driver_sql(f'PRAGMA incremental_vacuum({step})')
+                time.sleep(pause)
+        free_after = pragma(conn, 'freelist_count')
+        mode = {0: 'none', 1: 'full', 2: 'incremental'}[pragma(conn, 'auto_vacuum')]
+    return {'freed': free_before - free_after, 'free_before': free_before, 'free_after': free_after,
+            'page_size': page_size, 'mode': mode}
+
+
+# Statistics
+
+def analyze(engine, full=False):
+    with autocommit(engine) as conn:
+        if not is_sqlite(engine):
+            conn.exec_driver_sql('ANALYZE')
+        elif full:
+            conn.exec_driver_sql('ANALYZE')
+        else:
+            # Re-analyzes only tables whose statistics are missing or stale
+            conn.exec_driver_sql('PRAGMA analysis_limit=1000')
+            conn.exec_driver_sql('PRAGMA optimize')
+
+
+def table_stats(engine):
+    """[{table, rows, bytes, indexes: [{name, bytes}]}], largest first."""
+    sqlite_only(engine)
+    with engine.connect() as conn:
+        tables = [row[0] for row in conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        indexes = defaultdict(list)
+        for name, table in conn.exec_driver_sql("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'"):
+            indexes[table].append(name)
+        try:
+            sizes = dict(conn.exec_driver_sql('SELECT name, sum(pgsize) FROM dbstat GROUP BY name').all())
+        except Exception:
+            # SQLite built without the dbstat table
+            sizes = {}
+        stats = []
+        for table in tables:
+            stats.append({
+                'table': table,
+                'rows': conn.exec_driver_sql(f'SELECT count(*) FROM "{table}"').scalar(),
+                'bytes': sizes.get(table),
+                'indexes': [{'name': name, 'bytes': sizes.get(name)} for name in sorted(indexes[table])],
+            })
+    return sorted(stats, key=lambda s: -(s['bytes'] or 0))
+
+
+# Checks
+
+def check(engine, quick=False):
+    """Returns (integrity problems, foreign key violations); empty lists when healthy."""
+    sqlite_only(engine)
+    with engine.connect() as conn:
+        rows = [row[0] for row in conn.exec_driver_sql('PRAGMA quick_check' if quick else 'PRAGMA integrity_check')]
+        problems = [] if rows == ['ok'] else rows
+        violations = [{'table': table, 'rowid': rowid, 'parent': parent}
+                      for table, rowid, parent, _ in conn.exec_driver_sql('PRAGMA foreign_key_check')]
+    return problems, violations
+
+
+# Slow queries
+
+slow_log_lock = threading.Lock()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    threshold = app.config['SLOW_QUERY_MS']
+    elapsed = (time.perf_counter() - started) * 1000
+    if not threshold or elapsed < threshold:
+        return
+    entry = {
+        'at': datetime.utcnow().isoformat(timespec='seconds'),
+        'ms': round(elapsed, 1),
+        'statement': statement,
+        'endpoint': request.endpoint if has_request_context() else None,
+    }
+    path = app.config['SLOW_QUERY_LOG']
+    try:
+        with slow_log_lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) > app.config['SLOW_QUERY_LOG_MAX_BYTES']:
+                os.replace(path, path + '.1')
+            with open(path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+    except OSError:
+        # Never fail a query because the log can't be written
+        pass
+
+
+@event.listens_for(Engine, 'handle_error')
+def drop_query_timer(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+
+def normalize(statement):
+    # Expanded IN lists differ only in their number of placeholders
+    statement = re.sub(r'\(\s*(?:\?|%\(\w+\)s)(?:\s*,\s*(?:\?|%\(\w+\)s))*\s*\)', '(…)', statement)
+    return ' '.join(statement.split())
+
+
+def slow_queries(limit=20):
+    """Slow statements grouped, by total time: [{statement, calls, total_ms, avg_ms, max_ms, endpoints}]."""
+    path = app.config['SLOW_QUERY_LOG']
+    groups = {}
+    for name in (path + '.1', path):
+        if not os.path.exists(name):
+            continue
+        with open(name) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                group = groups.setdefault(normalize(entry['statement']),
+                                          {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'endpoints': set()})
+                group['calls'] += 1
+                group['total_ms'] += entry['ms']
+                group['max_ms'] = max(group['max_ms'], entry['ms'])
+                if entry.get('endpoint'):
+                    group['endpoints'].add(entry['endpoint'])
+    ranked = sorted(groups.items(), key=lambda item: -item[1]['total_ms'])[:limit]
+    return [{'statement': statement, 'calls': g['calls'], 'total_ms': round(g['total_ms'], 1),
+             'avg_ms': round(g['total_ms'] / g['calls'], 1), 'max_ms': g['max_ms'],
+             'endpoints': sorted(g['endpoints'])} for statement, g in ranked]
+
+
+# Nightly run
+
+def nightly(engine):
+    """Quick check, optimize, incremental vacuum. Returns a summary."""
+    summary = {}
+    if is_sqlite(engine):
+        problems, violations = check(engine, quick=True)
+        summary.update(problems=len(problems), fk_violations=len(violations))
+        if problems:
+            # Leave a damaged file alone; restore from a backup instead
+            app.logger.error('Database check failed, skipping maintenance: %s', '; '.join(problems[:5]))
+            return summary
+    analyze(engine)
+    summary['vacuum'] = vacuum(engine)
+    return summary
+
+
+def schedule_next(delay=None):
+    delay = app.config['MAINTENANCE_INTERVAL'] if delay is None else delay
+    run_at = datetime.utcnow() + timedelta(seconds=delay)
+    enqueue('db.maintenance', {}, delay=delay, unique_key=f"db.maintenance:{run_at.strftime('%Y%m%dT%H')}")
+
+
+@job_handler('db.maintenance')
+def run_maintenance_job(payloads):
+    if in_business_hours():
+        # Try again once the shop has closed
+        schedule_next(seconds_until_after_hours())
+    else:
+        db.session.commit()  # VACUUM needs every transaction on the file finished
+        app.logger.info('Database maintenance: %s', nightly(db.engine))
+        schedule_next()
+    db.session.commit()
+
+
+@admin.command('vacuum')
+@click.option('--full', is_flag=True, help='Rebuild the whole file (locks it; run with the app stopped).')
+def vacuum_command(full):
+    """Release free pages back to the file system."""
+    result = vacuum(db.engine, full=full)
+    if result['mode'] == 'postgres':
+        click.echo('VACUUM done')
+        return
+    click.echo(f"Freed {result['freed']} pages ({result['freed'] * result['page_size'] // 1024} KiB), "
+               f"{result['free_after']} free pages left, auto_vacuum={result['mode']}")
+    if result['mode'] == 'none':
+        click.echo('auto_vacuum is off: run `tms-admin vacuum --full` once to switch to incremental mode')
+
+
+@admin.command('analyze')
+@click.option('--full', is_flag=True, help='ANALYZE every table instead of PRAGMA optimize.')
+def analyze_command(full):
+    """Refresh query planner statistics."""
+    started = time.perf_counter()
+    analyze(db.engine, full=full)
+    click.echo(f"{'ANALYZE' if full else 'optimize'} done in {round((time.perf_counter() - started) * 1000)} ms")
+
+
+@admin.command('check')
+@click.option('--quick', is_flag=True, help='PRAGMA quick_check instead of the full integrity_check.')
+def check_command(quick):
+    """Check the file's integrity and foreign keys. Exits 1 on problems."""
+    problems, violations = check(db.engine, quick=quick)
+    for problem in problems:
+        click.echo(f'integrity: {problem}')
+    for violation in violations:
+        click.echo(f"foreign key: {violation['table']} row {violation['rowid']} -> missing {violation['parent']}")
+    if problems or violations:
+        raise SystemExit(1)
+    click.echo('ok')
+
+
+@admin.command('stats')
+def stats_command():
+    """Rows, size and index sizes per table."""
+    def size(value):
+        return '?' if value is None else f'{value / 1024:.0f} KiB'
+
+    sqlite_only(db.engine)
+    with db.engine.connect() as conn:
+        pages, page_size, free = (pragma(conn, name) for name in ('page_count', 'page_size', 'freelist_count'))
+    click.echo(f'{pages * page_size / 1024:.0f} KiB in {pages} pages, {free} free')
+    for table in table_stats(db.engine):
+        click.echo(f"{table['table']:<32} {table['rows']:>10} rows  {size(table['bytes']):>12}")
+        for index in table['indexes']:
+            click.echo(f"    {index['name']:<40} {size(index['bytes']):>12}")
+
+
+@admin.command('slow-queries')
+@click.option('--limit', default=20, show_default=True)
+@click.option('--reset', is_flag=True, help='Clear the log afterwards.')
+def slow_queries_command(limit, reset):
+    """Statements slower than SLOW_QUERY_MS, by total time."""
+    for query in slow_queries(limit):
+        click.echo(f"{query['total_ms']:>10.1f} ms  {query['calls']:>6} calls  avg {query['avg_ms']:.1f}  "
+                   f"max {query['max_ms']:.1f}  {', '.join(query['endpoints'])}")
+        click.echo(f"    {query['statement'][:300]}")
+    if reset:
+        path = app.config['SLOW_QUERY_LOG']
+        with slow_log_lock:
+            for name in (path, path + '.1'):
+                if os.path.exists(name):
+                    os.remove(name)
+
+
+@admin.command('nightly')
+@click.option('--schedule', is_flag=True, help='Also repeat every MAINTENANCE_INTERVAL, outside business hours.')
+def nightly_command(schedule):
+    """Quick check, optimize and incremental vacuum."""
+    click.echo(json.dumps(nightly(db.engine)))
+    if schedule:
+        schedule_next()
+        db.session.commit()
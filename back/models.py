@@ -1,5 +1,6 @@
 from datetime import date, datetime
 from back.app import db
+from back.enums import GARMENT, ORDER_STATUS, PAYMENT_MODE, PAYMENT_STATUS, CodedEnum
 
 # Association table remains unchanged
 order_worker_association = db.Table(
@@ -81,7 +82,7 @@ class Bill(db.Model):
     __tablename__ = 'bills'
     id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(100), nullable=False)
-    mobile_number = db.Column(db.String(15), nullable=False)
+    mobile_number = db.Column(db.String(15), nullable=False, index=True)
     date_issue = db.Column(db.Date, nullable=False)
     delivery_date = db.Column(db.Date, nullable=False)
     suit_qty = db.Column(db.Integer, default=0)
@@ -93,9 +94,14 @@ class Bill(db.Model):
     today_date = db.Column(db.Date, nullable=False)
     due_date = db.Column(db.Date, nullable=False)
     total_amt = db.Column(db.Float, nullable=False)
-    payment_mode = db.Column(db.String(50), nullable=False)
-    payment_status = db.Column(db.String(50), nullable=False)
+    payment_mode = db.Column(CodedEnum(PAYMENT_MODE), nullable=False)
+    payment_status = db.Column(CodedEnum(PAYMENT_STATUS), nullable=False)
     payment_amount = db.Column(db.Float, default=0)
+    # Issued by back/billnumbers.py; replaces the float Order.billnumberinput2
+    bill_number = db.Column(db.Integer, nullable=True, unique=True, index=True)
+    # Optimistic concurrency (back/versioning.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
 
     # Relationship with orders
     orders = db.relationship('Order', backref='bill', lazy=True)
@@ -118,7 +124,9 @@ class Bill(db.Model):
             'total_amt': self.total_amt,
             'payment_mode': self.payment_mode,
             'payment_status': self.payment_status,
-            'payment_amount': self.payment_amount
+            'payment_amount': self.payment_amount,
+            'bill_number': self.bill_number,
+            'version': self.version
         }
 class Worker(db.Model):
     __tablename__ = 'workers'
@@ -135,23 +143,31 @@ class Worker(db.Model):
     worker_expense = db.relationship('Worker_Expense', backref='worker', lazy=True)
 
 
+# Predicates of the partial indexes below. back/alerts.py filters with this
+# exact text so the planner can match them to the index.
+OPEN_ORDER = f"status NOT IN ({ORDER_STATUS.encode('delivered')}, {ORDER_STATUS.encode('cancelled')})"
+AWAITING_PAYMENT = (f"status IN ({ORDER_STATUS.encode('completed')}, {ORDER_STATUS.encode('delivered')}) "
+                    f"AND payment_status NOT IN ({PAYMENT_STATUS.encode('paid')}, {PAYMENT_STATUS.encode('cancelled')})")
+
 class Order(db.Model):
     __tablename__ = 'orders'
     id = db.Column(db.Integer, primary_key=True)
-    garment_type = db.Column(db.String(50), nullable=False)
-    status = db.Column(db.String(50), nullable=False)
+    garment_type = db.Column(CodedEnum(GARMENT), nullable=False)
+    status = db.Column(CodedEnum(ORDER_STATUS), nullable=False)
     order_date = db.Column(db.Date, nullable=False)
     due_date = db.Column(db.Date, nullable=False)
     total_amt = db.Column(db.Float, nullable=False)
-    payment_mode = db.Column(db.String(50), nullable=False)
-    payment_status = db.Column(db.String(50), nullable=False)
+    payment_mode = db.Column(CodedEnum(PAYMENT_MODE), nullable=False)
+    payment_status = db.Column(CodedEnum(PAYMENT_STATUS), nullable=False)
     payment_amount = db.Column(db.Float, nullable=False)
-    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow, index=True)  # UTC
     Work_pay = db.Column(db.Float, nullable=True)
     billnumberinput2 = db.Column(db.Float, nullable=True)
 
     # ForeignKey to Bill table
     bill_id = db.Column(db.Integer, db.ForeignKey('bills.id'), nullable=False)
+    # Optimistic concurrency (back/versioning.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     # Many-to-many relationship with Worker
     workers = db.relationship(
@@ -173,13 +189,46 @@ class Order(db.Model):
             'payment_amount': self.payment_amount,
             'Work_pay': self.Work_pay,
             'billnumberinput2': self.billnumberinput2,
-            'worker_ids': [worker.id for worker in self.workers]  # Include worker IDs in dictionary
+            'worker_ids': [worker.id for worker in self.workers],  # Include worker IDs in dictionary
+            'version': self.version
         }
+
+    # Status/payment filters (profit, archival) run on the coded columns;
+    # the delivery calendar (route26.py) is answered from the due-date index alone
+    __table_args__ = (
+        db.Index('ix_orders_status_payment_status', 'status', 'payment_status'),
+        # A bill's orders (the audit reads them by bill id range)
+        db.Index('ix_orders_bill_id', 'bill_id'),
+        db.Index('ix_orders_due_date_garment_status', 'due_date', 'garment_type', 'status'),
+        # Overdue / due-soon and finished-but-unpaid lists only index the rows they can return
+        db.Index('ix_orders_open_due_date', 'due_date',
+                 sqlite_where=db.text(OPEN_ORDER), postgresql_where=db.text(OPEN_ORDER)),
+        db.Index('ix_orders_awaiting_payment', 'updated_at',
+                 sqlite_where=db.text(AWAITING_PAYMENT), postgresql_where=db.text(AWAITING_PAYMENT)),
+    )
+    __mapper_args__ = {'version_id_col': version}
     
+# Archive copies of completed orders and their worker links (see back/archive.py).
+# Built from the live table definitions so the two can never drift apart.
+orders_archive = db.Table(
+    'orders_archive',
+    *[column._copy() for column in Order.__table__.columns],
+    db.Column('archived_at', db.DateTime, default=datetime.utcnow),
+    db.Index('ix_orders_archive_bill_id', 'bill_id'),
+    db.Index('ix_orders_archive_order_date', 'order_date'),
+    db.Index('ix_orders_archive_due_date', 'due_date'),
+)
+
+order_worker_association_archive = db.Table(
+    'order_worker_association_archive',
+    db.Column('order_id', db.Integer, primary_key=True),
+    db.Column('worker_id', db.Integer, primary_key=True, index=True)
+)
+
 class Worker_Expense(db.Model):
     __tablename__ = 'Worker_Expense'
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     Amt_Paid = db.Column(db.Float, nullable=False)
     worker_id = db.Column(db.Integer, db.ForeignKey('workers.id'), nullable=True)
@@ -188,7 +237,7 @@ class Daily_Expenses(db.Model):
     __tablename__ = 'Daily_Expenses'
 
     id = db.Column(db.Integer, primary_key=True)
-    Date = db.Column(db.Date, nullable=False)
+    Date = db.Column(db.Date, nullable=False, index=True)
     material_cost = db.Column(db.Float)
     material_type = db.Column(db.String(100))
     miscellaneous_Cost = db.Column(db.Float)  # Ensure this matches exactly
@@ -196,3 +245,160 @@ class Daily_Expenses(db.Model):
     chai_pani_cost = db.Column(db.Float)
     # worker_id = db.Column(db.Integer, db.ForeignKey('workers.id'))
     Total_Pay = db.Column(db.Float, nullable=True)
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON encoded
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    # Optional de-duplication key: at most one job is ever enqueued per key
+    unique_key = db.Column(db.String(200), nullable=True, unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+
+    # Workers poll for due jobs by (status, run_at)
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+
+class ImportCheckpoint(db.Model):
+    __tablename__ = 'import_checkpoints'
+    source = db.Column(db.String(255), primary_key=True)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ReplicationCheckpoint(db.Model):
+    __tablename__ = 'replication_checkpoints'
+    peer = db.Column(db.String(64), primary_key=True)  # hash of the other store's URL + direction
+    table_name = db.Column(db.String(100), primary_key=True)
+    max_id = db.Column(db.Integer, nullable=True)
+    max_changed_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class EnumValue(db.Model):
+    # Lookup table for the coded enum columns (see back/enums.py)
+    __tablename__ = 'enum_values'
+    kind = db.Column(db.String(50), primary_key=True)
+    code = db.Column(db.SmallInteger, primary_key=True)
+    label = db.Column(db.String(50), nullable=False)
+
+class BillSequence(db.Model):
+    __tablename__ = 'bill_sequence'
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+
+class BillNumberLease(db.Model):
+    # Blocks of bill numbers handed to offline devices
+    __tablename__ = 'bill_number_leases'
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.String(100), nullable=False, index=True)
+    first_number = db.Column(db.Integer, nullable=False)
+    last_number = db.Column(db.Integer, nullable=False)
+    leased_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class WorkerLedgerEntry(db.Model):
+    # One order share earned by, or one payment made to, a worker (see back/statements.py)
+    __tablename__ = 'worker_ledger'
+    id = db.Column(db.Integer, primary_key=True)
+    worker_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # order, payment
+    ref_id = db.Column(db.Integer, nullable=False)  # orders.id / Worker_Expense.id
+    amount = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_worker_ledger_worker_day', 'worker_id', 'day'),
+        db.Index('ix_worker_ledger_ref', 'kind', 'ref_id'),
+    )
+
+class WorkerWeek(db.Model):
+    # Per worker and week (starting Sunday): amounts plus running totals up to that week
+    __tablename__ = 'worker_weeks'
+    worker_id = db.Column(db.Integer, primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)
+    earned = db.Column(db.Float, nullable=False, default=0.0)
+    paid = db.Column(db.Float, nullable=False, default=0.0)
+    cum_earned = db.Column(db.Float, nullable=False, default=0.0)
+    cum_paid = db.Column(db.Float, nullable=False, default=0.0)
+
+class CustomerSummary(db.Model):
+    # Lifetime totals per customer, kept current by bill writes (see back/customers.py)
+    __tablename__ = 'customer_summaries'
+    mobile_number = db.Column(db.String(15), primary_key=True)
+    customer_name = db.Column(db.String(100), nullable=False)
+    visits = db.Column(db.Integer, nullable=False, default=0)
+    total_spent = db.Column(db.Float, nullable=False, default=0.0, index=True)
+    total_paid = db.Column(db.Float, nullable=False, default=0.0)
+    outstanding = db.Column(db.Float, nullable=False, default=0.0, index=True)
+    first_visit = db.Column(db.Date, nullable=True)
+    last_visit = db.Column(db.Date, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def as_dict(self):
+        return {
+            'mobile_number': self.mobile_number,
+            'customer_name': self.customer_name,
+            'visits': self.visits,
+            'total_spent': self.total_spent,
+            'total_paid': self.total_paid,
+            'outstanding': self.outstanding,
+            'first_visit': self.first_visit.isoformat() if self.first_visit else None,
+            'last_visit': self.last_visit.isoformat() if self.last_visit else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class CalendarDay(db.Model):
+    # Date dimension for bucketing reports in SQL (see back/dates.py)
+    __tablename__ = 'calendar_days'
+    day = db.Column(db.Date, primary_key=True)
+    week_start_sun = db.Column(db.Date, nullable=False, index=True)
+    week_start_mon = db.Column(db.Date, nullable=False, index=True)
+    month_start = db.Column(db.Date, nullable=False, index=True)
+    fiscal_year = db.Column(db.Integer, nullable=False)  # 2025 = April 2025 - March 2026
+
+class OrderAlert(db.Model):
+    # An order found overdue, due soon or awaiting payment (see back/alerts.py)
+    __tablename__ = 'order_alerts'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # overdue, due_soon, awaiting_payment
+    order_id = db.Column(db.Integer, nullable=False)
+    detected_at = db.Column(db.DateTime, default=datetime.utcnow)
+    notified_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'order_id', name='uq_order_alerts_kind_order'),
+        db.Index('ix_order_alerts_kind_notified', 'kind', 'notified_at'),
+    )
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'order_id': self.order_id,
+            'detected_at': self.detected_at.isoformat() if self.detected_at else None,
+            'notified_at': self.notified_at.isoformat() if self.notified_at else None
+        }
+
+class AlertScan(db.Model):
+    # How far each alert kind has been scanned
+    __tablename__ = 'alert_scans'
+    kind = db.Column(db.String(20), primary_key=True)
+    watermark = db.Column(db.DateTime, nullable=False)
+
+class IdempotencyKey(db.Model):
+    # The response to a write sent with an Idempotency-Key header (see back/idempotency.py)
+    __tablename__ = 'idempotency_keys'
+    key = db.Column(db.String(255), primary_key=True)
+    endpoint = db.Column(db.String(100), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of method, path and body
+    status_code = db.Column(db.Integer, nullable=True)  # None while the first attempt runs
+    body = db.Column(db.Text, nullable=True)
+    mimetype = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Replays stop (and the row may be purged) after this; while the first
+    # attempt runs it is the point at which that attempt counts as abandoned
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
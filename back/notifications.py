@@ -0,0 +1,102 @@
+# Customer / worker notifications, sent from background jobs (see back/jobs.py)
+# so no HTTP request ever waits on the WhatsApp API.
+import requests
+
+from back.app import app, db
+from back.jobs import enqueue, job_handler
+from back.models import Bill, Order
+
+
+def whatsapp_configured():
+    return bool(app.config.get('WHATSAPP_API_URL') and app.config.get('WHATSAPP_TOKEN'))
+
+
+def format_phone(phone_number):
+    # Same rule as whatsappService.js: default to the Indian country code
+    return phone_number if phone_number.startswith('+') else f'+91{phone_number}'
+
+
+def completion_message(bill, orders):
+    details = '\n'.join(f'• {order.garment_type}: 1 piece(s)' for order in orders) or '• Order details not available'
+    return f"""🎉 *Order Completed!*
+
+Dear {bill.customer_name or 'Customer'},
+
+Your order (Bill #{bill.id}) has been completed and is ready for delivery!
+
+*Order Details:*
+{details}
+
+Please visit our shop to collect your order.
+
+Thank you for choosing our services!
+
+Best regards,
+Yak's Men's Wear"""
+
+
+def bill_received_message(bill):
+    return f"""Dear {bill.customer_name or 'Customer'},
+
+We have received your order (Bill #{bill.id}) for {bill.total_qty or 0} garment(s).
+Expected delivery date: {bill.delivery_date.strftime('%d-%m-%Y') if bill.delivery_date else 'N/A'}
+
+Thank you for choosing our services!
+
+Best regards,
+Yak's Men's Wear"""
+
+
+@job_handler('bill.created')
+def on_bill_created(payloads):
+    for payload in payloads:
+        bill = db.session.get(Bill, payload['bill_id'])
+        if bill and whatsapp_configured() and app.config.get('WHATSAPP_NOTIFY_NEW_BILL'):
+            enqueue('whatsapp.send', {'to': bill.mobile_number, 'message': bill_received_message(bill)},
+                    unique_key=f'bill-received:{bill.id}')
+    db.session.commit()
+
+
+@job_handler('order.status_changed')
+def on_order_status_changed(payloads):
+    for payload in payloads:
+        if payload.get('status') != 'completed':
+            continue
+        order = db.session.get(Order, payload['order_id'])
+        if not order or not whatsapp_configured():
+            continue
+
+        # Notify once per bill, when its last order is completed
+        orders = Order.query.filter_by(bill_id=order.bill_id).all()
+        if all(o.status == 'completed' for o in orders):
+            bill = db.session.get(Bill, order.bill_id)
+            enqueue('whatsapp.send', {'to': bill.mobile_number, 'message': completion_message(bill, orders)},
+                    unique_key=f'bill-completed:{bill.id}')
+    db.session.commit()
+
+
+@job_handler('whatsapp.send', batch_size=20)
+def send_whatsapp_messages(payloads):
+    if not whatsapp_configured():
+        raise RuntimeError('WhatsApp API is not configured')
+
+    # One keep-alive connection for the whole batch
+    errors = []
+    with requests.Session() as session:
+        session.headers.update({
+            'Authorization': f"Bearer {app.config['WHATSAPP_TOKEN']}",
+            'Content-Type': 'application/json',
+        })
+        for payload in payloads:
+            try:
+                response = session.post(app.config['WHATSAPP_API_URL'], json={
+                    'messaging_product': 'whatsapp',
+                    'to': format_phone(payload['to']),
+                    'type': 'text',
+                    'text': {'body': payload['message']},
+                }, timeout=app.config['WHATSAPP_TIMEOUT'])
+                response.raise_for_status()
+                errors.append(None)
+            except requests.RequestException as e:
+                errors.append(str(e))
+    return errors
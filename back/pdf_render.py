@@ -0,0 +1,171 @@
+# PDF layouts for bills and measurement cards.
+#
+# Plain functions over plain dicts (no Flask, no database) so they can run in
+# worker processes; see route20.py for the cache and the HTTP endpoints.
+import io
+from datetime import date
+
+from reportlab.lib.pagesizes import A4, A5
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+SHOP_NAME = "Yak's Men's Wear"
+
+# Bill column -> label, in the order the client-side bill prints them
+GARMENTS = [
+    ('suit_qty', 'Suit'),
+    ('safari_qty', 'Safari/Jacket'),
+    ('pant_qty', 'Pant'),
+    ('shirt_qty', 'Shirt'),
+    ('sadri_qty', 'Sadri'),
+]
+
+PANT_FIELDS = [
+    ('pant_length', 'Length'), ('pant_kamar', 'Kamar'), ('pant_hips', 'Hips'),
+    ('pant_waist', 'Waist'), ('pant_ghutna', 'Ghutna'), ('pant_bottom', 'Bottom'),
+    ('pant_seat', 'Seat'), ('SideP_Cross', 'SideP/Cross'), ('Plates', 'Plates'),
+    ('Belt', 'Belt'), ('Back_P', 'Back P.'), ('WP', 'WP.'),
+]
+
+SHIRT_FIELDS = [
+    ('shirt_length', 'Length'), ('shirt_body', 'Body'), ('shirt_loose', 'Loose'),
+    ('shirt_shoulder', 'Shoulder'), ('shirt_astin', 'Astin'), ('shirt_collar', 'Collar'),
+    ('shirt_aloose', 'A.Loose'), ('Callar', 'Collar'), ('Cuff', 'Cuff'),
+    ('Pkt', 'Pkt'), ('LooseShirt', 'Loose'), ('DT_TT', 'DT/TT'),
+]
+
+
+def format_date(value):
+    # ISO date string -> dd-mm-yyyy, like formatDateForReceipt in billGenerator.js
+    if not value:
+        return 'N/A'
+    try:
+        return date.fromisoformat(value).strftime('%d-%m-%Y')
+    except ValueError:
+        return value
+
+
+def format_amount(value):
+    return f'Rs. {value or 0:,.2f}'
+
+
+def bill_number(doc):
+    for order in doc['orders']:
+        if order.get('billnumberinput2'):
+            return int(order['billnumberinput2'])
+    return doc['bill']['id']
+
+
+def draw_measurements(pdf, x, y, title, fields, measurements):
+    pdf.setFont('Helvetica-Bold', 12)
+    pdf.drawString(x, y, title)
+    pdf.setFont('Helvetica', 10)
+    y -= 7 * mm
+    for i, (key, label) in enumerate(fields):
+        value = measurements.get(key)
+        col_x = x + (i % 3) * 55 * mm
+        pdf.rect(col_x, y - 3 * mm, 52 * mm, 8 * mm)
+        pdf.drawString(col_x + 2 * mm, y, f"{label}: {'' if value in (None, '') else value}")
+        if i % 3 == 2:
+            y -= 10 * mm
+    return y - 6 * mm
+
+
+def render_bill(doc, image_path=None):
+    bill = doc['bill']
+    buffer = io.BytesIO()
+    width, height = A5
+    pdf = canvas.Canvas(buffer, pagesize=A5)
+    pdf.setTitle(f'Bill {bill_number(doc)}')
+
+    pdf.setFont('Helvetica-Bold', 16)
+    pdf.drawCentredString(width / 2, height - 15 * mm, SHOP_NAME)
+    if image_path:
+        pdf.drawImage(image_path, width - 30 * mm, height - 35 * mm, 20 * mm, 26 * mm, preserveAspectRatio=True)
+
+    pdf.setFont('Helvetica', 10)
+    y = height - 28 * mm
+    for label, value in [
+        ('Bill No', bill_number(doc)),
+        ('Customer', bill['customer_name']),
+        ('Mobile', bill['mobile_number']),
+        ('Order Date', format_date(bill['date_issue'])),
+        ('Delivery Date', format_date(bill['delivery_date'])),
+    ]:
+        pdf.drawString(12 * mm, y, f'{label}: {value}')
+        y -= 6 * mm
+
+    y -= 4 * mm
+    pdf.setFont('Helvetica-Bold', 10)
+    pdf.drawString(12 * mm, y, 'Garment')
+    pdf.drawRightString(width - 12 * mm, y, 'Qty')
+    pdf.line(12 * mm, y - 2 * mm, width - 12 * mm, y - 2 * mm)
+    pdf.setFont('Helvetica', 10)
+    y -= 8 * mm
+    for key, label in GARMENTS:
+        if bill.get(key):
+            pdf.drawString(12 * mm, y, label)
+            pdf.drawRightString(width - 12 * mm, y, str(bill[key]))
+            y -= 6 * mm
+    pdf.line(12 * mm, y + 3 * mm, width - 12 * mm, y + 3 * mm)
+
+    total = bill['total_amt'] or 0
+    advance = bill['payment_amount'] or 0
+    y -= 4 * mm
+    for label, value in [
+        ('Total Qty', str(bill['total_qty'] or 0)),
+        ('Total', format_amount(total)),
+        ('Advance', format_amount(advance)),
+        ('Balance', format_amount(total - advance)),
+        ('Payment', f"{bill['payment_mode'] or ''} / {bill['payment_status'] or ''}"),
+    ]:
+        pdf.drawString(12 * mm, y, label)
+        pdf.drawRightString(width - 12 * mm, y, value)
+        y -= 6 * mm
+
+    pdf.setFont('Helvetica-Oblique', 9)
+    pdf.drawCentredString(width / 2, 12 * mm, 'Thank you for choosing our services!')
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def render_measurement_card(doc, image_path=None):
+    bill = doc['bill']
+    measurements = doc['measurements'] or {}
+    buffer = io.BytesIO()
+    width, height = A4
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle(f'Measurements {bill_number(doc)}')
+
+    pdf.setFont('Helvetica-Bold', 16)
+    pdf.drawCentredString(width / 2, height - 20 * mm, 'Customer Measurement Sheet')
+    pdf.setFont('Helvetica', 11)
+    pdf.drawString(20 * mm, height - 32 * mm, f"Bill No: {bill_number(doc)}    Customer: {bill['customer_name']}")
+    pdf.drawString(20 * mm, height - 39 * mm, f"Mobile: {bill['mobile_number']}    Due: {format_date(bill['due_date'])}")
+    if image_path:
+        pdf.drawImage(image_path, width - 50 * mm, height - 60 * mm, 30 * mm, 40 * mm, preserveAspectRatio=True)
+
+    y = height - 70 * mm
+    y = draw_measurements(pdf, 20 * mm, y, 'PANT', PANT_FIELDS, measurements)
+    y = draw_measurements(pdf, 20 * mm, y, 'SHIRT', SHIRT_FIELDS, measurements)
+
+    if measurements.get('extra_measurements'):
+        pdf.setFont('Helvetica-Bold', 12)
+        pdf.drawString(20 * mm, y, 'Notes')
+        pdf.setFont('Helvetica', 10)
+        pdf.drawString(20 * mm, y - 7 * mm, measurements['extra_measurements'][:120])
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    'bill': render_bill,
+    'measurements': render_measurement_card,
+}
+
+
+def render(kind, doc, image_path=None):
+    return RENDERERS[kind](doc, image_path)
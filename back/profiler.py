@@ -0,0 +1,221 @@
+# On-demand request profiling.
+#
+# A single sampler thread reads the stacks of the request threads being
+# profiled every PROFILE_INTERVAL_MS (sys._current_frames), so nothing is
+# instrumented and unprofiled requests pay nothing. A request is profiled when
+#
+#   * it carries an admin token and "X-Profile: 1" (or ?_profile=1), or
+#   * PROFILE_SLOW_MS is set: every request is sampled and the profile is kept
+#     only if the request took at least that long.
+#
+# Profiles are stored as JSON (collapsed stacks + request details) in
+# PROFILE_DIR, newest PROFILE_KEEP kept, and served by route24.py as collapsed
+# stacks (flamegraph.pl / speedscope) or speedscope JSON.
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlencode
+
+from flask import g, request
+
+from back.app import app
+from back.auth import is_admin
+
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+
+
+class Capture:
+    def __init__(self):
+        self.stacks = Counter()
+        self.started = time.perf_counter()
+
+
+class Sampler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.captures = {}  # thread id -> Capture
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start_capture(self, thread_id):
+        capture = Capture()
+        with self.lock:
+            self.captures[thread_id] = capture
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run_forever, name='profiler', daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+        return capture
+
+    def stop_capture(self, thread_id):
+        with self.lock:
+            return self.captures.pop(thread_id, None)
+
+    def run_forever(self):
+        while True:
+            with self.lock:
+                active = dict(self.captures)
+            if not active:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            for thread_id, capture in active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    capture.stacks[collapse(frame)] += 1
+            time.sleep(app.config['PROFILE_INTERVAL_MS'] / 1000)
+
+
+sampler = Sampler()
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def requested():
+    flag = request.headers.get('X-Profile') or request.args.get('_profile')
+    return flag in ('1', 'true') and is_admin()
+
+
+@app.before_request
+def start_profile():
+    if request.path.startswith('/api/_profiles'):
+        return
+    forced = requested()
+    if forced or app.config['PROFILE_SLOW_MS']:
+        g.profile_forced = forced
+        g.profile_capture = sampler.start_capture(threading.get_ident())
+
+
+@app.after_request
+def finish_profile(response):
+    capture = g.pop('profile_capture', None)
+    if capture is None:
+        return response
+    sampler.stop_capture(threading.get_ident())
+    duration_ms = (time.perf_counter() - capture.started) * 1000
+    if g.pop('profile_forced', False) or duration_ms >= app.config['PROFILE_SLOW_MS']:
+        try:
+            response.headers['X-Profile-Id'] = save(capture, duration_ms, response.status_code)
+        except OSError as e:
+            app.logger.warning('Could not store profile: %s', e)
+    return response
+
+
+@app.teardown_request
+def drop_profile(_):
+    # The view raised before after_request ran
+    if g.pop('profile_capture', None) is not None:
+        sampler.stop_capture(threading.get_ident())
+
+
+def saved_path():
+    # Profiles outlive the request and are listed to other admins; keep the token out
+    query = urlencode([(key, value) for key, value in request.args.items(multi=True) if key != 'admin_token'])
+    return f'{request.path}?{query}' if query else request.path
+
+
+def save(capture, duration_ms, status):
+    directory = app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    profile = {
+        'id': profile_id,
+        'created_at': datetime.utcnow().isoformat(),
+        'method': request.method,
+        'path': saved_path(),
+        'endpoint': request.endpoint,
+        'status': status,
+        'duration_ms': round(duration_ms, 1),
+        'interval_ms': app.config['PROFILE_INTERVAL_MS'],
+        'samples': sum(capture.stacks.values()),
+        'stacks': dict(capture.stacks),
+    }
+    path = os.path.join(directory, profile_id + '.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(profile, f)
+    os.replace(path + '.tmp', path)
+    prune(directory)
+    return profile_id
+
+
+def prune(directory):
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    for name in names[:-app.config['PROFILE_KEEP']]:
+        os.remove(os.path.join(directory, name))
+
+
+def list_profiles():
+    directory = app.config['PROFILE_DIR']
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            profile = load_profile(name[:-5])
+            if profile:
+                profile.pop('stacks')
+                profiles.append(profile)
+    return profiles
+
+
+def load_profile(profile_id):
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(app.config['PROFILE_DIR'], profile_id + '.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def to_collapsed(profile):
+    """Brendan Gregg's folded format: one 'root;...;leaf count' line per stack."""
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(profile['stacks'].items()))
+
+
+def to_speedscope(profile):
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, count in profile['stacks'].items():
+        sample = []
+        for name in stack.split(';'):
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({'name': name})
+            sample.append(index[name])
+        samples.append(sample)
+        weights.append(count * profile['interval_ms'])
+    title = f"{profile['method']} {profile['path']} ({profile['duration_ms']} ms)"
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': title,
+        'exporter': 'tms-backend',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': title,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
@@ -0,0 +1,141 @@
+# Read-only engine for heavy reports.
+#
+# Report routes that opt in (REPORT_ENDPOINTS) read through report_session()
+# instead of db.session, so a long scan never holds up new_bill. Modes
+# (REPORT_DATABASE_MODE):
+#
+#   off       reports use db.session, as before (default)
+#   wal       the SQLite file is switched to WAL and reports run in their own
+#             read-only connections, each inside one read transaction: a
+#             consistent snapshot that never blocks (or is blocked by) writers
+#   snapshot  reports read a copy of the database made with the SQLite backup
+#             API, refreshed once it is older than REPORT_MAX_STALENESS
+#   replica   reports read REPORT_DATABASE_URI (e.g. a Postgres read replica);
+#             when the replica lags more than REPORT_MAX_STALENESS they fall
+#             back to the primary
+#
+# The read-only engines belong to the default database; reports for another
+# shop (tenancy.py) read that shop's own database through db.session.
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+from flask import request
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from back.app import app, db
+from back.tenancy import current_shop
+
+
+def snapshot_transactions(engine):
+    # pysqlite only opens a transaction before writes; open one ourselves so
+    # every query in a report sees the same committed state
+    @event.listens_for(engine, 'connect')
+    def autocommit_driver(dbapi_connection, _):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+
+class ReportEngine:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.engine = None
+        self.refreshed_at = 0
+        self.replica_checked_at = 0
+        self.replica_fresh = True
+
+    def sqlite_path(self):
+        url = db.engine.url
+        if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+            raise RuntimeError(f"REPORT_DATABASE_MODE={app.config['REPORT_DATABASE_MODE']} needs a SQLite file database")
+        return url.database
+
+    def get_engine(self):
+        """Engine for report reads, or None to use the primary session."""
+        mode = app.config['REPORT_DATABASE_MODE']
+        if mode == 'wal':
+            return self.wal_engine()
+        if mode == 'snapshot':
+            return self.snapshot_engine()
+        if mode == 'replica':
+            return self.replica_engine()
+        return None
+
+    def wal_engine(self):
+        with self.lock:
+            if self.engine is None:
+                # Persistent: stored in the database file itself
+                with db.engine.connect() as conn:
+                    conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+                self.engine = create_engine(f'sqlite:///file:{self.sqlite_path()}?mode=ro&uri=true')
+                snapshot_transactions(self.engine)
+            return self.engine
+
+    def snapshot_engine(self):
+        with self.lock:
+            if time.monotonic() - self.refreshed_at > app.config['REPORT_MAX_STALENESS']:
+                self.refresh_snapshot()
+            return self.engine
+
+    def refresh_snapshot(self):
+        # One backup step: a single short read lock on the live database (a
+        # stepped copy restarts whenever a writer commits in between). The
+        # finished copy is then swapped into place.
+        target = app.config['REPORT_SNAPSHOT_PATH']
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = target + '.partial'
+        source = sqlite3.connect(self.sqlite_path())
+        copy = sqlite3.connect(partial)
+        try:
+            source.backup(copy)
+        finally:
+            copy.close()
+            source.close()
+        os.replace(partial, target)
+        if self.engine is None:
+            # NullPool: every report opens the current file, never a replaced one
+            self.engine = create_engine(f'sqlite:///file:{target}?mode=ro&uri=true', poolclass=NullPool)
+        self.refreshed_at = time.monotonic()
+
+    def replica_engine(self):
+        with self.lock:
+            if self.engine is None:
+                self.engine = create_engine(app.config['REPORT_DATABASE_URI'], pool_pre_ping=True)
+            if time.monotonic() - self.replica_checked_at > 5:
+                self.replica_fresh = self.replica_lag() <= app.config['REPORT_MAX_STALENESS']
+                self.replica_checked_at = time.monotonic()
+            return self.engine if self.replica_fresh else None
+
+    def replica_lag(self):
+        """Seconds the replica is behind (0 when it cannot tell)."""
+        if self.engine.dialect.name != 'postgresql':
+            return 0
+        with self.engine.connect() as conn:
+            lag = conn.execute(text(
+                'SELECT CASE WHEN pg_is_in_recovery() '
+                'THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) ELSE 0 END'
+            )).scalar()
+        return float(lag or 0)
+
+
+report_engine = ReportEngine()
+
+
+@contextlib.contextmanager
+def report_session(endpoint=None):
+    """Session for a report loader: the read-only engine if the endpoint opted in, else db.session."""
+    endpoint = endpoint or request.endpoint
+    opted_in = endpoint in app.config['REPORT_ENDPOINTS'] and current_shop() is None
+    engine = report_engine.get_engine() if opted_in else None
+    if engine is None:
+        yield db.session
+        return
+    with Session(engine) as session:
+        yield session
@@ -5,9 +5,15 @@ from back.models import Bill, Order,Worker, Daily_Expenses, Worker_Expense, orde
 from datetime import datetime, timedelta
 import json
 import requests
+from back.billnumbers import next_bill_number, reserve_number
+from back.customers import refresh_customer
+from back.idempotency import idempotent
+from back.jobs import enqueue
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 
 @app.route('/api/new-bill', methods=['POST'])
+@idempotent
 def new_bill():
     try:
         data = request.get_json()
@@ -70,6 +76,16 @@ def new_bill():
         extra_measurements = data.get('extraMeasurements')
         billnumberinput2 = data.get('billnumberinput2')
 
+        # Devices with a leased block send their own number; otherwise take the
+        # next one from this process's block (no extra round trip). Both happen
+        # before this request starts writing.
+        if billnumberinput2:
+            bill_number = int(float(billnumberinput2))
+            reserve_number(bill_number)
+        else:
+            bill_number = next_bill_number()
+            billnumberinput2 = bill_number
+
         # Fetch or create measurements for this phone number
         measurement = Measurement.query.filter_by(phone_number=mobile_number).first()
         if not measurement:
@@ -96,13 +112,13 @@ def new_bill():
                 existing_orders[i].payment_mode = payment_mode
                 existing_orders[i].payment_status = payment_status
                 existing_orders[i].payment_amount = payment_amount
-                existing_orders[i].status = 'Pending'
+                existing_orders[i].status = 'pending'
 
             # Add new orders if quantity exceeds existing orders
             for _ in range(quantity - current_order_count):
                 new_order = Order(
                     garment_type=garment,
-                    status='Pending',
+                    status='pending',
                     order_date=datetime.now().date(),
                     due_date=due_date,
                     total_amt=total_amt,
@@ -135,7 +151,8 @@ def new_bill():
             total_amt=total_amt,
             payment_mode=payment_mode,
             payment_status=payment_status,
-            payment_amount=payment_amount
+            payment_amount=payment_amount,
+            bill_number=bill_number
         )
 
         db.session.add(new_bill)
@@ -153,9 +170,23 @@ def new_bill():
         if sadri_qty > 0:
             update_or_create_orders(new_bill.id, 'Sadri', sadri_qty)
 
+        # Notifications etc. run in the background, after this commit
+        enqueue('bill.created', {'bill_id': new_bill.id})
+        enqueue('bill.render', {'bill_id': new_bill.id})
+
+        # Customer lifetime totals, in the same transaction as the orders
+        db.session.flush()
+        refresh_customer(db.session, mobile_number)
+
         db.session.commit()
-        return jsonify({'message': 'Bill and orders created successfully', 'bill_id': new_bill.id}), 201
+        return jsonify({'message': 'Bill and orders created successfully', 'bill_id': new_bill.id,
+                        'bill_number': bill_number}), 201
 
+    except IntegrityError as e:
+        db.session.rollback()
+        if 'bill_number' in str(e.orig):
+            return jsonify({'error': f'Bill number {bill_number} is already in use'}), 409
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 import json
 import requests
 from sqlalchemy import func
+from back.statements import record_order, worker_rate
 
             
 # Updated route for assigning multiple workers to an order
@@ -27,15 +28,11 @@ def assign_workers(order_id):
 
         # Assign workers to the order and calculate Work_pay
         order.workers = workers  # Update the relationship
-        total_work_pay = sum(
-            worker.Suit if order.garment_type == 'Suit' else
-            worker.Jacket if order.garment_type == 'Jacket' else
-            worker.Sadri if order.garment_type == 'Sadri' else
-            worker.Rate  # Default rate for other types
-            for worker in workers
-        )
+        total_work_pay = sum(worker_rate(worker, order.garment_type) for worker in workers)
         order.Work_pay = total_work_pay
 
+        # Keep the workers' statements current (back/statements.py)
+        record_order(db.session, order)
         db.session.commit()
 
         return jsonify({'success': True, 'work_pay': total_work_pay}), 200
@@ -6,9 +6,12 @@ from datetime import datetime, timedelta
 import json
 import requests
 from sqlalchemy import func
+from back.idempotency import idempotent
+from back.statements import record_payment
 
 # Route to add a worker's expense
 @app.route('/api/worker-expense', methods=['POST'])
+@idempotent
 def add_worker_expense():
     data = request.get_json()
 
@@ -37,6 +40,8 @@ def add_worker_expense():
         )
 
         db.session.add(new_expense)
+        db.session.flush()
+        record_payment(db.session, new_expense)
         db.session.commit()
 
         # Now update the Total_Pay in Daily_Expenses for the specific date
@@ -1,94 +1,106 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from back.app import app, db
-from back.models import Bill, Order, Worker, Daily_Expenses, Worker_Expense, order_worker_association, Measurement
+from back.models import Bill, Order, Worker, Daily_Expenses, Worker_Expense, order_worker_association, Measurement, \
+    CalendarDay, WorkerLedgerEntry, orders_archive
 from datetime import datetime, timedelta
 import json
 import requests
-from sqlalchemy import func, desc
+from back.dates import bucket
+from back.reports import report_session
+from back.singleflight import coalesce
+from sqlalchemy import func, desc, select
+
+def weekly_ledger_totals(session, week, since=None):
+    """{(worker_id, week_start): [order shares, earned, paid]} from worker_ledger, bucketed by joining calendar_days.
+
+    An order's Work_pay is split between its workers (statements.order_shares),
+    so each worker is credited their share, not the whole order.
+    """
+    query = select(WorkerLedgerEntry.worker_id, week, WorkerLedgerEntry.kind, func.count(),
+                   func.coalesce(func.sum(WorkerLedgerEntry.amount), 0))\
+        .join(CalendarDay, CalendarDay.day == WorkerLedgerEntry.day)\
+        .group_by(WorkerLedgerEntry.worker_id, week, WorkerLedgerEntry.kind)
+    if since is not None:
+        query = query.where(WorkerLedgerEntry.day >= since)
+    totals = {}
+    for worker_id, week_start, kind, count, amount in session.execute(query):
+        week_totals = totals.setdefault((worker_id, week_start), [0, 0, 0])
+        if kind == 'order':
+            week_totals[0] += count
+            week_totals[1] += amount
+        else:
+            week_totals[2] += amount
+    return totals
+
+def worker_entries(session, worker_id, week, since=None):
+    """One worker's ledger rows as (week_start, day, kind, ref_id, amount), newest first."""
+    query = select(week, WorkerLedgerEntry.day, WorkerLedgerEntry.kind, WorkerLedgerEntry.ref_id,
+                   WorkerLedgerEntry.amount)\
+        .join(CalendarDay, CalendarDay.day == WorkerLedgerEntry.day)\
+        .where(WorkerLedgerEntry.worker_id == worker_id)\
+        .order_by(WorkerLedgerEntry.day.desc(), WorkerLedgerEntry.id.desc())
+    if since is not None:
+        query = query.where(WorkerLedgerEntry.day >= since)
+    return session.execute(query).all()
+
+def bill_numbers(session, order_ids):
+    """{order id: billnumberinput2} for live and archived orders."""
+    numbers = {}
+    for orders in (Order.__table__, orders_archive):
+        missing = [order_id for order_id in order_ids if order_id not in numbers]
+        for start in range(0, len(missing), 500):
+            numbers.update(session.execute(
+                select(orders.c.id, orders.c.billnumberinput2).where(orders.c.id.in_(missing[start:start + 500]))
+            ).all())
+    return numbers
+
+def parse_since():
+    since = request.args.get('from')
+    return datetime.strptime(since, '%Y-%m-%d').date() if since else None
+
+def load_worker_weekly_pay(session, since=None):
+    # Shared by the sync route below and the async variant in back/asgi.py
+    # Get all workers
+    workers = session.query(Worker).all()
+    result = {}
+
+    # Monday-Sunday weeks, summed per worker and week from the ledger in SQL
+    weekly_data = {}
+    for (worker_id, week_start), totals in weekly_ledger_totals(session, bucket('week_mon'), since).items():
+        weekly_data.setdefault(worker_id, {})[week_start] = totals
+
+    for worker in workers:
+        # Convert to list and sort by week
+        weeks_list = [
+            {
+                'week_start': week_start.strftime('%Y-%m-%d'),
+                'week_end': (week_start + timedelta(days=6)).strftime('%Y-%m-%d'),
+                'orders_count': count,
+                'total_work_pay': round(work_pay, 2),
+                'amount_paid': amount_paid,
+                'remaining_pay': round(work_pay - amount_paid, 2)
+            }
+            for week_start, (count, work_pay, amount_paid) in weekly_data.get(worker.id, {}).items()
+        ]
+        
+        # Sort weeks by start date (newest first)
+        weeks_list.sort(key=lambda x: x['week_start'], reverse=True)
+
+        result[worker.id] = {
+            'worker_id': worker.id,
+            'worker_name': worker.name,
+            'weekly_data': weeks_list
+        }
+
+    return result
 
 @app.route('/api/worker-weekly-pay', methods=['GET'])
+@coalesce()
 def worker_weekly_pay():
     try:
-        # Get all workers
-        workers = Worker.query.all()
-        result = {}
-
-        for worker in workers:
-            # Get all orders for this worker
-            orders = db.session.query(Order)\
-                .join(order_worker_association)\
-                .filter(order_worker_association.c.worker_id == worker.id)\
-                .all()
-
-            # Get all expenses for this worker
-            expenses = Worker_Expense.query.filter_by(worker_id=worker.id).all()
-
-            # Group orders by week
-            weekly_data = {}
-            
-            for order in orders:
-                if not order.order_date:
-                    continue
-                    
-                # Calculate the start of the week for this order
-                order_date = order.order_date
-                week_start = order_date - timedelta(days=order_date.weekday())
-                week_key = week_start.strftime('%Y-%m-%d')
-                
-                if week_key not in weekly_data:
-                    weekly_data[week_key] = {
-                        'week_start': week_start.strftime('%Y-%m-%d'),
-                        'week_end': (week_start + timedelta(days=6)).strftime('%Y-%m-%d'),
-                        'orders_count': 0,
-                        'total_work_pay': 0,
-                        'amount_paid': 0
-                    }
-                
-                weekly_data[week_key]['orders_count'] += 1
-                weekly_data[week_key]['total_work_pay'] += order.Work_pay or 0
-
-            # Add expenses to weekly data
-            for expense in expenses:
-                if not expense.Date:
-                    continue
-                    
-                expense_date = expense.Date
-                week_start = expense_date - timedelta(days=expense_date.weekday())
-                week_key = week_start.strftime('%Y-%m-%d')
-                
-                if week_key in weekly_data:
-                    weekly_data[week_key]['amount_paid'] += expense.Amt_Paid or 0
-                else:
-                    weekly_data[week_key] = {
-                        'week_start': week_start.strftime('%Y-%m-%d'),
-                        'week_end': (week_start + timedelta(days=6)).strftime('%Y-%m-%d'),
-                        'orders_count': 0,
-                        'total_work_pay': 0,
-                        'amount_paid': expense.Amt_Paid or 0
-                    }
-
-            # Convert to list and sort by week
-            weeks_list = [
-                {
-                    'week_start': data['week_start'],
-                    'week_end': data['week_end'],
-                    'orders_count': data['orders_count'],
-                    'total_work_pay': data['total_work_pay'],
-                    'amount_paid': data['amount_paid'],
-                    'remaining_pay': data['total_work_pay'] - data['amount_paid']
-                }
-                for data in weekly_data.values()
-            ]
-            
-            # Sort weeks by start date (newest first)
-            weeks_list.sort(key=lambda x: x['week_start'], reverse=True)
-
-            result[worker.id] = {
-                'worker_id': worker.id,
-                'worker_name': worker.name,
-                'weekly_data': weeks_list
-            }
+        with report_session() as session:
+            result = load_worker_weekly_pay(session, parse_since())
 
         return jsonify(result), 200
 
@@ -96,76 +108,49 @@ def worker_weekly_pay():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/weekly-pay/<int:worker_id>', methods=['GET'])
+@coalesce()
 def get_worker_weekly_pay(worker_id):
     try:
         worker = Worker.query.get(worker_id)
         if not worker:
             return jsonify({'error': 'Worker not found'}), 404
         
-        all_orders = db.session.query(Order)\
-            .join(order_worker_association)\
-            .filter(order_worker_association.c.worker_id == worker_id)\
-            .order_by(Order.order_date.desc())\
-            .all()
-            
-        all_expenses = Worker_Expense.query.filter_by(worker_id=worker_id)\
-            .order_by(Worker_Expense.date.desc())\
-            .all()
+        since = parse_since()
+        # Sunday-Saturday weeks, bucketed by the calendar_days join
+        week = bucket('week')
+        with report_session() as session:
+            entries = worker_entries(session, worker_id, week, since)
+            numbers = bill_numbers(session, [row.ref_id for row in entries if row.kind == 'order'])
         
         weekly_data = {}
         
-        # Adjust to Sunday-Saturday week
-        for order in all_orders:
-            if not order.order_date:
-                continue
-                
-            # Calculate week start (Sunday) and end (Saturday)
-            current_weekday = order.order_date.weekday()
-            days_since_sunday = (current_weekday + 1) % 7  # Adjust to make Sunday the first day
-            week_start = order.order_date - timedelta(days=days_since_sunday)
-            week_end = week_start + timedelta(days=6)
+        for row in entries:
+            week_start = row[0]
             week_key = week_start.strftime('%Y-%m-%d')
             
             if week_key not in weekly_data:
                 weekly_data[week_key] = {
-                    'start_date': week_start.strftime('%Y-%m-%d'),
-                    'end_date': week_end.strftime('%Y-%m-%d'),
+                    'start_date': week_key,
+                    'end_date': (week_start + timedelta(days=6)).strftime('%Y-%m-%d'),
                     'orders': [],
                     'total_work_pay': 0,
                     'total_paid': 0,
                     'order_count': 0
                 }
             
+            if row.kind != 'order':
+                # What was paid in this week
+                weekly_data[week_key]['total_paid'] += row.amount
+                continue
+
+            # This worker's share of the order's Work_pay
             weekly_data[week_key]['orders'].append({
-                'order_number': order.billnumberinput2 or order.id,
-                'work_pay': order.Work_pay or 0
+                'order_number': numbers.get(row.ref_id) or row.ref_id,
+                'work_pay': round(row.amount, 2)
             })
-            weekly_data[week_key]['total_work_pay'] += order.Work_pay or 0
+            weekly_data[week_key]['total_work_pay'] += row.amount
             weekly_data[week_key]['order_count'] += 1
 
-        # Process expenses with Sunday-Saturday week
-        for expense in all_expenses:
-            if not expense.date:
-                continue
-                
-            current_weekday = expense.date.weekday()
-            days_since_sunday = (current_weekday + 1) % 7
-            week_start = expense.date - timedelta(days=days_since_sunday)
-            week_key = week_start.strftime('%Y-%m-%d')
-            
-            if week_key in weekly_data:
-                weekly_data[week_key]['total_paid'] += expense.Amt_Paid or 0
-            else:
-                week_end = week_start + timedelta(days=6)
-                weekly_data[week_key] = {
-                    'start_date': week_start.strftime('%Y-%m-%d'),
-                    'end_date': week_end.strftime('%Y-%m-%d'),
-                    'orders': [],
-                    'total_work_pay': 0,
-                    'total_paid': expense.Amt_Paid or 0,
-                    'order_count': 0
-                }
-
         # Calculate totals and format response
         total_orders = 0
         total_work_pay = 0
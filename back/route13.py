@@ -6,8 +6,10 @@ from datetime import datetime, timedelta
 import json
 import requests
 from sqlalchemy import func
+from back.idempotency import idempotent
 
 @app.route('/api/daily_expenses', methods=['POST'])
+@idempotent
 def add_daily_expense():
     try:
         # Get data from the request body
@@ -1,42 +1,67 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from back.app import app, db
-from back.models import Bill, Order, Worker, Daily_Expenses, Worker_Expense, order_worker_association, Measurement
+from back.models import Bill, Order, Worker, Daily_Expenses, Worker_Expense, order_worker_association, Measurement, orders_archive
 from datetime import datetime, timedelta
 import json
 import requests
-from sqlalchemy import func
+from back.archive import archive_needed
+from back.dates import ist_day_bounds
+from back.reports import report_session
+from back.singleflight import coalesce
+from sqlalchemy import func, select
+
+def load_profit_summary(session, date_filter=None):
+    # Shared by the sync route below and the async variant in back/asgi.py
+    # Revenue is summed in SQL over the coded payment_status column, in the
+    # live table and (paid orders are what gets archived) the archive
+    tables = [Order.__table__]
+    if archive_needed(session):
+        tables.append(orders_archive)
+    revenues = [select(func.coalesce(func.sum(table.c.total_amt), 0)).where(table.c.payment_status == 'paid')
+                for table in tables]
+    if date_filter:
+        # updated_at is UTC: take the UTC range of the IST day (an index range scan)
+        day = datetime.strptime(date_filter, '%Y-%m-%d').date()
+        start, end = ist_day_bounds(day)
+        revenues = [revenue.where(table.c.updated_at >= start, table.c.updated_at < end)
+                    for revenue, table in zip(revenues, tables)]
+        # Expense dates are already IST calendar dates
+        daily_expenses = session.query(Daily_Expenses).filter(Daily_Expenses.Date == day).all()
+        worker_expenses = session.query(Worker_Expense).filter(Worker_Expense.date == day).all()
+    else:
+        daily_expenses = session.query(Daily_Expenses).all()
+        worker_expenses = session.query(Worker_Expense).all()
+
+    # Calculate totals
+    total_revenue = sum(session.execute(revenue).scalar() for revenue in revenues)
+    total_daily_expenses = sum((expense.material_cost or 0) + 
+                             (expense.miscellaneous_Cost or 0) + 
+                             (expense.chai_pani_cost or 0) 
+                             for expense in daily_expenses)
+    total_worker_expenses = sum(expense.Amt_Paid or 0 for expense in worker_expenses)
+
+    return {
+        'date': date_filter or 'All Time',
+        'total_revenue': round(total_revenue, 2),
+        'daily_expenses': round(total_daily_expenses, 2),
+        'worker_expenses': round(total_worker_expenses, 2),
+        'net_profit': round(total_revenue - (total_daily_expenses + total_worker_expenses), 2)
+    }
 
 @app.route('/api/calculate-profit', methods=['GET'])
+@coalesce()
 def calculate_profit():
     try:
         date_filter = request.args.get('date')
-        
-        # Base query for orders
         if date_filter:
-            orders = Order.query.filter(func.date(Order.updated_at) == date_filter).all()
-            daily_expenses = Daily_Expenses.query.filter(func.date(Daily_Expenses.Date) == date_filter).all()
-            worker_expenses = Worker_Expense.query.filter(func.date(Worker_Expense.date) == date_filter).all()
-        else:
-            orders = Order.query.all()
-            daily_expenses = Daily_Expenses.query.all()
-            worker_expenses = Worker_Expense.query.all()
+            try:
+                datetime.strptime(date_filter, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
-        # Calculate totals
-        total_revenue = sum(order.total_amt for order in orders if order.payment_status.lower() == 'paid')
-        total_daily_expenses = sum((expense.material_cost or 0) + 
-                                 (expense.miscellaneous_Cost or 0) + 
-                                 (expense.chai_pani_cost or 0) 
-                                 for expense in daily_expenses)
-        total_worker_expenses = sum(expense.Amt_Paid or 0 for expense in worker_expenses)
-        
-        return jsonify({
-            'date': date_filter or 'All Time',
-            'total_revenue': round(total_revenue, 2),
-            'daily_expenses': round(total_daily_expenses, 2),
-            'worker_expenses': round(total_worker_expenses, 2),
-            'net_profit': round(total_revenue - (total_daily_expenses + total_worker_expenses), 2)
-        })
+        with report_session() as session:
+            return jsonify(load_profit_summary(session, date_filter))
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
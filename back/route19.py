@@ -6,6 +6,8 @@ from datetime import datetime, timedelta
 import json
 import requests
 from sqlalchemy import func
+from back.customers import refresh_customer
+from back.versioning import BadVersion, VersionConflict, expected_version, update_row
 
 @app.route('/api/orders/<int:order_id>/update-total-amount', methods=['POST'])
 def update_total_amount(order_id):
@@ -18,17 +20,21 @@ def update_total_amount(order_id):
         if new_total_amt is None or new_total_amt < 0:
             return jsonify({'error': 'Invalid total amount provided'}), 400
 
-        # Fetch the order by ID
-        order = Order.query.get(order_id)
+        # Update the total_amt field and read the row back in one statement
+        order = update_row(db.session, Order, order_id, {'total_amt': new_total_amt}, expected_version(data))
         if not order:
             return jsonify({'error': 'Order not found'}), 404
-
-        # Update the total_amt field
-        order.total_amt = new_total_amt
+        refresh_customer(db.session, bill_id=order['bill_id'])
         db.session.commit()
 
-        return jsonify({'message': 'Total amount updated successfully', 'total_amt': order.total_amt}), 200
+        return jsonify({'message': 'Total amount updated successfully', 'total_amt': order['total_amt'],
+                        'version': order['version']}), 200
 
+    except BadVersion as e:
+        return jsonify({'error': str(e)}), 400
+    except VersionConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'version': e.current['version']}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -1,44 +1,61 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from back.app import app, db
-from back.models import Bill, Order,Worker, Daily_Expenses, Worker_Expense, order_worker_association, Measurement
+from back.models import Bill, Order,Worker, Daily_Expenses, Worker_Expense, order_worker_association, Measurement, CustomerSummary
 from datetime import datetime, timedelta
 import json
 import requests
+from back.archive import archive_needed, archived_order_dicts
 from sqlalchemy import func, desc
 
 # Route for customer info section
 
+def load_customer_info(session, mobile_number):
+    # Shared by the sync route below and the async variant in back/asgi.py
+    # Fetch measurements for the customer
+    measurements = session.query(Measurement).filter_by(phone_number=mobile_number).first()
+    if not measurements:
+        return {"error": "No measurements found for this customer"}, 404
+
+    # Fetch related bills and iterate their orders
+    customer_bills = session.query(Bill).filter_by(mobile_number=mobile_number).all()
+    if not customer_bills:
+        return {"error": "No bills found for this customer"}, 404
+
+    order_history = []
+    for bill in customer_bills:
+        for order in bill.orders:
+            order_history.append(order.as_dict())
+
+    # Older completed orders may have been moved to the archive (indexed on bill_id)
+    if archive_needed(session):
+        order_history.extend(archived_order_dicts(session, [bill.id for bill in customer_bills]))
+
+    # Sort orders by order_date in descending order (newest first)
+    order_history.sort(key=lambda x: x.get('id', ''), reverse=True)
+
+    # Lifetime totals (back/customers.py)
+    summary = session.get(CustomerSummary, mobile_number)
+
+    customer_info = {
+        "measurements": measurements.as_dict() if measurements else None,
+        "order_history": order_history,
+        "customer_name": customer_bills[0].customer_name,
+        "mobile_number": mobile_number,
+        "summary": summary.as_dict() if summary else None
+    }
+    return customer_info, 200
+
 @app.route('/api/customer-info/<mobile_number>', methods=['GET', 'PUT'])
 def get_customer_info(mobile_number):
     try:
-        # Fetch measurements for the customer
-        measurements = Measurement.query.filter_by(phone_number=mobile_number).first()
-        if not measurements:
-            return jsonify({"error": "No measurements found for this customer"}), 404
-
-        # Fetch related bills and iterate their orders
-        customer_bills = Bill.query.filter_by(mobile_number=mobile_number).all()
-        if not customer_bills:
-            return jsonify({"error": "No bills found for this customer"}), 404
-
-        order_history = []
-        for bill in customer_bills:
-            for order in bill.orders:
-                order_history.append(order.as_dict())
-        
-        # Sort orders by order_date in descending order (newest first)
-        order_history.sort(key=lambda x: x.get('id', ''), reverse=True)
-
-        customer_info = {
-            "measurements": measurements.as_dict() if measurements else None,
-            "order_history": order_history,
-            "customer_name": customer_bills[0].customer_name,
-            "mobile_number": mobile_number
-        }
+        customer_info, status_code = load_customer_info(db.session, mobile_number)
+        if status_code != 200:
+            return jsonify(customer_info), status_code
 
         if request.method == 'PUT':
             # Update measurements
+            measurements = Measurement.query.filter_by(phone_number=mobile_number).first()
             data = request.get_json()
             for key, value in data.items():
                 if hasattr(measurements, key):
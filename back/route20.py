@@ -0,0 +1,170 @@
+from flask import Flask, request, jsonify, send_file
+from flask_cors import CORS
+from back.app import app, db
+from back.models import Bill, Order,Worker, Daily_Expenses, Worker_Expense, order_worker_association, Measurement
+from back.archive import archived_order_dicts
+from back.assets import file_for, get_asset
+from back.jobs import job_handler
+from back.pdf_render import render
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import zipfile
+
+# Bump when the PDF layouts change so old cache entries stop matching
+RENDERER_VERSION = 1
+
+_pool = None
+
+
+def suit_image():
+    # Print-resolution variant from the asset store
+    return get_asset('suit', 'print')
+
+
+def load_bill_document(session, bill_id):
+    # Everything a rendered bill depends on, as plain data
+    bill = session.get(Bill, bill_id)
+    if not bill:
+        return None
+    measurement = session.query(Measurement).filter_by(phone_number=bill.mobile_number).first()
+    return {
+        'bill': bill.as_dict(),
+        # Archived orders (archive.py) still print on their bill
+        'orders': sorted([order.as_dict() for order in bill.orders] + archived_order_dicts(session, [bill.id]),
+                         key=lambda o: o['id']),
+        'measurements': measurement.as_dict() if measurement else None,
+    }
+
+
+def document_hash(kind, doc):
+    key = json.dumps({
+        'kind': kind,
+        'version': RENDERER_VERSION,
+        'image': suit_image()['hash'],
+        'doc': doc,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def cache_path(digest):
+    return os.path.join(app.config['RENDER_CACHE_DIR'], f'{digest}.pdf')
+
+
+def store(digest, pdf_bytes):
+    os.makedirs(app.config['RENDER_CACHE_DIR'], exist_ok=True)
+    # Write then rename so readers never see a partial file
+    tmp_path = f'{cache_path(digest)}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, cache_path(digest))
+
+
+def render_cached(kind, doc):
+    digest = document_hash(kind, doc)
+    if not os.path.exists(cache_path(digest)):
+        store(digest, render(kind, doc, file_for(suit_image())))
+    return digest
+
+
+def render_pool():
+    global _pool
+    if _pool is None:
+        # spawn: worker processes only import back.pdf_render, never the app
+        _pool = ProcessPoolExecutor(
+            max_workers=app.config['RENDER_PROCESSES'],
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _pool
+
+
+@job_handler('bill.render')
+def prerender_bills(payloads):
+    # Warm the cache after bill creation so the first print is instant
+    for payload in payloads:
+        doc = load_bill_document(db.session, payload['bill_id'])
+        if doc:
+            for kind in ('bill', 'measurements'):
+                render_cached(kind, doc)
+
+
+@app.route('/api/bills/<int:bill_id>/pdf', methods=['GET'])
+def get_bill_pdf(bill_id):
+    try:
+        kind = request.args.get('type', 'bill')
+        if kind not in ('bill', 'measurements'):
+            return jsonify({'error': "type must be 'bill' or 'measurements'"}), 400
+
+        doc = load_bill_document(db.session, bill_id)
+        if not doc:
+            return jsonify({'error': 'Bill not found'}), 404
+
+        digest = render_cached(kind, doc)
+        response = send_file(
+            cache_path(digest),
+            mimetype='application/pdf',
+            download_name=f'{kind}-{bill_id}.pdf',
+            etag=digest,
+            conditional=True,
+        )
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/bills/pdf', methods=['GET'])
+def get_bills_pdf_for_date():
+    try:
+        date_str = request.args.get('date')
+        kind = request.args.get('type', 'bill')
+        if not date_str:
+            return jsonify({'error': 'date is required (YYYY-MM-DD)'}), 400
+        if kind not in ('bill', 'measurements'):
+            return jsonify({'error': "type must be 'bill' or 'measurements'"}), 400
+        day = datetime.strptime(date_str, '%Y-%m-%d').date()
+
+        bill_ids = [bill_id for (bill_id,) in db.session.query(Bill.id).filter(Bill.date_issue == day).order_by(Bill.id)]
+        if not bill_ids:
+            return jsonify({'error': 'No bills found for this date'}), 404
+
+        digests = {}
+        misses = {}
+        for bill_id in bill_ids:
+            doc = load_bill_document(db.session, bill_id)
+            digest = document_hash(kind, doc)
+            digests[bill_id] = digest
+            if not os.path.exists(cache_path(digest)):
+                misses[digest] = doc
+
+        # Render only what is not cached yet, in parallel
+        if misses:
+            futures = {
+                digest: render_pool().submit(render, kind, doc, file_for(suit_image()))
+                for digest, doc in misses.items()
+            }
+            for digest, future in futures.items():
+                store(digest, future.result())
+
+        # PDFs are already compressed, so the archive just stores them
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+            for bill_id, digest in digests.items():
+                zf.write(cache_path(digest), f'{kind}-{bill_id}.pdf')
+        archive.seek(0)
+
+        return send_file(archive, mimetype='application/zip', download_name=f'{kind}s-{date_str}.zip')
+
+    except ValueError:
+        return jsonify({'error': 'Invalid date format, expected YYYY-MM-DD'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
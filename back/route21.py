@@ -0,0 +1,96 @@
+from flask import Flask, request, jsonify, send_file
+from flask_cors import CORS
+from back.app import app, db
+from back.assets import asset_path, get_asset, load_manifest, register, CONTENT_TYPES
+from back.auth import admin_required
+from PIL import Image
+from datetime import datetime, timedelta
+import hashlib
+import io
+import json
+import os
+import re
+
+ASSET_NAME = re.compile(r'^[0-9a-f]{64}\.(jpg|png)$')
+NAME = re.compile(r'^[a-z0-9_-]{1,50}$')
+UPLOAD_TYPES = {'image/jpeg': 'JPEG', 'image/png': 'PNG'}
+
+
+def check_image(data):
+    # Only decode what is really a JPEG/PNG of a sane size
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format not in UPLOAD_TYPES.values():
+                return 'Only JPEG and PNG images are accepted'
+            if image.width * image.height > app.config['ASSET_MAX_PIXELS']:
+                return 'Image dimensions are too large'
+            image.verify()
+    except Exception:
+        return 'Not a valid image'
+    return None
+
+
+@app.route('/api/assets/manifest', methods=['GET'])
+def get_asset_manifest():
+    try:
+        # Make sure the bundled assets are registered
+        for name in app.config['BUNDLED_ASSETS']:
+            get_asset(name)
+
+        manifest = load_manifest()
+        body = json.dumps(manifest, sort_keys=True)
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(hashlib.sha256(body.encode('utf-8')).hexdigest())
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/assets/<filename>', methods=['GET'])
+def get_asset_file(filename):
+    if not ASSET_NAME.match(filename):
+        return jsonify({'error': 'Asset not found'}), 404
+    path = asset_path(filename)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Asset not found'}), 404
+
+    digest, ext = filename.split('.')
+    response = send_file(path, mimetype=CONTENT_TYPES[ext], etag=digest, conditional=True)
+    # The URL is the content hash, so it can never change
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@app.route('/api/assets/<name>', methods=['POST'])
+@admin_required
+def upload_asset(name):
+    try:
+        if not NAME.match(name):
+            return jsonify({'error': 'Invalid asset name'}), 400
+        max_bytes = app.config['ASSET_MAX_BYTES']
+        if request.content_length is not None and request.content_length > max_bytes:
+            return jsonify({'error': f'Upload is larger than {max_bytes} bytes'}), 413
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': 'No file uploaded'}), 400
+        if upload.mimetype not in UPLOAD_TYPES:
+            return jsonify({'error': 'Only image/jpeg and image/png uploads are accepted'}), 415
+
+        data = upload.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            return jsonify({'error': f'Upload is larger than {max_bytes} bytes'}), 413
+        problem = check_image(data)
+        if problem:
+            return jsonify({'error': problem}), 400
+
+        entry = register(name, data)
+        return jsonify({'message': 'Asset stored successfully', 'asset': entry}), 201
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
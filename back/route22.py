@@ -0,0 +1,43 @@
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from back.app import app, db
+from back.auth import admin_required
+from back.importer import READERS, ImportRowError, detect_format, import_stream
+from datetime import datetime, timedelta
+import io
+import json
+
+@app.route('/api/import', methods=['POST'])
+@admin_required
+def import_data():
+    try:
+        table = request.args.get('table', 'orders')
+        if table not in ('orders', 'bills', 'measurements', 'workers'):
+            return jsonify({'error': 'Invalid table'}), 400
+
+        # Either a multipart upload ("file") or the raw request body
+        upload = request.files.get('file')
+        raw = upload.stream if upload else request.stream
+        fmt = request.args.get('format') or detect_format(upload.filename if upload else None)
+        if fmt not in READERS:
+            return jsonify({'error': 'Invalid format'}), 400
+
+        stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        # A source name makes the upload resumable: re-sending it skips the rows already imported
+        source = request.args.get('source')
+        stats = import_stream(
+            stream, fmt, table,
+            batch_size=request.args.get('batch_size', 1000, type=int),
+            dry_run=request.args.get('dry_run') in ('1', 'true'),
+            source=f'upload:{source}:{table}' if source else None,
+        )
+        return jsonify(stats), 200
+
+    except (ImportRowError, json.JSONDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
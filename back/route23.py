@@ -0,0 +1,29 @@
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from back.app import app, db
+from back.billnumbers import lease_block
+from datetime import datetime, timedelta
+import json
+
+@app.route('/api/bill-numbers/lease', methods=['POST'])
+def lease_bill_numbers():
+    try:
+        data = request.get_json() or {}
+        device_id = data.get('device_id')
+        count = data.get('count', 50)
+
+        if not device_id:
+            return jsonify({'error': 'device_id is required'}), 400
+        if not isinstance(count, int) or not 1 <= count <= app.config['BILL_NUMBER_MAX_LEASE']:
+            return jsonify({'error': f"count must be between 1 and {app.config['BILL_NUMBER_MAX_LEASE']}"}), 400
+
+        first, last = lease_block(device_id, count)
+        return jsonify({'device_id': device_id, 'first': first, 'last': last}), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,41 @@
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from back.app import app, db
+from back.auth import admin_required
+from back.profiler import list_profiles, load_profile, to_collapsed, to_speedscope
+from datetime import datetime, timedelta
+import json
+
+@app.route('/api/_profiles', methods=['GET'])
+@admin_required
+def get_profiles():
+    try:
+        return jsonify(list_profiles()), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/_profiles/<profile_id>', methods=['GET'])
+@admin_required
+def download_profile(profile_id):
+    try:
+        profile = load_profile(profile_id)
+        if not profile:
+            return jsonify({'error': 'Profile not found'}), 404
+
+        # ?format=collapsed for flamegraph.pl, default speedscope JSON
+        if request.args.get('format') == 'collapsed':
+            body, mimetype, extension = to_collapsed(profile), 'text/plain', 'collapsed.txt'
+        else:
+            body, mimetype, extension = json.dumps(to_speedscope(profile)), 'application/json', 'speedscope.json'
+        response = app.response_class(body, mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{profile_id}.{extension}"'
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
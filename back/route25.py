@@ -0,0 +1,41 @@
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from back.app import app, db
+from back.models import CustomerSummary
+from back.customers import top_customers
+from datetime import datetime, timedelta
+import json
+
+# Lifetime totals per customer, read from customer_summaries (back/customers.py)
+@app.route('/api/customers/<mobile_number>/summary', methods=['GET'])
+def get_customer_summary(mobile_number):
+    try:
+        summary = db.session.get(CustomerSummary, mobile_number)
+        if not summary:
+            return jsonify({'error': 'No bills found for this customer'}), 404
+        return jsonify(summary.as_dict()), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/customers/top', methods=['GET'])
+def get_top_customers():
+    try:
+        by = request.args.get('by', 'spent')
+        if by not in ('spent', 'outstanding'):
+            return jsonify({'error': "by must be 'spent' or 'outstanding'"}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+
+        customers = top_customers(db.session, by, limit)
+        return jsonify([customer.as_dict() for customer in customers]), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
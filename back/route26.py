@@ -0,0 +1,65 @@
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from back.app import app, db
+from back.models import Order, orders_archive
+from back.archive import archive_needed
+from back.reports import report_session
+from datetime import datetime, timedelta
+import json
+from sqlalchemy import func, select
+
+# Longest range one request may ask for
+CALENDAR_MAX_DAYS = 370
+
+def load_calendar(session, start, end):
+    # Per-day workload from one GROUP BY over ix_orders_due_date_garment_status,
+    # instead of shipping every order to the device
+    days = {}
+    tables = [Order.__table__]
+    # Completed orders moved to the archive still belong on their days
+    if archive_needed(session):
+        tables.append(orders_archive)
+
+    for table in tables:
+        counts = session.execute(
+            select(table.c.due_date, table.c.garment_type, table.c.status, func.count())
+            .where(table.c.due_date >= start, table.c.due_date <= end)
+            .group_by(table.c.due_date, table.c.garment_type, table.c.status)
+        )
+        for due_date, garment_type, status, count in counts:
+            day = days.setdefault(due_date.isoformat(), {'total': 0, 'garment_type': {}, 'status': {}})
+            day['total'] += count
+            garments = day['garment_type'].setdefault(garment_type, {})
+            garments[status] = garments.get(status, 0) + count
+            day['status'][status] = day['status'].get(status, 0) + count
+
+    return {'from': start.isoformat(), 'to': end.isoformat(), 'days': dict(sorted(days.items()))}
+
+@app.route('/api/calendar', methods=['GET'])
+def get_calendar():
+    try:
+        # Defaults to the current month
+        today = datetime.now().date()
+        try:
+            start = request.args.get('from')
+            start = datetime.strptime(start, '%Y-%m-%d').date() if start else today.replace(day=1)
+            end = request.args.get('to')
+            end = datetime.strptime(end, '%Y-%m-%d').date() if end else \
+                (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        if end < start:
+            return jsonify({'error': "'to' must not be before 'from'"}), 400
+        if (end - start).days > CALENDAR_MAX_DAYS:
+            return jsonify({'error': f'Range is limited to {CALENDAR_MAX_DAYS} days'}), 400
+
+        with report_session() as session:
+            calendar = load_calendar(session, start, end)
+        return jsonify(calendar), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
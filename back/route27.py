@@ -0,0 +1,107 @@
+from flask import Flask, request, jsonify, g
+from flask_cors import CORS
+from back.app import app, db
+from back.auth import admin_required
+from back.route18 import load_profit_summary
+from back.tenancy import SHOP_ID, UnknownShop, configured_shops
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+
+# Shop routing (back/tenancy.py)
+def shop_for(header, host):
+    # X-Shop header first, then <shop>.SHOP_DOMAIN (also used by back/asgi.py)
+    shop = header
+    domain = app.config['SHOP_DOMAIN']
+    if not shop and domain and host:
+        host = host.split(':')[0].lower()
+        if host.endswith('.' + domain):
+            shop = host[:-len(domain) - 1]
+    return shop.strip().lower() if shop else None
+
+def requested_shop():
+    return shop_for(request.headers.get('X-Shop'), request.host)
+
+@app.before_request
+def select_shop():
+    shop = requested_shop()
+    if shop is None or shop == app.config['SHOP_DEFAULT']:
+        return None
+    if shop not in app.config['SHOPS'] or not SHOP_ID.match(shop):
+        return jsonify({'error': f'Unknown shop: {shop}'}), 404
+    g.shop = shop
+    try:
+        # Opens (and on first use sets up) the shop's database before the view touches it
+        db.shops.engine(shop)
+    except UnknownShop:
+        return jsonify({'error': f'Unknown shop: {shop}'}), 404
+    except Exception as e:
+        return jsonify({'error': f'Shop {shop} is unavailable: {e}'}), 503
+    return None
+
+
+def for_each_shop(fn, *args):
+    # Runs fn(session, *args) against every shop's database in parallel
+    def run(shop):
+        with app.app_context():
+            g.shop = shop
+            try:
+                return shop, fn(db.session, *args), None
+            except Exception as e:
+                return shop, None, str(e)
+            finally:
+                db.session.remove()
+
+    shops = configured_shops(app.config)
+    with ThreadPoolExecutor(max_workers=min(len(shops), app.config['SHOP_ENGINE_POOL_SIZE'])) as pool:
+        return list(pool.map(run, shops))
+
+
+@app.route('/api/shops', methods=['GET'])
+@admin_required
+def get_shops():
+    try:
+        open_shops = set(db.shops.open_shops())
+        return jsonify([
+            {'shop': shop, 'default': shop == app.config['SHOP_DEFAULT'],
+             'engine_open': shop == app.config['SHOP_DEFAULT'] or shop in open_shops}
+            for shop in configured_shops(app.config)
+        ]), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/shops/profit', methods=['GET'])
+@admin_required
+def get_all_shops_profit():
+    try:
+        date_filter = request.args.get('date')
+        if date_filter:
+            try:
+                datetime.strptime(date_filter, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+
+        shops = []
+        totals = {'total_revenue': 0, 'daily_expenses': 0, 'worker_expenses': 0, 'net_profit': 0}
+        for shop, summary, error in for_each_shop(load_profit_summary, date_filter):
+            if error is not None:
+                shops.append({'shop': shop, 'error': error})
+                continue
+            shops.append({'shop': shop, **summary})
+            for key in totals:
+                totals[key] += summary[key]
+
+        return jsonify({
+            'date': date_filter or 'All Time',
+            'shops': shops,
+            'totals': {key: round(value, 2) for key, value in totals.items()}
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,57 @@
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from back.app import app, db
+from back.scheduler import AssignmentConflict, apply_plan, plan
+from datetime import datetime, timedelta
+import json
+import time
+
+# Automatic worker assignment (back/scheduler.py)
+@app.route('/api/orders/auto-assign', methods=['POST'])
+def auto_assign_orders():
+    try:
+        data = request.get_json(silent=True) or {}
+        dry_run = bool(data.get('dry_run', False))
+        try:
+            start = datetime.strptime(data['from'], '%Y-%m-%d').date() if data.get('from') else None
+            end = datetime.strptime(data['to'], '%Y-%m-%d').date() if data.get('to') else None
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        max_per_worker = data.get('max_per_worker')
+        if max_per_worker is not None and (not isinstance(max_per_worker, int) or max_per_worker < 1):
+            return jsonify({'error': 'max_per_worker must be a positive integer'}), 400
+
+        started = time.perf_counter()
+        assignments, unassigned, loads = plan(db.session, start, end, data.get('worker_ids'), max_per_worker)
+        if dry_run:
+            db.session.rollback()
+        else:
+            # Every assignment, Work_pay and ledger row in one transaction
+            apply_plan(db.session, assignments)
+            db.session.commit()
+
+        return jsonify({
+            'dry_run': dry_run,
+            'assigned': [{
+                'order_id': a['order_id'],
+                'worker_id': a['worker_id'],
+                'worker_name': a['worker_name'],
+                'garment_type': a['garment_type'],
+                'due_date': a['due_date'].isoformat(),
+                'work_pay': a['work_pay']
+            } for a in assignments],
+            'unassigned': [{'order_id': order_id, 'reason': reason} for order_id, reason in unassigned],
+            'pending_load': loads,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }), 200
+
+    except AssignmentConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,88 @@
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from back.app import app, db
+from back.alerts import (KINDS, awaiting_payment_query, due_soon_query, mark_notified, order_rows, overdue_query,
+                         pending_alerts)
+from back.dates import ist_today
+from datetime import datetime, timedelta
+import json
+
+# Longest list one request returns
+MAX_LIMIT = 1000
+
+def parse_limit():
+    return min(max(int(request.args.get('limit', 200)), 1), MAX_LIMIT)
+
+def order_list(query):
+    try:
+        limit = parse_limit()
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    orders = db.session.execute(query.limit(limit)).scalars().all()
+    return jsonify(order_rows(db.session, orders, ist_today())), 200
+
+# Open orders past their due date (IST), oldest due first
+@app.route('/api/orders/overdue', methods=['GET'])
+def get_overdue_orders():
+    try:
+        return order_list(overdue_query(ist_today()))
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Open orders due today or within ?days= (default ALERT_DUE_SOON_DAYS)
+@app.route('/api/orders/due-soon', methods=['GET'])
+def get_due_soon_orders():
+    try:
+        try:
+            days = int(request.args.get('days', app.config['ALERT_DUE_SOON_DAYS']))
+        except ValueError:
+            return jsonify({'error': 'Invalid days'}), 400
+        if not 0 <= days <= 60:
+            return jsonify({'error': 'days must be between 0 and 60'}), 400
+        return order_list(due_soon_query(ist_today(), days))
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Completed or delivered orders that are not paid yet, most recently finished first
+@app.route('/api/orders/awaiting-payment', methods=['GET'])
+def get_awaiting_payment_orders():
+    try:
+        return order_list(awaiting_payment_query())
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Alerts recorded by the background scan (back/alerts.py) that nobody has been reminded about yet
+@app.route('/api/order-alerts', methods=['GET'])
+def get_order_alerts():
+    try:
+        kind = request.args.get('kind')
+        if kind and kind not in KINDS:
+            return jsonify({'error': f'Invalid kind: {kind}'}), 400
+        try:
+            limit = parse_limit()
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+        return jsonify(pending_alerts(db.session, kind, limit)), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/order-alerts/notified', methods=['POST'])
+def mark_order_alerts_notified():
+    try:
+        data = request.get_json()
+        alert_ids = data.get('ids') if data else None
+        if not alert_ids or not all(isinstance(alert_id, int) for alert_id in alert_ids):
+            return jsonify({'error': 'ids must be a list of alert ids'}), 400
+        return jsonify({'updated': mark_notified(db.session, alert_ids)}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -1,63 +1,76 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from back.app import app, db
-from back.models import Bill, Order,Worker, Daily_Expenses, Worker_Expense, order_worker_association, Measurement
+from back.models import Bill, Order,Worker, Daily_Expenses, Worker_Expense, order_worker_association, Measurement, orders_archive
 from datetime import datetime, timedelta
 import json
 import requests
-from sqlalchemy import func
+from sqlalchemy import func, select
+from back.archive import archive_needed, archived_order_dicts
+from back.enums import ORDER_STATUS
+from back.reports import report_session
+from back.customers import refresh_customer
+from back.versioning import BadVersion, VersionConflict, expected_version, update_row
+
+def load_orders_by_due_date(session):
+    # Shared by the sync route below and the async variant in back/asgi.py
+    # Fetch all orders from the database
+    orders = session.query(Order).all()
+
+    # Create a dictionary to group orders by delivery date
+    grouped_orders = {}
+
+    for order in orders:
+        # Format the delivery date as a string
+        delivery_date = order.due_date.strftime('%Y-%m-%d')
+
+        # If this delivery date is not in the dictionary, add it
+        if delivery_date not in grouped_orders:
+            grouped_orders[delivery_date] = []
+
+        # Get the associated bill to get customer details
+        bill = session.get(Bill, order.bill_id)
+
+        # Collect worker details for each order
+        worker_details = [
+            {
+                'worker_id': worker.id,
+                'name': worker.name,
+                'Rate': worker.Rate,
+                'Suit': worker.Suit,
+                'Jacket': worker.Jacket,
+                'Sadri': worker.Sadri,
+                'Others': worker.Others
+            }
+            for worker in order.workers
+        ]
+
+        # Append the order details to the corresponding delivery date
+        grouped_orders[delivery_date].append({
+            'id': order.id,
+            'garment_type': order.garment_type,
+            'status': order.status,
+            'order_date': order.order_date.strftime('%Y-%m-%d'),  # Format date as string
+            'due_date': order.due_date.strftime('%Y-%m-%d'),  # Format date as string
+            'total_amt': order.total_amt,
+            'payment_mode': order.payment_mode,
+            'payment_status': order.payment_status,
+            'payment_amount': order.payment_amount,
+            'bill_id': order.bill_id,
+            'billnumberinput2': order.billnumberinput2,
+            'workers': worker_details,  # Include list of assigned workers
+            'Work_pay': order.Work_pay,
+            'version': order.version,
+            'customer_mobile': bill.mobile_number if bill else None  # Add customer mobile number
+        })
+
+    return grouped_orders
 
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
     try:
-        # Fetch all orders from the database
-        orders = Order.query.all()
-
-        # Create a dictionary to group orders by delivery date
-        grouped_orders = {}
-
-        for order in orders:
-            # Format the delivery date as a string
-            delivery_date = order.due_date.strftime('%Y-%m-%d')
-
-            # If this delivery date is not in the dictionary, add it
-            if delivery_date not in grouped_orders:
-                grouped_orders[delivery_date] = []
-
-            # Get the associated bill to get customer details
-            bill = Bill.query.get(order.bill_id)
-
-            # Collect worker details for each order
-            worker_details = [
-                {
-                    'worker_id': worker.id,
-                    'name': worker.name,
-                    'Rate': worker.Rate,
-                    'Suit': worker.Suit,
-                    'Jacket': worker.Jacket,
-                    'Sadri': worker.Sadri,
-                    'Others': worker.Others
-                }
-                for worker in order.workers
-            ]
-
-            # Append the order details to the corresponding delivery date
-            grouped_orders[delivery_date].append({
-                'id': order.id,
-                'garment_type': order.garment_type,
-                'status': order.status,
-                'order_date': order.order_date.strftime('%Y-%m-%d'),  # Format date as string
-                'due_date': order.due_date.strftime('%Y-%m-%d'),  # Format date as string
-                'total_amt': order.total_amt,
-                'payment_mode': order.payment_mode,
-                'payment_status': order.payment_status,
-                'payment_amount': order.payment_amount,
-                'bill_id': order.bill_id,
-                'billnumberinput2': order.billnumberinput2,
-                'workers': worker_details,  # Include list of assigned workers
-                'Work_pay': order.Work_pay,
-                'customer_mobile': bill.mobile_number if bill else None  # Add customer mobile number
-            })
+        with report_session() as session:
+            grouped_orders = load_orders_by_due_date(session)
 
         # Return the grouped orders as JSON
         return jsonify(grouped_orders), 200
@@ -77,14 +90,23 @@ def search_orders():
         # Fetch all orders with a matching billnumberinput2 from the database
         orders = Order.query.filter(Order.billnumberinput2.ilike(f'%{bill_number_query}%')).all()
 
-        if not orders:
+        # Archived orders (archive.py) are found by the same search
+        archived = []
+        if archive_needed(db.session):
+            matches = db.session.execute(
+                select(orders_archive.c.id, orders_archive.c.bill_id)
+                .where(orders_archive.c.billnumberinput2.ilike(f'%{bill_number_query}%'))
+            ).all()
+            if matches:
+                ids = {match.id for match in matches}
+                archived = [order for order in archived_order_dicts(db.session, {match.bill_id for match in matches})
+                            if order['id'] in ids]
+
+        if not orders and not archived:
             return jsonify({"error": "No orders found for the given bill number"}), 404
 
-        # Prepare the response data for each order
-        orders_data = []
-        for order in orders:
-            # Prepare the worker details
-            worker_details = [
+        def worker_details(workers):
+            return [
                 {
                     'worker_id': worker.id,
                     'name': worker.name,
@@ -94,11 +116,13 @@ def search_orders():
                     'Sadri': worker.Sadri,
                     'Others': worker.Others
                 }
-                for worker in order.workers
+                for worker in workers
             ]
 
-            # Prepare the order details
-            order_data = {
+        # Prepare the response data for each order
+        orders_data = []
+        for order in orders:
+            orders_data.append({
                 'id': order.id,
                 'garment_type': order.garment_type,
                 'status': order.status,
@@ -110,10 +134,15 @@ def search_orders():
                 'payment_amount': order.payment_amount,
                 'bill_id': order.bill_id,
                 'billnumberinput2': order.billnumberinput2,
-                'workers': worker_details,
+                'workers': worker_details(order.workers),
                 'Work_pay': order.Work_pay
-            }
+            })
 
+        workers = {worker.id: worker for worker in Worker.query.filter(
+            Worker.id.in_({worker_id for order in archived for worker_id in order['worker_ids']})).all()} if archived else {}
+        for order in archived:
+            order_data = {key: value for key, value in order.items() if key != 'worker_ids'}
+            order_data['workers'] = worker_details(workers[worker_id] for worker_id in order['worker_ids'] if worker_id in workers)
             orders_data.append(order_data)
 
         return jsonify(orders_data), 200
@@ -132,15 +161,19 @@ def update_advance_amount(order_id):
         if new_amount is None or new_amount < 0:
             return jsonify({'error': 'Invalid advance amount'}), 400
 
-        order = Order.query.get(order_id)
+        order = update_row(db.session, Order, order_id, {'payment_amount': new_amount}, expected_version(data))
         if not order:
             return jsonify({'error': 'Order not found'}), 404
-
-        order.payment_amount = new_amount
+        refresh_customer(db.session, bill_id=order['bill_id'])
         db.session.commit()
 
-        return jsonify({'message': 'Advance amount updated successfully'}), 200
+        return jsonify({'message': 'Advance amount updated successfully', 'version': order['version']}), 200
 
+    except BadVersion as e:
+        return jsonify({'error': str(e)}), 400
+    except VersionConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'version': e.current['version']}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -152,6 +185,8 @@ def update_all_status(bill_id):
 
     if not new_status:
         return jsonify({"error": "No status provided"}), 400
+    if not ORDER_STATUS.is_valid(new_status):
+        return jsonify({"error": f"Invalid status: {new_status}"}), 400
 
     try:
         orders = Order.query.filter_by(bill_id=bill_id).all()
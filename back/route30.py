@@ -0,0 +1,49 @@
+from flask import Flask, request, jsonify, g
+from flask_cors import CORS
+from back.app import app, db
+from back.auth import admin_required
+from back.backups import BackupError, create_backup, list_backups, running
+from datetime import datetime, timedelta
+import json
+import threading
+
+# Database snapshots (back/backups.py)
+@app.route('/api/_backups', methods=['GET'])
+@admin_required
+def get_backups():
+    try:
+        return jsonify(list_backups()), 200
+
+    except BackupError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/_backups', methods=['POST'])
+@admin_required
+def start_backup():
+    try:
+        if running.locked():
+            return jsonify({'error': 'A backup is already running'}), 409
+
+        shop = g.get('shop')
+
+        def run():
+            # Off the request thread, so the caller (and new_bill) never waits on it
+            with app.app_context():
+                g.shop = shop
+                try:
+                    create_backup()
+                except Exception as e:
+                    app.logger.error('Backup failed: %s', e)
+
+        threading.Thread(target=run, name='backup', daemon=True).start()
+        return jsonify({'message': 'Backup started'}), 202
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
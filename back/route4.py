@@ -5,6 +5,10 @@ from back.models import Bill, Order,Worker, Daily_Expenses, Worker_Expense, orde
 from datetime import datetime, timedelta
 import json
 import requests
+from back.enums import ORDER_STATUS
+from back.groupcommit import write
+from back.jobs import enqueue
+from back.versioning import BadVersion, VersionConflict, expected_version, update_row
 from sqlalchemy import func
 
 @app.route('/api/orders/<int:order_id>/status', methods=['PUT'])
@@ -12,16 +16,28 @@ def update_order_status(order_id):
     try:
         data = request.get_json()
         status = data.get('status')
+        if status is None or not ORDER_STATUS.is_valid(status):
+            return jsonify({'error': f'Invalid status: {status}'}), 400
+        status = ORDER_STATUS.normalize(status)
 
-        order = Order.query.get(order_id)
+        version = expected_version(data)
+
+        def apply(session):
+            order = update_row(session, Order, order_id, {'status': status}, version)
+            if order:
+                enqueue('order.status_changed', {'order_id': order_id, 'status': status}, session=session)
+            return order
+
+        order = write(apply)
         if not order:
             return jsonify({'error': 'Order not found'}), 404
 
-        order.status = status
-        db.session.commit()
-
-        return jsonify({'message': 'Order status updated successfully'}), 200
+        return jsonify({'message': 'Order status updated successfully', 'version': order['version']}), 200
 
+    except BadVersion as e:
+        return jsonify({'error': str(e)}), 400
+    except VersionConflict as e:
+        return jsonify({'error': str(e), 'version': e.current['version']}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
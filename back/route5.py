@@ -6,22 +6,38 @@ from datetime import datetime, timedelta
 import json
 import requests
 from sqlalchemy import func
+from back.enums import PAYMENT_STATUS
+from back.groupcommit import write
+from back.customers import refresh_customer
+from back.versioning import BadVersion, VersionConflict, expected_version, update_row
 
 @app.route('/api/orders/<int:order_id>/payment-status', methods=['PUT'])
 def update_payment_status(order_id):
     try:
         data = request.get_json()
         payment_status = data.get('payment_status')
+        if payment_status is None or not PAYMENT_STATUS.is_valid(payment_status):
+            return jsonify({'error': f'Invalid payment status: {payment_status}'}), 400
 
-        order = Order.query.get(order_id)
+        version = expected_version(data)
+
+        def apply(session):
+            order = update_row(session, Order, order_id, {'payment_status': payment_status}, version)
+            if order:
+                # Customer totals commit (or roll back) with the status change
+                refresh_customer(session, bill_id=order['bill_id'])
+            return order
+
+        order = write(apply)
         if not order:
             return jsonify({'error': 'Order not found'}), 404
 
-        order.payment_status = payment_status
-        db.session.commit()
-
-        return jsonify({'message': 'Payment status updated successfully'}), 200
+        return jsonify({'message': 'Payment status updated successfully', 'version': order['version']}), 200
 
+    except BadVersion as e:
+        return jsonify({'error': str(e)}), 400
+    except VersionConflict as e:
+        return jsonify({'error': str(e), 'version': e.current['version']}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
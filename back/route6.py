@@ -6,22 +6,29 @@ from datetime import datetime, timedelta
 import json
 import requests
 from sqlalchemy import func
+from back.enums import PAYMENT_MODE
+from back.groupcommit import write
+from back.versioning import BadVersion, VersionConflict, expected_version, update_row
 
 @app.route('/api/orders/<int:order_id>/payment-mode', methods=['PUT']) 
 def update_payment_mode(order_id):
     try:
         data = request.get_json()  # Corrected typo from 'reques' to 'request'
         payment_mode = data.get('payment_mode')
+        if payment_mode is None or not PAYMENT_MODE.is_valid(payment_mode):
+            return jsonify({'error': f'Invalid payment mode: {payment_mode}'}), 400
 
-        order = Order.query.get(order_id)
+        version = expected_version(data)
+        order = write(lambda session: update_row(session, Order, order_id, {'payment_mode': payment_mode}, version))
         if not order:
             return jsonify({'error': 'Order Not Found'}), 404
 
-        order.payment_mode = payment_mode
-        db.session.commit()
-
-        return jsonify({'message': 'Payment Mode Updated Successfully'}), 200
+        return jsonify({'message': 'Payment Mode Updated Successfully', 'version': order['version']}), 200
 
+    except BadVersion as e:
+        return jsonify({'error': str(e)}), 400
+    except VersionConflict as e:
+        return jsonify({'error': str(e), 'version': e.current['version']}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
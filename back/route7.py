@@ -17,6 +17,7 @@ def add_worker():
             return jsonify({'error': 'Invalid input, expected a list of workers'}), 400
 
         workers_added = []
+        new_workers = []
 
         # Iterate over the list of workers
         for worker_data in data:
@@ -44,8 +45,12 @@ def add_worker():
 
             # Add the new worker to the database
             db.session.add(new_worker)
-            db.session.commit()
+            new_workers.append(new_worker)
 
+        # One commit for the whole list (also makes the insert all-or-nothing)
+        db.session.commit()
+
+        for new_worker in new_workers:
             # Add worker to the result list
             workers_added.append({
                 'id': new_worker.id,
@@ -2,6 +2,7 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from back.app import app, db
 from back.models import Bill, Order,Worker, Daily_Expenses, Worker_Expense, order_worker_association, Measurement
+from back.statements import forget_worker
 from datetime import datetime, timedelta
 import json
 import requests
@@ -16,7 +17,8 @@ def delete_worker(id):
         if not worker:
             return jsonify({'error': 'Worker not found'}), 404
 
-        # Delete the worker from the database
+        # Delete the worker from the database, with their statement rows
+        forget_worker(db.session, worker.id)
         db.session.delete(worker)
         db.session.commit()
 
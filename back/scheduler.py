@@ -0,0 +1,151 @@
+# Automatic worker assignment.
+#
+# plan() takes the pending orders nobody is assigned to (optionally only those
+# due in a window) and, earliest due date first, gives each one to the
+# eligible worker with the least pending work, cheaper rate breaking ties.
+# A worker is eligible for a garment when they have a rate for it (the same
+# rate assign_workers uses for Work_pay). Each garment type keeps a heap of
+# (pending load, rate, worker id); a worker whose load went up since their
+# entry was pushed is skipped and re-pushed lazily, so planning n orders over
+# w workers is O(n log w).
+#
+# apply_plan() writes every assignment, Work_pay and worker ledger row in the
+# caller's transaction. Each order UPDATE is conditional on the version the
+# plan saw, so an order edited or assigned in the meantime aborts the whole
+# run (AssignmentConflict) instead of double-booking it.
+import heapq
+from collections import defaultdict
+
+from sqlalchemy import and_, bindparam, exists, func, insert, select, update
+
+from back.models import Order, Worker, WorkerLedgerEntry, order_worker_association
+from back.statements import apply, week_start, worker_rate
+
+# Orders that still occupy a worker
+OPEN_STATUSES = ('pending', 'in progress')
+
+
+class AssignmentConflict(Exception):
+    pass
+
+
+def pending_load(session):
+    """{worker_id: number of open orders assigned to them}."""
+    links = order_worker_association
+    return dict(session.execute(
+        select(links.c.worker_id, func.count())
+        .join(Order, Order.id == links.c.order_id)
+        .where(Order.status.in_(OPEN_STATUSES))
+        .group_by(links.c.worker_id)
+    ).all())
+
+
+def unassigned_orders(session, start=None, end=None):
+    links = order_worker_association
+    query = select(Order.id, Order.garment_type, Order.due_date, Order.order_date, Order.version)\
+        .where(Order.status == 'pending', ~exists().where(links.c.order_id == Order.id))\
+        .order_by(Order.due_date, Order.id)
+    if start is not None:
+        query = query.where(Order.due_date >= start)
+    if end is not None:
+        query = query.where(Order.due_date <= end)
+    return session.execute(query).all()
+
+
+def plan(session, start=None, end=None, worker_ids=None, max_per_worker=None):
+    """Work out assignments without writing anything.
+
+    Returns (assignments, unassigned, loads): assignments are dicts with
+    order_id, worker_id, garment_type, due_date, order_date, work_pay and
+    version; unassigned are (order_id, reason); loads are the pending loads
+    after the assignments.
+    """
+    query = select(Worker)
+    if worker_ids:
+        query = query.where(Worker.id.in_(worker_ids))
+    workers = {worker.id: worker for worker in session.execute(query).scalars()}
+    loads = {worker_id: 0 for worker_id in workers}
+    loads.update({worker_id: count for worker_id, count in pending_load(session).items() if worker_id in workers})
+
+    heaps = {}
+
+    def heap_for(garment_type):
+        if garment_type not in heaps:
+            entries = []
+            for worker in workers.values():
+                rate = worker_rate(worker, garment_type)
+                if rate > 0:
+                    entries.append((loads[worker.id], rate, worker.id))
+            heapq.heapify(entries)
+            heaps[garment_type] = entries
+        return heaps[garment_type]
+
+    assignments, unassigned = [], []
+    for order in unassigned_orders(session, start, end):
+        heap = heap_for(order.garment_type)
+        chosen = None
+        while heap:
+            load, rate, worker_id = heap[0]
+            if load != loads[worker_id]:
+                # Stale: the worker took an order since this entry was pushed
+                heapq.heapreplace(heap, (loads[worker_id], rate, worker_id))
+                continue
+            if max_per_worker is not None and load >= max_per_worker:
+                # The least loaded eligible worker is full, so everyone is
+                break
+            chosen = (worker_id, rate)
+            break
+
+        if chosen is None:
+            unassigned.append((order.id, 'all eligible workers are full' if heap else
+                               f'no worker has a rate for {order.garment_type}'))
+            continue
+
+        worker_id, rate = chosen
+        loads[worker_id] += 1
+        heapq.heapreplace(heap, (loads[worker_id], rate, worker_id))
+        assignments.append({
+            'order_id': order.id,
+            'worker_id': worker_id,
+            'worker_name': workers[worker_id].name,
+            'garment_type': order.garment_type,
+            'due_date': order.due_date,
+            'order_date': order.order_date,
+            'work_pay': rate,
+            'version': order.version,
+        })
+
+    return assignments, unassigned, loads
+
+
+def apply_plan(session, assignments):
+    """Write a plan in the caller's transaction; the caller commits."""
+    if not assignments:
+        return
+    orders = Order.__table__
+    statement = update(orders)\
+        .where(and_(orders.c.id == bindparam('order_id'), orders.c.version == bindparam('expected_version')))\
+        .values(Work_pay=bindparam('work_pay'), version=orders.c.version + 1)
+    params = [{'order_id': a['order_id'], 'expected_version': a['version'], 'work_pay': a['work_pay']}
+              for a in assignments]
+    if session.get_bind().dialect.supports_sane_multi_rowcount:
+        updated = session.execute(statement, params).rowcount
+    else:
+        updated = sum(session.execute(statement, p).rowcount for p in params)
+    if updated != len(assignments):
+        raise AssignmentConflict('Some orders changed while assigning; run the scheduler again')
+
+    session.execute(insert(order_worker_association),
+                    [{'order_id': a['order_id'], 'worker_id': a['worker_id']} for a in assignments])
+
+    # Worker statements (back/statements.py): one ledger row per order, and
+    # one running-total update per worker and week rather than per order
+    session.add_all(WorkerLedgerEntry(worker_id=a['worker_id'], day=a['order_date'], kind='order',
+                                      ref_id=a['order_id'], amount=a['work_pay'])
+                    for a in assignments if a['order_date'])
+    earned = defaultdict(float)
+    for a in assignments:
+        if a['order_date']:
+            earned[(a['worker_id'], week_start(a['order_date']))] += a['work_pay']
+    for (worker_id, start), amount in sorted(earned.items()):
+        apply(session, worker_id, start, earned=amount)
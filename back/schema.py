@@ -0,0 +1,59 @@
+# Additive schema upgrades for existing databases.
+#
+# db.create_all() creates missing tables but never touches existing ones, so
+# columns added to a model later (e.g. Bill.bill_number) are added here with
+# ALTER TABLE ... ADD COLUMN, and new indexes are created. Only nullable
+# columns or columns with a server_default can be added this way; anything
+# more invasive gets its own command (see migrate-enums in back/enums.py).
+#
+# Also home to insert_ignore(), the portable INSERT ... ON CONFLICT DO NOTHING
+# used wherever a row may already exist (imports, calendar, alerts, sequences,
+# idempotency keys).
+from sqlalchemy import insert, inspect, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.schema import CreateIndex
+
+from back.app import db
+
+
+def add_missing_columns(engine, metadata):
+    """Add model columns missing from existing tables. Returns ['table.column', ...]."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    added = []
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            missing = [column for column in table.columns if column.name not in present]
+            for column in missing:
+                if not column.nullable and column.server_default is None:
+                    raise RuntimeError(f'{table.name}.{column.name} needs a server_default to be added')
+                ddl = f'{preparer.quote(column.name)} {column.type.compile(engine.dialect)}'
+                if column.server_default is not None:
+                    ddl += f' DEFAULT {column.server_default.arg}'
+                if not column.nullable:
+                    ddl += ' NOT NULL'
+                conn.execute(text(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}'))
+                added.append(f'{table.name}.{column.name}')
+
+            # New indexes, including ones on columns that already existed
+            present_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in present_indexes:
+                    conn.execute(CreateIndex(index))
+    return added
+
+
+def insert_ignore(table):
+    # Inserting a row that already exists is a no-op, which keeps resumed and
+    # repeated writes idempotent
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        return postgresql_insert(table).on_conflict_do_nothing()
+    return insert(table)
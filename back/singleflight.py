@@ -0,0 +1,85 @@
+# Request coalescing ("single flight") for expensive read routes.
+#
+# When several identical requests arrive while one is already being computed,
+# the later ones wait for the in-flight computation and reuse its response
+# instead of recomputing the same aggregation.
+import threading
+from functools import wraps
+
+from flask import Response, current_app, g, jsonify, make_response, request
+
+
+class SingleFlightTimeout(Exception):
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        # Guards the in-flight table only; callers wait on their key's event
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if is_leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(timeout):
+            raise SingleFlightTimeout(key)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+flights = SingleFlight()
+
+
+def coalesce(key=None, timeout=None):
+    """Route decorator: identical concurrent requests share one computation.
+
+    By default requests are identical when shop, method, path and query string
+    match; pass `key` (a callable returning a hashable) to customise that.
+    Requests for different shops (tenancy.py) are never merged.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            call_key = (view.__module__, view.__name__, g.get('shop'),
+                        key() if key else (request.method, request.full_path))
+            wait = timeout if timeout is not None else current_app.config.get('SINGLE_FLIGHT_TIMEOUT', 30)
+
+            def compute():
+                # Keep only plain data so every waiter builds its own Response
+                response = make_response(view(*args, **kwargs))
+                return response.status_code, response.get_data(), list(response.headers)
+
+            try:
+                status_code, body, headers = flights.do(call_key, compute, timeout=wait)
+            except SingleFlightTimeout:
+                return jsonify({'error': 'Timed out waiting for an identical request'}), 503
+
+            return Response(body, status=status_code, headers=headers)
+        return wrapper
+    return decorator
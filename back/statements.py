@@ -0,0 +1,262 @@
+# Worker statements from a ledger with weekly prefix sums.
+#
+# Every order share a worker earns and every payment made to them is one row
+# in worker_ledger. worker_weeks keeps, per worker and week (Sunday-Saturday,
+# like the weekly-pay screen), what was earned and paid that week plus the
+# running totals up to and including it. So:
+#
+#   * balance as of D = running totals of the last week before D's week (one
+#     index seek) + the ledger rows of D's own week up to D;
+#   * a statement for [a, b] is an index range scan over worker_weeks, with
+#     each row already carrying its closing balance.
+#
+# assign_workers and add_worker_expense update both tables in their own
+# transaction. Writes dated in the current week touch a single row; a
+# backdated write also shifts the running totals of the later weeks.
+# Bulk loads (import-data, replicate pull) bypass the routes, so run
+#
+#   flask --app back.app rebuild-worker-statements
+#
+# afterwards.
+from datetime import timedelta
+
+import click
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from back.app import app, db
+from back.models import (Order, Worker, Worker_Expense, WorkerLedgerEntry, WorkerWeek, order_worker_association,
+                         order_worker_association_archive, orders_archive)
+
+
+def week_start(day):
+    return day - timedelta(days=(day.weekday() + 1) % 7)
+
+
+def worker_rate(worker, garment_type):
+    # Per-piece rate for this garment (the same rule assign_workers uses)
+    return (worker.Suit if garment_type == 'Suit' else
+            worker.Jacket if garment_type == 'Jacket' else
+            worker.Sadri if garment_type == 'Sadri' else
+            worker.Rate) or 0
+
+
+def order_shares(work_pay, garment_type, workers):
+    """Split an order's Work_pay between its workers in proportion to their rates."""
+    if not workers or not work_pay:
+        return {}
+    rates = {worker.id: worker_rate(worker, garment_type) for worker in workers}
+    total = sum(rates.values())
+    if not total:
+        return {worker_id: work_pay / len(rates) for worker_id in rates}
+    return {worker_id: work_pay * rate / total for worker_id, rate in rates.items()}
+
+
+def apply(session, worker_id, day, earned=0.0, paid=0.0):
+    """Add to one worker's week and shift the running totals of every later week."""
+    start = week_start(day)
+    week = session.get(WorkerWeek, (worker_id, start))
+    if week is None:
+        previous = session.execute(
+            select(WorkerWeek.cum_earned, WorkerWeek.cum_paid)
+            .where(WorkerWeek.worker_id == worker_id, WorkerWeek.week_start < start)
+            .order_by(WorkerWeek.week_start.desc()).limit(1)
+        ).first()
+        week = WorkerWeek(worker_id=worker_id, week_start=start, earned=0.0, paid=0.0,
+                          cum_earned=previous.cum_earned if previous else 0.0,
+                          cum_paid=previous.cum_paid if previous else 0.0)
+        session.add(week)
+    week.earned += earned
+    week.paid += paid
+    week.cum_earned += earned
+    week.cum_paid += paid
+    session.flush()
+
+    session.execute(
+        update(WorkerWeek)
+        .where(WorkerWeek.worker_id == worker_id, WorkerWeek.week_start > start)
+        .values(cum_earned=WorkerWeek.cum_earned + earned, cum_paid=WorkerWeek.cum_paid + paid)
+    )
+
+
+def replace_entries(session, kind, ref_id, entries):
+    """Swap the ledger rows of one order/payment for `entries` [(worker_id, day, amount)]."""
+    old = session.execute(
+        select(WorkerLedgerEntry).where(WorkerLedgerEntry.kind == kind, WorkerLedgerEntry.ref_id == ref_id)
+    ).scalars().all()
+    for entry in old:
+        apply(session, entry.worker_id, entry.day, **{field(kind): -entry.amount})
+        session.delete(entry)
+    for worker_id, day, amount in entries:
+        session.add(WorkerLedgerEntry(worker_id=worker_id, day=day, kind=kind, ref_id=ref_id, amount=amount))
+        apply(session, worker_id, day, **{field(kind): amount})
+
+
+def field(kind):
+    return 'earned' if kind == 'order' else 'paid'
+
+
+def record_order(session, order):
+    """Call after an order's workers or Work_pay change."""
+    shares = order_shares(order.Work_pay, order.garment_type, order.workers) if order.order_date else {}
+    replace_entries(session, 'order', order.id,
+                    [(worker_id, order.order_date, amount) for worker_id, amount in shares.items()])
+
+
+def record_payment(session, expense):
+    """Call after a Worker_Expense is added or changed (it must have an id)."""
+    entries = [(expense.worker_id, expense.date, expense.Amt_Paid or 0)] if expense.worker_id and expense.date else []
+    replace_entries(session, 'payment', expense.id, entries)
+
+
+def forget_worker(session, worker_id):
+    """Drop a worker's ledger and weekly rows (call in the transaction that deletes the worker)."""
+    session.execute(delete(WorkerLedgerEntry).where(WorkerLedgerEntry.worker_id == worker_id))
+    session.execute(delete(WorkerWeek).where(WorkerWeek.worker_id == worker_id))
+
+
+def week_totals(session, worker_id, before):
+    """Running totals of the last week starting before `before`."""
+    row = session.execute(
+        select(WorkerWeek.cum_earned, WorkerWeek.cum_paid)
+        .where(WorkerWeek.worker_id == worker_id, WorkerWeek.week_start < before)
+        .order_by(WorkerWeek.week_start.desc()).limit(1)
+    ).first()
+    return (row.cum_earned, row.cum_paid) if row else (0.0, 0.0)
+
+
+def balance_as_of(session, worker_id, day):
+    start = week_start(day)
+    earned, paid = week_totals(session, worker_id, start)
+    for kind, amount in session.execute(
+        select(WorkerLedgerEntry.kind, func.sum(WorkerLedgerEntry.amount))
+        .where(WorkerLedgerEntry.worker_id == worker_id, WorkerLedgerEntry.day >= start, WorkerLedgerEntry.day <= day)
+        .group_by(WorkerLedgerEntry.kind)
+    ):
+        if kind == 'order':
+            earned += amount
+        else:
+            paid += amount
+    return {
+        'worker_id': worker_id,
+        'as_of': day.isoformat(),
+        'earned': round(earned, 2),
+        'paid': round(paid, 2),
+        'balance': round(earned - paid, 2),
+    }
+
+
+def statement(session, worker_id, start, end, page=1, per_page=20):
+    """Weekly statement rows for the weeks overlapping [start, end], oldest first.
+
+    The range is widened to whole weeks, so opening/closing balances line up
+    with the first and last row.
+    """
+    in_range = (WorkerWeek.worker_id == worker_id,
+                WorkerWeek.week_start >= week_start(start), WorkerWeek.week_start <= end)
+    total = session.execute(select(func.count()).select_from(WorkerWeek).where(*in_range)).scalar()
+    weeks = session.execute(
+        select(WorkerWeek).where(*in_range).order_by(WorkerWeek.week_start)
+        .offset((page - 1) * per_page).limit(per_page)
+    ).scalars().all()
+
+    rows = []
+    for week in weeks:
+        closing = week.cum_earned - week.cum_paid
+        rows.append({
+            'week_start': week.week_start.isoformat(),
+            'week_end': (week.week_start + timedelta(days=6)).isoformat(),
+            'earned': round(week.earned, 2),
+            'paid': round(week.paid, 2),
+            'opening_balance': round(closing - week.earned + week.paid, 2),
+            'closing_balance': round(closing, 2),
+        })
+
+    opening_earned, opening_paid = week_totals(session, worker_id, week_start(start))
+    closing_earned, closing_paid = week_totals(session, worker_id, end + timedelta(days=1))
+    return {
+        'worker_id': worker_id,
+        'from': week_start(start).isoformat(),
+        'to': (week_start(end) + timedelta(days=6)).isoformat(),
+        'opening_balance': round(opening_earned - opening_paid, 2),
+        'closing_balance': round(closing_earned - closing_paid, 2),
+        'page': page,
+        'per_page': per_page,
+        'total_weeks': total,
+        'rows': rows,
+    }
+
+
+def rebuild(session, worker_ids=None):
+    """Recompute the ledger (live and archived orders, payments) from scratch."""
+    workers = session.execute(
+        select(Worker).where(Worker.id.in_(worker_ids)) if worker_ids else select(Worker)
+    ).scalars().all()
+    by_id = {worker.id: worker for worker in workers}
+    ids = list(by_id)
+
+    session.execute(delete(WorkerLedgerEntry).where(WorkerLedgerEntry.worker_id.in_(ids)))
+    session.execute(delete(WorkerWeek).where(WorkerWeek.worker_id.in_(ids)))
+
+    entries = []
+    for orders, links in (
+        (Order.__table__, order_worker_association),
+        (orders_archive, order_worker_association_archive),
+    ):
+        assigned = {}
+        for order_id, worker_id in session.execute(select(links.c.order_id, links.c.worker_id)):
+            assigned.setdefault(order_id, []).append(worker_id)
+        for order in session.execute(select(orders.c.id, orders.c.garment_type, orders.c.order_date,
+                                            orders.c.Work_pay).where(orders.c.id.in_(list(assigned)))):
+            # Shares are split over all of the order's workers, even ones not being rebuilt
+            order_workers = [by_id.get(worker_id) or session.get(Worker, worker_id)
+                             for worker_id in assigned[order.id]]
+            shares = order_shares(order.Work_pay, order.garment_type, [w for w in order_workers if w])
+            if not order.order_date:
+                continue
+            for worker_id, amount in shares.items():
+                if worker_id in by_id:
+                    entries.append(WorkerLedgerEntry(worker_id=worker_id, day=order.order_date, kind='order',
+                                                     ref_id=order.id, amount=amount))
+
+    for expense in session.execute(select(Worker_Expense).where(Worker_Expense.worker_id.in_(ids))).scalars():
+        if expense.date:
+            entries.append(WorkerLedgerEntry(worker_id=expense.worker_id, day=expense.date, kind='payment',
+                                             ref_id=expense.id, amount=expense.Amt_Paid or 0))
+
+    # Weekly rows and running totals in one pass per worker
+    weeks = {}
+    for entry in entries:
+        week = weeks.setdefault((entry.worker_id, week_start(entry.day)), [0.0, 0.0])
+        week[0 if entry.kind == 'order' else 1] += entry.amount
+    running = {}
+    for (worker_id, start), (earned, paid) in sorted(weeks.items()):
+        cum_earned, cum_paid = running.get(worker_id, (0.0, 0.0))
+        running[worker_id] = (cum_earned + earned, cum_paid + paid)
+        session.add(WorkerWeek(worker_id=worker_id, week_start=start, earned=earned, paid=paid,
+                               cum_earned=cum_earned + earned, cum_paid=cum_paid + paid))
+    session.add_all(entries)
+    session.commit()
+    return len(entries)
+
+
+def backfill(session):
+    """First start after upgrading: build the ledger once if it is still empty."""
+    if session.execute(select(WorkerWeek.worker_id).limit(1)).first() is not None:
+        return
+    has_history = session.execute(select(order_worker_association.c.order_id).limit(1)).first() is not None \
+        or session.execute(select(Worker_Expense.id).where(Worker_Expense.worker_id.isnot(None)).limit(1)).first() is not None
+    if has_history:
+        try:
+            rebuild(session)
+        except IntegrityError:
+            # Another process built it at the same time
+            session.rollback()
+
+
+@app.cli.command('rebuild-worker-statements')
+@click.option('--worker', 'worker_ids', type=int, multiple=True, help='Only these workers (repeatable).')
+def rebuild_worker_statements_command(worker_ids):
+    """Recompute worker ledgers and weekly running totals from orders and payments."""
+    count = rebuild(db.session, list(worker_ids) or None)
+    click.echo(f'{count} ledger entries')
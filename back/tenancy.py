@@ -0,0 +1,153 @@
+# One process, several shops.
+#
+# Each shop has its own database: a SQLite file or a Postgres schema, built
+# from SHOP_DATABASE_URI with {shop} filled in. route27.py works out the shop
+# of each request from the X-Shop header or the subdomain under SHOP_DOMAIN
+# and sets g.shop. db (a TenantSQLAlchemy) then hands out that shop's engine
+# wherever the code asks for the default one: db.session, db.engine and
+# session.get_bind() all follow g.shop. Requests without a shop keep using
+# SQLALCHEMY_DATABASE_URI, which is the SHOP_DEFAULT shop.
+#
+# Shop engines are created on first use; at most SHOP_ENGINE_POOL_SIZE stay
+# open, and the least recently used one (or any idle for SHOP_IDLE_SECONDS)
+# is disposed, so an idle branch doesn't hold connections the busy ones need.
+#
+# pysqlite only sends BEGIN before an INSERT/UPDATE/DELETE, so a SAVEPOINT
+# issued first would open a transaction of its own and its RELEASE would
+# commit it (groupcommit.py would pay one fsync per operation). The default
+# and shop engines therefore send BEGIN IMMEDIATE ahead of such a SAVEPOINT.
+# Only there: an explicit BEGIN before every read would hold the read lock,
+# and a SQLite transaction that holds one fails ("database is locked") instead
+# of waiting when it later needs to write while someone else is writing.
+#
+# This module is imported by back/app.py before db exists, so it must not
+# import back.app.
+import contextlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy import SQLAlchemy
+
+SHOP_ID = re.compile(r'^[a-z0-9][a-z0-9-]{0,31}$')
+
+
+def sqlite_savepoints(engine):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @sa.event.listens_for(engine, 'savepoint')
+    def begin_before_savepoint(conn, name):
+        if not conn.connection.dbapi_connection.in_transaction:
+            # IMMEDIATE: take the write lock now, waiting for other writers
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+class UnknownShop(Exception):
+    pass
+
+
+def current_shop():
+    """The shop this request or job runs for, None for the default database."""
+    if not has_app_context():
+        return None
+    shop = g.get('shop')
+    return None if shop == current_app.config['SHOP_DEFAULT'] else shop
+
+
+def configured_shops(config):
+    """Every shop, the default one first."""
+    return [config['SHOP_DEFAULT']] + sorted(shop for shop in config['SHOPS'] if shop != config['SHOP_DEFAULT'])
+
+
+class ShopEngines:
+    """Lazily created shop engines, least recently used evicted first."""
+
+    def __init__(self):
+        # Re-entrant: preparing a new shop's database looks its engine up again
+        self.lock = threading.RLock()
+        self.engines = OrderedDict()  # shop -> [engine, last used]
+        self.prepared = set()
+        self.on_create = None  # fn(shop), sets up a shop's tables the first time
+
+    def engine(self, shop):
+        config = current_app.config
+        with self.lock:
+            entry = self.engines.get(shop)
+            if entry is None:
+                if shop not in config['SHOPS'] or not SHOP_ID.match(shop):
+                    raise UnknownShop(shop)
+                entry = self.engines[shop] = [self.create(config, shop), time.monotonic()]
+                if shop not in self.prepared and self.on_create is not None:
+                    try:
+                        self.on_create(shop)
+                    except Exception:
+                        del self.engines[shop]
+                        entry[0].dispose()
+                        raise
+                self.prepared.add(shop)
+            entry[1] = time.monotonic()
+            self.engines.move_to_end(shop)
+            self.evict(config, keep=shop)
+            return entry[0]
+
+    def create(self, config, shop):
+        url = sa.engine.make_url(config['SHOP_DATABASE_URI'].format(shop=shop))
+        if url.get_backend_name() == 'sqlite' and url.database:
+            os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+        engine = sa.create_engine(url, pool_pre_ping=True)
+        sqlite_savepoints(engine)
+        return engine
+
+    def evict(self, config, keep):
+        idle_before = time.monotonic() - config['SHOP_IDLE_SECONDS']
+        for shop, (engine, last_used) in list(self.engines.items()):
+            if shop == keep:
+                continue
+            if len(self.engines) > config['SHOP_ENGINE_POOL_SIZE'] or last_used < idle_before:
+                # Connections still checked out finish normally and are closed on return
+                del self.engines[shop]
+                engine.dispose()
+
+    def open_shops(self):
+        with self.lock:
+            return list(self.engines)
+
+
+class TenantSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose default engine is the current shop's."""
+
+    def __init__(self, *args, **kwargs):
+        self.shops = ShopEngines()
+        super().__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        super().init_app(app)
+        with app.app_context():
+            for engine in super().engines.values():
+                sqlite_savepoints(engine)
+
+    @property
+    def engines(self):
+        engines = super().engines
+        shop = current_shop()
+        if shop is None:
+            return engines
+        return {**engines, None: self.shops.engine(shop)}
+
+
+@contextlib.contextmanager
+def use_shop(db, shop):
+    """Run a block (a job loop, a CLI command) against one shop's database."""
+    previous = g.get('shop')
+    db.session.remove()
+    g.shop = shop
+    try:
+        yield
+    finally:
+        db.session.remove()
+        g.shop = previous
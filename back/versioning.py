@@ -0,0 +1,74 @@
+# Optimistic concurrency for single-row edits.
+#
+# Order and Bill carry a version column that every write bumps (the ORM does
+# it through version_id_col). The edit routes use update_row() instead of a
+# SELECT followed by an ORM flush: one conditional
+#
+#   UPDATE orders SET ..., version = version + 1 WHERE id = ? [AND version = ?]
+#   RETURNING *
+#
+# statement changes the row and returns its new state in a single round trip.
+# Clients that send the version they last saw (body "version" or an If-Match
+# header) get 409 instead of silently overwriting a newer edit; clients that
+# don't (or send If-Match: *) keep the old last-write-wins behaviour; a
+# version that isn't a whole number is 400.
+from flask import request
+from sqlalchemy import select, update
+
+
+class VersionConflict(Exception):
+    def __init__(self, current):
+        super().__init__(f"Modified by someone else (now at version {current['version']})")
+        self.current = current
+
+
+class BadVersion(ValueError):
+    def __init__(self, value):
+        super().__init__(f"Invalid version {value!r}: expected a whole number (or If-Match: *)")
+
+
+def expected_version(data=None):
+    """The version the client is editing, from the JSON body or If-Match.
+
+    None means no check. Raises BadVersion if the value isn't a version number.
+    """
+    value = (data or {}).get('version')
+    if value is None:
+        value = request.headers.get('If-Match', '').strip() or None
+        if value == '*':
+            return None
+        if value is not None:
+            value = value.removeprefix('W/').strip('"')
+    if isinstance(value, bool):
+        raise BadVersion(value)
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    raise BadVersion(value)
+
+
+def update_row(session, model, row_id, values, version=None):
+    """Apply `values` to one row. Returns the updated row mapping, or None if the row does not exist.
+
+    Raises VersionConflict if `version` is given and no longer current.
+    """
+    table = model.__table__
+    statement = update(table).where(table.c.id == row_id) \
+        .values(**values, version=table.c.version + 1)
+    if version is not None:
+        statement = statement.where(table.c.version == version)
+
+    if session.get_bind().dialect.update_returning:
+        row = session.execute(statement.returning(*table.c)).mappings().first()
+    else:
+        updated = session.execute(statement).rowcount
+        row = session.execute(select(table).where(table.c.id == row_id)).mappings().first() if updated else None
+    if row is not None:
+        return dict(row)
+
+    # Nothing matched: tell a missing row apart from a stale version
+    current = session.execute(select(table).where(table.c.id == row_id)).mappings().first()
+    if current is None:
+        return None
+    raise VersionConflict(dict(current))
@@ -0,0 +1,31 @@
+-- Migration: Normalize status / payment / garment spellings in Supabase
+-- Date: 2026-10-19
+-- Purpose: The Flask backend now stores these fields as integer-coded enums
+-- (see back/enums.py, `flask --app back.app migrate-enums`). Supabase keeps
+-- them as text for the mobile app, but variants such as 'Pending' vs 'pending'
+-- are folded onto the same canonical labels so both stores agree.
+
+-- Step 1: Order and payment statuses are lowercase
+UPDATE public.orders SET status = lower(trim(status)) WHERE status <> lower(trim(status));
+UPDATE public.orders SET payment_status = lower(trim(payment_status)) WHERE payment_status <> lower(trim(payment_status));
+UPDATE public.bills SET payment_status = lower(trim(payment_status)) WHERE payment_status <> lower(trim(payment_status));
+
+UPDATE public.orders SET status = 'cancelled' WHERE status = 'canceled';
+UPDATE public.orders SET status = 'completed' WHERE status = 'complete';
+UPDATE public.orders SET status = 'in progress' WHERE status IN ('in_progress', 'in-progress', 'inprogress');
+
+-- Step 2: Payment modes use their display spelling
+UPDATE public.orders SET payment_mode = 'Cash' WHERE lower(trim(payment_mode)) = 'cash' AND payment_mode <> 'Cash';
+UPDATE public.orders SET payment_mode = 'UPI' WHERE lower(trim(payment_mode)) IN ('upi', 'online') AND payment_mode <> 'UPI';
+UPDATE public.bills SET payment_mode = 'Cash' WHERE lower(trim(payment_mode)) = 'cash' AND payment_mode <> 'Cash';
+UPDATE public.bills SET payment_mode = 'UPI' WHERE lower(trim(payment_mode)) IN ('upi', 'online') AND payment_mode <> 'UPI';
+
+-- Step 3: Single garments use their display spelling
+-- (combined values such as 'Pant, Shirt' are handled by fix-comma-garments.sql)
+UPDATE public.orders SET garment_type = initcap(trim(garment_type))
+WHERE lower(trim(garment_type)) IN ('suit', 'safari', 'pant', 'shirt', 'sadri', 'jacket', 'others')
+  AND garment_type <> initcap(trim(garment_type));
+
+-- Verification query (every row should map onto a canonical value)
+-- SELECT status, payment_status, payment_mode, count(*)
+-- FROM public.orders GROUP BY 1, 2, 3 ORDER BY 4 DESC;
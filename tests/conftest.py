@@ -0,0 +1,45 @@
+# The backend configures itself from the environment when back.app is first
+# imported, so point every path it writes to at a throwaway directory before
+# any test imports it. All tests share that one app and database.
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp(prefix='tms-tests-')
+atexit.register(shutil.rmtree, TMP_DIR, ignore_errors=True)
+
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + os.path.join(TMP_DIR, 'tms.db'),
+    'SHOP_DATABASE_URL': 'sqlite:///' + os.path.join(TMP_DIR, 'shops', '{shop}.db'),
+    'RENDER_CACHE_DIR': os.path.join(TMP_DIR, 'render-cache'),
+    'ASSET_DIR': os.path.join(TMP_DIR, 'assets'),
+    'BACKUP_DIR': os.path.join(TMP_DIR, 'backups'),
+    'PROFILE_DIR': os.path.join(TMP_DIR, 'profiles'),
+    'SLOW_QUERY_LOG': os.path.join(TMP_DIR, 'slow-queries.log'),
+    'JOBS_IN_PROCESS': '0',
+})
+
+
+@pytest.fixture(scope='session')
+def app():
+    from back.app import app
+    return app
+
+
+@pytest.fixture
+def db(app):
+    from back.app import db
+    with app.app_context():
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,63 @@
+import threading
+
+THREADS = 8
+DRAWS = 60
+BLOCK_SIZE = 7
+
+
+def test_concurrent_allocation_has_no_duplicates_or_gaps(app, db):
+    from back.billnumbers import BlockAllocator, claim_block, lease_block
+    from back.models import BillNumberLease
+
+    # One allocator shared by every thread (like the per-process one request
+    # threads use) and one per thread (like separate processes)
+    shared = BlockAllocator(BLOCK_SIZE)
+    allocators = [BlockAllocator(BLOCK_SIZE) for _ in range(THREADS)]
+    drawn = [[] for _ in range(THREADS)]
+    leases = [[] for _ in range(THREADS)]
+    errors = []
+    start_line = threading.Barrier(THREADS)
+
+    def work(index):
+        try:
+            with app.app_context():
+                start_line.wait()
+                for i in range(DRAWS):
+                    drawn[index].append(shared.allocate())
+                    drawn[index].append(allocators[index].allocate())
+                    if i % 10 == 0:
+                        # Numbers taken straight from the sequence, as a batch import would
+                        first, last = claim_block(3)
+                        drawn[index].extend(range(first, last + 1))
+                    if i % 15 == 0:
+                        # A device leasing a block for offline billing
+                        first, last = lease_block(f'tablet-{index}', 4)
+                        leases[index].append((first, last))
+                        drawn[index].extend(range(first, last + 1))
+                db.session.remove()
+        except Exception as e:
+            errors.append(e)
+
+    # claim_block(0) reads where the sequence stands without taking anything
+    start, _ = claim_block(0)
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(THREADS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    end, _ = claim_block(0)
+
+    assert errors == []
+    numbers = [n for chunk in drawn for n in chunk]
+    assert len(numbers) == len(set(numbers)), 'a number was handed out twice'
+
+    # Every number the sequence gave out reached someone, apart from the unused
+    # tail of each allocator's current block
+    unused = {n for local in allocators + [shared] for n in range(local.next, local.last + 1)}
+    assert set(numbers).isdisjoint(unused)
+    assert set(numbers) | unused == set(range(start, end))
+
+    recorded = {(lease.device_id, lease.first_number, lease.last_number)
+                for lease in BillNumberLease.query.filter(BillNumberLease.first_number >= start)}
+    assert recorded == {(f'tablet-{index}', first, last)
+                        for index, blocks in enumerate(leases) for first, last in blocks}
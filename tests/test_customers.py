@@ -0,0 +1,34 @@
+from datetime import date
+
+
+def add_bill(db, mobile_number, payment_statuses, total_amt=1000.0, advance=300.0):
+    """A bill with one order per payment status; every order carries the bill's total and advance."""
+    from back.models import Bill, Order
+    bill = Bill(customer_name='Test', mobile_number=mobile_number, date_issue=date(2025, 9, 1),
+                delivery_date=date(2025, 9, 20), today_date=date(2025, 9, 1), due_date=date(2025, 9, 20),
+                total_qty=len(payment_statuses), total_amt=total_amt, payment_amount=advance,
+                payment_mode='Cash', payment_status='pending')
+    db.session.add(bill)
+    db.session.flush()
+    for payment_status in payment_statuses:
+        db.session.add(Order(garment_type='Pant', status='pending', order_date=date(2025, 9, 1),
+                             due_date=date(2025, 9, 20), total_amt=total_amt, payment_mode='Cash',
+                             payment_status=payment_status, payment_amount=advance, bill_id=bill.id))
+    db.session.flush()
+    return bill
+
+
+def test_bill_is_paid_only_once_every_order_is(db):
+    from back.customers import compute
+    add_bill(db, '9700000001', ['paid', 'pending', 'pending'])
+    try:
+        figures = compute(db.session, '9700000001')
+        # One order of three paid: still only the advance has come in
+        assert (figures['total_spent'], figures['total_paid'], figures['outstanding']) == (1000.0, 300.0, 700.0)
+
+        add_bill(db, '9700000001', ['paid', 'cancelled', 'paid'], total_amt=500.0, advance=100.0)
+        figures = compute(db.session, '9700000001')
+        # The second bill's live orders are all paid, so it is settled in full
+        assert (figures['total_spent'], figures['total_paid'], figures['outstanding']) == (1500.0, 800.0, 700.0)
+    finally:
+        db.session.rollback()
@@ -0,0 +1,63 @@
+import threading
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+BATCH = 5
+
+
+@pytest.fixture
+def traced_sql(db):
+    """Statements SQLite itself runs for the group-commit thread."""
+    statements = []
+
+    def trace(dbapi_connection, connection_record, connection_proxy):
+        dbapi_connection.set_trace_callback(
+            lambda sql: statements.append(sql) if threading.current_thread().name == 'group-commit' else None)
+
+    event.listen(db.engine, 'checkout', trace)
+    yield statements
+    event.remove(db.engine, 'checkout', trace)
+
+
+def test_one_commit_per_batch(db, traced_sql):
+    from back.groupcommit import GroupCommitter
+    from back.models import Daily_Expenses
+
+    # Generous window: the batch closes as soon as all BATCH operations are in
+    committer = GroupCommitter(window=5, max_batch=BATCH)
+    results, errors = {}, {}
+
+    def tap(index):
+        def operation(session):
+            expense = Daily_Expenses(Date=date(2031, 1, 1), material_cost=index, miscellaneous_Cost=0,
+                                     chai_pani_cost=0, Total_Pay=index)
+            session.add(expense)
+            session.flush()
+            if index == 2:
+                raise ValueError('rejected')
+            return expense.id
+        try:
+            results[index] = committer.submit(operation)
+        except ValueError as e:
+            errors[index] = e
+
+    taps = [threading.Thread(target=tap, args=(i,)) for i in range(BATCH)]
+    for thread in taps:
+        thread.start()
+    for thread in taps:
+        thread.join()
+
+    # The failing operation is rolled back to its savepoint; the others all landed
+    assert set(errors) == {2} and set(results) == {0, 1, 3, 4}
+    stored = Daily_Expenses.query.filter(Daily_Expenses.Date == date(2031, 1, 1)).all()
+    assert sorted(expense.material_cost for expense in stored) == [0, 1, 3, 4]
+
+    # One transaction around every SAVEPOINT, committed once
+    keywords = [sql.split()[0].upper() for sql in traced_sql]
+    assert keywords.count('BEGIN') == 1 and keywords.count('COMMIT') == 1
+    assert keywords.count('SAVEPOINT') == BATCH
+    assert keywords.count('RELEASE') == BATCH - 1 and keywords.count('ROLLBACK') == 1
+    assert keywords.index('BEGIN') < keywords.index('SAVEPOINT')
+    assert keywords[-1] == 'COMMIT'
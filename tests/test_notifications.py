@@ -0,0 +1,111 @@
+import json
+import threading
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class StubWhatsApp(BaseHTTPRequestHandler):
+    # Keep-alive, like the Cloud API, so a batch can reuse one connection
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.received.append((self.client_address, self.headers['Authorization'], body))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        reply = json.dumps({'messages': [{'id': 'wamid.stub'}]} if status == 200 else {'error': 'unavailable'})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply.encode('utf-8'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def whatsapp(app, db, monkeypatch):
+    from back.models import Job
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubWhatsApp)
+    server.received = []
+    server.statuses = []  # replies to give before answering 200
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setitem(app.config, 'WHATSAPP_API_URL', f'http://127.0.0.1:{server.server_port}/messages')
+    monkeypatch.setitem(app.config, 'WHATSAPP_TOKEN', 'stub-token')
+    monkeypatch.setitem(app.config, 'WHATSAPP_NOTIFY_NEW_BILL', True)
+    Job.query.delete()
+    db.session.commit()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def add_bill(db, mobile_number):
+    from back.models import Bill
+    bill = Bill(customer_name='Test', mobile_number=mobile_number, date_issue=date(2025, 9, 1),
+                delivery_date=date(2025, 9, 20), today_date=date(2025, 9, 1), due_date=date(2025, 9, 20),
+                total_qty=1, total_amt=700.0, payment_mode='Cash', payment_status='pending')
+    db.session.add(bill)
+    db.session.flush()
+    return bill
+
+
+def send_jobs():
+    from back.models import Job
+    return Job.query.filter_by(kind='whatsapp.send').order_by(Job.id).all()
+
+
+def test_new_bill_messages_are_sent_in_one_batch(db, whatsapp):
+    from back.jobs import enqueue, run_pending
+    numbers = ['9800000001', '9800000002', '9800000003']
+    for number in numbers:
+        enqueue('bill.created', {'bill_id': add_bill(db, number).id})
+    db.session.commit()
+
+    # 3 bill.created jobs, then their 3 sends as a single whatsapp.send batch
+    assert run_pending() == 6
+    assert [job.status for job in send_jobs()] == ['done'] * 3
+    assert sorted(body['to'] for _, _, body in whatsapp.received) == ['+91' + number for number in numbers]
+    assert {authorization for _, authorization, _ in whatsapp.received} == {'Bearer stub-token'}
+    # One keep-alive connection for the whole batch
+    assert len({address for address, _, _ in whatsapp.received}) == 1
+
+
+def test_server_errors_are_retried_with_backoff(app, db, whatsapp):
+    from back.jobs import enqueue, run_pending
+    base = app.config['JOB_RETRY_BASE_SECONDS']
+    enqueue('whatsapp.send', {'to': '9800000009', 'message': 'Your order is ready'})
+    db.session.commit()
+
+    def attempt():
+        started = datetime.utcnow()
+        run_pending()
+        finished = datetime.utcnow()
+        job = send_jobs()[0]
+        db.session.refresh(job)
+        return job, (job.run_at - started).total_seconds(), (job.run_at - finished).total_seconds()
+
+    whatsapp.statuses = [503]
+    job, latest, earliest = attempt()
+    assert (job.status, job.attempts) == ('queued', 1)
+    assert '503' in job.last_error
+    assert earliest >= base * 0.8 and latest <= base * 1.2
+    # Not due yet: nothing is sent until the backoff has passed
+    assert run_pending() == 0
+    assert len(whatsapp.received) == 1
+
+    whatsapp.statuses = [502]
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+    job, latest, earliest = attempt()
+    assert (job.status, job.attempts) == ('queued', 2)
+    assert earliest >= base * 2 * 0.8 and latest <= base * 2 * 1.2
+
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+    job, _, _ = attempt()
+    assert (job.status, job.attempts, job.last_error) == ('done', 3, None)
+    assert len(whatsapp.received) == 3